@@ -7,9 +7,51 @@ _env_factory = EnvVarFactory("EVM_CONTRACT_EXPORTER")
 DB_PROVIDER = _env_factory.create_env("DB_PROVIDER", str, default="sqlite", verbose=False)
 # if you use sqlite as the provider, you can set this:
 SQLITE_PATH = _env_factory.create_env("SQLITE_PATH", str, default=f"{path.expanduser( '~' )}/.evm_contract_exporter", verbose=False)
+# and opt in to WAL mode, tuned pragmas and a single dedicated writer connection with this:
+SQLITE_TUNING = _env_factory.create_env("SQLITE_TUNING", bool, default=False, verbose=False)
 # otherwise, you'll set these:
 DB_HOST = _env_factory.create_env("DB_HOST", str, default='', verbose=False)
 DB_PORT = _env_factory.create_env("DB_PORT", str, default='', verbose=False)
 DB_DATABASE = _env_factory.create_env("DB_DATABASE", str, default='', verbose=False)
 DB_USER = _env_factory.create_env("DB_USER", str, default='', verbose=False)
 DB_PASSWORD = _env_factory.create_env("DB_PASSWORD", str, default='', verbose=False)
+
+# the bulk insert daemon flushes a batch once it holds this many rows...
+BULK_INSERT_MAX_ROWS = _env_factory.create_env("BULK_INSERT_MAX_ROWS", int, default=5_000, verbose=False)
+# ...or once its oldest row has waited this many seconds, whichever comes first
+BULK_INSERT_MAX_LATENCY = _env_factory.create_env("BULK_INSERT_MAX_LATENCY", float, default=5.0, verbose=False)
+# set this to 2 to store data in the compact v2 schema, see `evm_contract_exporter.db.migrate` to move existing data over
+DB_SCHEMA_VERSION = _env_factory.create_env("DB_SCHEMA_VERSION", int, default=1, verbose=False)
+# set this to store the unscaled integer output of contract calls, with the scale stored once per metric, instead of scaled decimals
+DB_RAW_VALUES = _env_factory.create_env("DB_RAW_VALUES", bool, default=False, verbose=False)
+# set this to only store a value when it differs from the previous one, for metrics that rarely change. readers expand the changes back into a step function. ignored if DB_RAW_VALUES is set
+DB_CHANGES_ONLY = _env_factory.create_env("DB_CHANGES_ONLY", bool, default=False, verbose=False)
+# how bulk inserts are written: "insert" for multi-row inserts, or "copy" to stream batches with a binary COPY (postgres only)
+DB_INGEST_METHOD = _env_factory.create_env("DB_INGEST_METHOD", str, default="insert", verbose=False)
+# set this to keep hourly and daily last/min/max/avg rollups of the stored data up to date in `ContractDataRollup`
+DB_ROLLUPS = _env_factory.create_env("DB_ROLLUPS", bool, default=False, verbose=False)
+# if set along with `DB_ROLLUPS`, rows older than this many days are deleted once they're rolled up
+DB_RETENTION_DAYS = _env_factory.create_env("DB_RETENTION_DAYS", int, default=0, verbose=False)
+# set this to write datapoints to a local spool before they go to the db, so they're replayed after a crash instead of lost
+DB_SPOOL = _env_factory.create_env("DB_SPOOL", bool, default=False, verbose=False)
+# the spool files are kept under this directory
+SPOOL_PATH = _env_factory.create_env("SPOOL_PATH", str, default=f"{path.expanduser( '~' )}/.evm_contract_exporter/spool", verbose=False)
+# the order exporters backfill history in: "newest_first", "oldest_first" or "progressive", which fills every 64th interval first, then every 32nd, and so on
+BACKFILL_SCHEDULE = _env_factory.create_env("BACKFILL_SCHEDULE", str, default="newest_first", verbose=False)
+# the (block, timestamp) samples we use to find the block at a timestamp are kept under this directory
+BLOCKTIME_PATH = _env_factory.create_env("BLOCKTIME_PATH", str, default=f"{path.expanduser( '~' )}/.evm_contract_exporter/blocktime", verbose=False)
+# the contract deploy blocks we've found are kept under this directory
+DEPLOY_BLOCKS_PATH = _env_factory.create_env("DEPLOY_BLOCKS_PATH", str, default=f"{path.expanduser( '~' )}/.evm_contract_exporter/deploy_blocks", verbose=False)
+# if True, exporters make every contract call they need for a timestamp in Multicall3 `aggregate3` batches instead of one by one
+MULTICALL_BATCHING = _env_factory.create_env("MULTICALL_BATCHING", bool, default=False, verbose=False)
+# the most calls we put in one `aggregate3` batch
+MULTICALL_BATCH_SIZE = _env_factory.create_env("MULTICALL_BATCH_SIZE", int, default=500, verbose=False)
+# if True, exporters compute their math metrics from the stored series of the inputs wherever they can, and only make rpc calls for the rest. Needs pandas.
+DERIVE_FROM_DATASTORE = _env_factory.create_env("DERIVE_FROM_DATASTORE", bool, default=False, verbose=False)
+# if True, exporters first find the block where each contract call stops reverting and start its series there, instead of storing a revert for every interval before it
+METHOD_AVAILABILITY = _env_factory.create_env("METHOD_AVAILABILITY", bool, default=False, verbose=False)
+# the blocks where contract calls stop reverting are kept under this directory
+METHOD_AVAILABILITY_PATH = _env_factory.create_env("METHOD_AVAILABILITY_PATH", str, default=f"{path.expanduser( '~' )}/.evm_contract_exporter/method_availability", verbose=False)
+
+# `ParquetTimeSeriesDataStore` writes its files under this directory
+PARQUET_PATH = _env_factory.create_env("PARQUET_PATH", str, default=f"{path.expanduser( '~' )}/.evm_contract_exporter/parquet", verbose=False)
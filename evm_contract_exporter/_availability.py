@@ -0,0 +1,122 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Awaitable, Callable, DefaultDict, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Call = Tuple[str, bytes]
+"""The address a call is made to and its calldata"""
+
+_CHECKS = 4
+"""How many blocks before each boundary we check the call still reverts at"""
+
+
+class AvailabilityResolver:
+    """
+    Finds the first block at which each of many contract calls stops reverting, and persists them to `path`.
+
+    Methods on upgradeable contracts often revert for most of the contract's history, until an upgrade adds them.
+    We assume a call keeps working once it starts to, so we can bisect between the block a contract was deployed at and the head.
+    Calls whose range is the same are checked at its midpoint together with `is_available`, and each round of probes runs concurrently.
+    A call that reverts at the head has no boundary yet. We don't persist that, it may start working later.
+
+    The assumption is spot checked at `_CHECKS` blocks spread over the history before each boundary. If the call works at any of them,
+    it doesn't hold for that call and its boundary is its deploy block, so none of its history is skipped.
+    """
+    def __init__(
+        self,
+        is_available: Callable[[Sequence[Call], int], Awaitable[List[bool]]],
+        get_height: Callable[[], Awaitable[int]],
+        path: Optional[Path] = None,
+    ) -> None:
+        self._is_available = is_available
+        self._get_height = get_height
+        self._path = path
+        self._known: Dict[Call, int] = {}
+        if path is not None and path.exists():
+            self._known = {_decode_key(key): block for key, block in json.loads(path.read_text()).items()}
+            logger.debug("loaded %s method availability boundaries from %s", len(self._known), path)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} known={len(self._known)}>"
+
+    def get(self, call: Call) -> Optional[int]:
+        """Returns the first block at which `call` doesn't revert if we've already found it"""
+        return self._known.get(call)
+
+    async def resolve(self, calls: Dict[Call, int]) -> Dict[Call, Optional[int]]:
+        """
+        Returns {call: first block at which it doesn't revert} for `calls`, which maps each call to the block its contract was deployed at.
+        The block is None for a call that reverts at the head.
+        """
+        pending = [call for call in calls if call not in self._known]
+        if pending:
+            height = await self._get_height()
+            at_head = await self._is_available(pending, height)
+            pending = [call for call, available in zip(pending, at_head) if available]
+            groups: DefaultDict[int, List[Call]] = defaultdict(list)
+            for call in pending:
+                groups[calls[call]].append(call)
+            results = await asyncio.gather(*[self._is_available(group, block) for block, group in groups.items()])
+            # NOTE: `lo` is the last block where we know the call reverts
+            ranges: Dict[Call, Tuple[int, int]] = {}
+            for (block, group), available in zip(groups.items(), results):
+                for call, available_at_deploy in zip(group, available):
+                    if available_at_deploy:
+                        self._known[call] = block
+                    else:
+                        ranges[call] = (block, height)
+            rounds = 1
+            while ranges:
+                by_range: DefaultDict[Tuple[int, int], List[Call]] = defaultdict(list)
+                for call, (lo, hi) in ranges.items():
+                    if hi - lo == 1:
+                        self._known[call] = hi
+                    else:
+                        by_range[lo, hi].append(call)
+                ranges = {}
+                results = await asyncio.gather(*[self._is_available(group, (lo + hi) // 2) for (lo, hi), group in by_range.items()])
+                for ((lo, hi), group), available in zip(by_range.items(), results):
+                    mid = (lo + hi) // 2
+                    for call, available_at_mid in zip(group, available):
+                        ranges[call] = (lo, mid) if available_at_mid else (mid, hi)
+                rounds += 1
+            await self._check(calls, pending)
+            logger.info("found where %s of %s calls stop reverting in %s rounds", len(pending), len(calls), rounds)
+            self.save()
+        return {call: self._known.get(call) for call in calls}
+
+    async def _check(self, calls: Dict[Call, int], resolved: List[Call]) -> None:
+        """Checks that each of the `resolved` calls reverts at `_CHECKS` blocks before its boundary, if not we skip none of its history"""
+        checks: DefaultDict[int, List[Call]] = defaultdict(list)
+        for call in resolved:
+            deploy_block, boundary = calls[call], self._known[call]
+            for block in {deploy_block + (boundary - deploy_block) * i // (_CHECKS + 1) for i in range(1, _CHECKS + 1)} - {deploy_block}:
+                checks[block].append(call)
+        results = await asyncio.gather(*[self._is_available(group, block) for block, group in checks.items()])
+        for (block, group), available in zip(checks.items(), results):
+            for call, available_at_block in zip(group, available):
+                if available_at_block and self._known[call] != calls[call]:
+                    logger.warning("%s doesn't revert at block %s before the block %s where it was found to start working, exporting its full history", call, block, self._known[call])
+                    self._known[call] = calls[call]
+
+    def save(self) -> None:
+        if self._path is None:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({_encode_key(call): block for call, block in self._known.items()}))
+        os.replace(tmp, self._path)
+
+
+def _encode_key(call: Call) -> str:
+    address, calldata = call
+    return f"{address}:{calldata.hex()}"
+
+def _decode_key(key: str) -> Call:
+    address, _, calldata = key.partition(":")
+    return address, bytes.fromhex(calldata)
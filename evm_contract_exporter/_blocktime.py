@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from evm_contract_exporter._index import Timestamp, epoch
+
+logger = logging.getLogger(__name__)
+
+_INTERPOLATION_ROUNDS = 4
+"""How many rounds of pure interpolation we try for a timestamp before we start mixing in bisection"""
+_UNSAFE_BLOCKS = 128
+"""Samples this close to the head could still be reorged so we don't persist them"""
+
+
+class BlockTimeIndex:
+    """
+    A sorted set of (block, timestamp) samples for one chain, used to find the last block at or before a timestamp.
+
+    A timestamp is resolved once the samples hold two consecutive blocks on either side of it. Until then, we guess the block by interpolating
+    between the nearest samples and fetch the header for each guess, one round of guesses at a time for every pending timestamp together.
+    On a chain with a steady block time the guesses land within a block or two, so a timestamp costs a few header lookups instead of a full bisection.
+    Every header we fetch becomes a sample that narrows the search for the timestamps around it, and the samples are persisted to `path`
+    so they're reused across restarts.
+    """
+    def __init__(
+        self,
+        get_timestamp: Callable[[int], Awaitable[int]],
+        get_height: Callable[[], Awaitable[int]],
+        path: Optional[Path] = None,
+    ) -> None:
+        self._get_timestamp = get_timestamp
+        self._get_height = get_height
+        self._path = path
+        self._blocks = array("q")
+        self._timestamps = array("q")
+        self._height = 0
+        self._unsaved = 0
+        self._lock = asyncio.Lock()
+        if path is not None and path.exists():
+            self._load(path)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} samples={len(self)}>"
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    @property
+    def unsaved(self) -> int:
+        """The number of samples added since the index was last saved"""
+        return self._unsaved
+
+    def cached(self, timestamp: Timestamp) -> Optional[int]:
+        """Returns the block at `timestamp` if the samples already resolve it, without any lookups"""
+        return self._resolved(epoch(timestamp))
+
+    async def block_at(self, timestamp: Timestamp) -> Optional[int]:
+        """Returns the last block at or before `timestamp`, or None if it's before genesis or after the chain head"""
+        return (await self.blocks_at([timestamp]))[0]
+
+    async def blocks_at(self, timestamps: Iterable[Timestamp]) -> List[Optional[int]]:
+        """Resolves all of `timestamps` together, fetching the headers for each round of guesses in one batch"""
+        seconds = [epoch(ts) for ts in timestamps]
+        if not seconds:
+            return []
+        await self._ensure_bounds(max(seconds))
+        pending: Set[int] = set(seconds)
+        rounds: Dict[int, int] = {}
+        while pending:
+            guesses: Set[int] = set()
+            for s in list(pending):
+                bracket = self._bracket(s)
+                if bracket is None or bracket[1] == bracket[0] + 1:
+                    pending.discard(s)
+                    continue
+                lo, hi = bracket
+                rounds[s] = rounds.get(s, 0) + 1
+                if rounds[s] > _INTERPOLATION_ROUNDS and rounds[s] % 2:
+                    # NOTE: interpolation can crawl when block times are uneven, from here on every other guess bisects so we're never worse than a bisection
+                    guess = (lo + hi) // 2
+                else:
+                    lo_ts, hi_ts = self._timestamp_of(lo), self._timestamp_of(hi)
+                    guess = lo + (s - lo_ts) * (hi - lo) // max(hi_ts - lo_ts, 1)
+                guesses.add(min(max(guess, lo + 1), hi - 1))
+            if guesses:
+                await self._fetch(guesses)
+        return [self._resolved(s) for s in seconds]
+
+    def save(self) -> None:
+        """Writes the samples that are deep enough to be final to `path`"""
+        if self._path is None or not self._unsaved:
+            return
+        safe = bisect_right(self._blocks, self._height - _UNSAFE_BLOCKS)
+        samples = array("q")
+        for block, timestamp in zip(self._blocks[:safe], self._timestamps[:safe]):
+            samples.append(block)
+            samples.append(timestamp)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            samples.tofile(f)
+        os.replace(tmp, self._path)
+        self._unsaved = 0
+        logger.debug("saved %s block time samples to %s", safe, self._path)
+
+    def add(self, block: int, timestamp: int) -> None:
+        i = bisect_left(self._blocks, block)
+        if i < len(self._blocks) and self._blocks[i] == block:
+            return
+        self._blocks.insert(i, block)
+        self._timestamps.insert(i, timestamp)
+        self._unsaved += 1
+
+    async def _ensure_bounds(self, seconds: int) -> None:
+        """Makes sure we have a sample for genesis and, if `seconds` is past our newest sample, for the current head"""
+        async with self._lock:
+            if not self._blocks or self._blocks[0] != 0:
+                self.add(0, await self._get_timestamp(0))
+            if seconds >= self._timestamps[-1]:
+                self._height = await self._get_height()
+                await self._fetch([self._height])
+
+    async def _fetch(self, blocks: Iterable[int]) -> None:
+        blocks = [block for block in blocks if self._timestamp_of(block) is None]
+        for block, timestamp in zip(blocks, await asyncio.gather(*map(self._get_timestamp, blocks))):
+            self.add(block, timestamp)
+            self._height = max(self._height, block)
+
+    def _bracket(self, seconds: int) -> Optional[Tuple[int, int]]:
+        """Returns the blocks of the samples on either side of `seconds`, or None if it's outside of the samples"""
+        i = bisect_right(self._timestamps, seconds)
+        if i == 0 or i == len(self._timestamps):
+            return None
+        return self._blocks[i - 1], self._blocks[i]
+
+    def _resolved(self, seconds: int) -> Optional[int]:
+        bracket = self._bracket(seconds)
+        if bracket is None or bracket[1] != bracket[0] + 1:
+            return None
+        return bracket[0]
+
+    def _timestamp_of(self, block: int) -> Optional[int]:
+        i = bisect_left(self._blocks, block)
+        if i < len(self._blocks) and self._blocks[i] == block:
+            return self._timestamps[i]
+        return None
+
+    def _load(self, path: Path) -> None:
+        samples = array("q")
+        with open(path, "rb") as f:
+            samples.frombytes(f.read())
+        self._blocks = samples[0::2]
+        self._timestamps = samples[1::2]
+        self._height = self._blocks[-1] if self._blocks else 0
+        logger.debug("loaded %s block time samples from %s", len(self), path)
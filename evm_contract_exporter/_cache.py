@@ -0,0 +1,86 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+_V = TypeVar("_V")
+
+
+def _retrieve(future: "asyncio.Future[Any]") -> None:
+    # NOTE: an exception might be cached and never read, we mark it as retrieved so asyncio doesn't log it
+    if not future.cancelled():
+        future.exception()
+
+
+class _Entry:
+    __slots__ = "future", "refs"
+    def __init__(self, future: "asyncio.Future[Any]", refs: int) -> None:
+        self.future = future
+        self.refs = refs
+
+
+class ResultCache(Generic[_V]):
+    """
+    Shares the result of one coroutine between everything that asks for the same key.
+
+    An entry is made for `refs` readers and pinned until they've all read it and its result is in. After that it's kept in case
+    anyone else asks, along with at most `maxsize` other completed entries, least recently used first out.
+    Exceptions are cached like results, so a failed call is not repeated for the rest of its readers.
+
+    NOTE: pinned entries are never evicted, so `refs` must only count readers that will show up.
+    """
+    def __init__(self, maxsize: int) -> None:
+        self._maxsize = maxsize
+        self._pinned: Dict[Hashable, _Entry] = {}
+        self._done: "OrderedDict[Hashable, asyncio.Future[Any]]" = OrderedDict()
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} pinned={len(self._pinned)} done={len(self._done)} maxsize={self._maxsize}>"
+
+    def __len__(self) -> int:
+        return len(self._pinned) + len(self._done)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._pinned or key in self._done
+
+    async def get(self, key: Hashable, produce: Callable[[], Awaitable[_V]], refs: int = 1) -> _V:
+        """Returns the result for `key`, starting `produce()` for `refs` readers, this one included, if no one has asked for it yet"""
+        entry = self._pinned.get(key)
+        if entry is not None:
+            entry.refs -= 1
+            self._release(key, entry)
+            future = entry.future
+        elif key in self._done:
+            self._done.move_to_end(key)
+            future = self._done[key]
+        else:
+            future = self._pin(key, asyncio.ensure_future(produce()), refs - 1).future
+        # NOTE: a cancelled reader must not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def put(self, key: Hashable, result: Any, refs: int = 1) -> None:
+        """Stores a result we already have for `key`. If `result` is an exception, it's raised to each reader."""
+        future = asyncio.get_running_loop().create_future()
+        if isinstance(result, BaseException):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+        self._pin(key, future, refs)
+
+    def _pin(self, key: Hashable, future: "asyncio.Future[Any]", refs: int) -> _Entry:
+        future.add_done_callback(_retrieve)
+        self._done.pop(key, None)
+        entry = self._pinned[key] = _Entry(future, refs)
+        if future.done():
+            self._release(key, entry)
+        else:
+            future.add_done_callback(lambda _: self._release(key, entry))
+        return entry
+
+    def _release(self, key: Hashable, entry: _Entry) -> None:
+        """Unpins `entry` once it has no readers left and its result is in"""
+        if entry.refs > 0 or not entry.future.done() or self._pinned.get(key) is not entry:
+            return
+        del self._pinned[key]
+        self._done[key] = entry.future
+        while len(self._done) > self._maxsize:
+            self._done.popitem(last=False)
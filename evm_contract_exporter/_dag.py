@@ -0,0 +1,126 @@
+import asyncio
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from generic_exporters import Constant, Metric
+from generic_exporters.metric import _MathResultMetricBase
+
+
+class _Op:
+    __slots__ = "metric", "inputs"
+    def __init__(self, metric: Metric, inputs: Optional[Tuple[int, int]] = None) -> None:
+        self.metric = metric
+        self.inputs = inputs
+        """The slots of the two operands if this is a math node, None if it's a leaf"""
+
+
+class ExpressionGraph:
+    """
+    Every metric in a query plan compiled into one DAG, so the work they share is done once per timestamp.
+
+    Math metrics are broken down into their operands. Identical subexpressions share a node, even if they're different objects,
+    and each leaf metric is produced once no matter how many expressions use it. The nodes are kept in topological order,
+    so evaluating a timestamp is one gather for the leaves and then one pass over the math.
+    """
+    def __init__(self, metrics: Iterable[Metric]) -> None:
+        self._ops: List[_Op] = []
+        self._slots: Dict[Hashable, int] = {}
+        self._outputs: Dict[Metric, int] = {metric: self._compile(metric) for metric in metrics}
+
+    def __repr__(self) -> str:
+        leaves = sum(op.inputs is None for op in self._ops)
+        return f"<{self.__class__.__name__} outputs={len(self._outputs)} leaves={leaves} nodes={len(self._ops) - leaves}>"
+
+    async def evaluate(self, produce: Callable[[Metric], Awaitable[Any]], outputs: Iterable[Metric]) -> Dict[Metric, Any]:
+        """
+        Returns {metric: value} for each of `outputs`, producing each leaf they need with `produce`.
+        A node is None if one of its operands is None, and an operand's exception is passed on as the node's value.
+        """
+        outputs = list(outputs)
+        needed = sorted(self._needed(self._outputs[metric] for metric in outputs))
+        values: List[Any] = [None] * len(self._ops)
+        leaves = [slot for slot in needed if self._ops[slot].inputs is None and not isinstance(self._ops[slot].metric, Constant)]
+        for slot, value in zip(leaves, await asyncio.gather(*[produce(self._ops[slot].metric) for slot in leaves], return_exceptions=True)):
+            values[slot] = value
+        for slot in needed:
+            op = self._ops[slot]
+            if op.inputs is None:
+                if isinstance(op.metric, Constant):
+                    values[slot] = op.metric.value
+                continue
+            value0, value1 = values[op.inputs[0]], values[op.inputs[1]]
+            if isinstance(value0, BaseException) or value0 is None:
+                values[slot] = value0
+            elif isinstance(value1, BaseException) or value1 is None:
+                values[slot] = value1
+            else:
+                try:
+                    values[slot] = op.metric._do_math(value0, value1)
+                except Exception as e:
+                    values[slot] = e
+        return {metric: values[self._outputs[metric]] for metric in outputs}
+
+    def leaves(self, outputs: Iterable[Metric]) -> List[Metric]:
+        """Returns the leaf metrics, other than constants, that `outputs` are computed from"""
+        ops = (self._ops[slot] for slot in sorted(self._needed(self._outputs[metric] for metric in outputs)))
+        return [op.metric for op in ops if op.inputs is None and not isinstance(op.metric, Constant)]
+
+    def evaluate_columns(self, columns: Dict[Metric, Any], outputs: Iterable[Metric]) -> Dict[Metric, Any]:
+        """
+        Returns {metric: column} for each of `outputs`, computed from a whole column of values for each of their `leaves`, like a pandas Series.
+        Each row goes through the math metrics' own `_do_math`, like `evaluate` does, so Decimal columns give the exact values the rpc path would.
+        A row is NaN if one of its operands is missing or the operation fails.
+        """
+        outputs = list(outputs)
+        values: List[Any] = [None] * len(self._ops)
+        for slot in sorted(self._needed(self._outputs[metric] for metric in outputs)):
+            op = self._ops[slot]
+            if op.inputs is None:
+                values[slot] = op.metric.value if isinstance(op.metric, Constant) else columns[op.metric]
+                continue
+            do_math = partial(_do_math, op.metric)
+            value0, value1 = values[op.inputs[0]], values[op.inputs[1]]
+            if hasattr(value0, "combine"):
+                values[slot] = value0.combine(value1, do_math)
+            elif hasattr(value1, "combine"):
+                values[slot] = value1.combine(value0, lambda value1, value0: do_math(value0, value1))
+            else:
+                values[slot] = do_math(value0, value1)
+        return {metric: values[self._outputs[metric]] for metric in outputs}
+
+    def _compile(self, metric: Metric) -> int:
+        """Returns the slot for `metric`, adding it and its operands to the graph if they're new"""
+        if isinstance(metric, _MathResultMetricBase):
+            inputs = self._compile(metric.metric0), self._compile(metric.metric1)
+            identity: Hashable = (type(metric), inputs)
+        elif isinstance(metric, Constant):
+            identity = (Constant, metric.value)
+            inputs = None
+        else:
+            identity = metric
+            inputs = None
+        if identity not in self._slots:
+            self._slots[identity] = len(self._ops)
+            self._ops.append(_Op(metric, inputs))
+        return self._slots[identity]
+
+    def _needed(self, slots: Iterable[int]) -> Set[int]:
+        needed: Set[int] = set()
+        todo = list(slots)
+        while todo:
+            slot = todo.pop()
+            if slot not in needed:
+                needed.add(slot)
+                if (inputs := self._ops[slot].inputs) is not None:
+                    todo.extend(inputs)
+        return needed
+
+
+def _do_math(metric: _MathResultMetricBase, value0: Any, value1: Any) -> Any:
+    # NOTE: NaN is the only value that isn't equal to itself
+    if value0 is None or value1 is None or value0 != value0 or value1 != value1:
+        return float("nan")
+    try:
+        return metric._do_math(value0, value1)
+    except Exception:
+        return float("nan")
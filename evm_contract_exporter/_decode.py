@@ -0,0 +1,105 @@
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from brownie.convert.datatypes import EthAddress, HexString, Wei
+from web3.exceptions import ContractLogicError
+
+Decoder = Callable[[bytes], Any]
+Slot = Tuple[int, Decoder]
+"""The byte offset of a value in the return data, and the function that decodes its word"""
+
+_WORD = 32
+_INT = re.compile(r"(u?)int(\d*)$")
+_BYTES = re.compile(r"bytes(\d+)$")
+
+
+# NOTE: these return the same types brownie decodes each output to, so a value is the same whichever path it took
+
+def _uint(word: bytes) -> Wei:
+    return Wei(int.from_bytes(word, "big"))
+
+def _int(word: bytes) -> Wei:
+    return Wei(int.from_bytes(word, "big", signed=True))
+
+def _bool(word: bytes) -> bool:
+    return word[-1] == 1
+
+def _address(word: bytes) -> EthAddress:
+    return EthAddress(word[12:])
+
+def _bytes(size: int) -> Decoder:
+    type_str = f"bytes{size}"
+    return lambda word: HexString(word[:size], type_str)
+
+
+class Layout:
+    """
+    Where each value sits in the return data of a function whose outputs are all static, so we can decode the one we need straight from the bytes.
+    `fields` holds the top level outputs by index and `names` holds them by name, or the fields of the struct if the function returns one.
+    A struct only has slots for its own scalar fields.
+    """
+    __slots__ = "fields", "names", "size"
+    def __init__(self, fields: List[Optional[Slot]], names: Dict[str, Slot], size: int) -> None:
+        self.fields = fields
+        self.names = names
+        self.size = size
+
+    def decode(self, returndata: bytes, slot: Slot) -> Any:
+        if len(returndata) < self.size:
+            # NOTE: the call didn't return what its abi says it does, we handle it like a revert, same as when it returns nothing
+            raise ContractLogicError(f"execution reverted: expected {self.size} bytes of return data, got {len(returndata)}")
+        offset, decoder = slot
+        return decoder(returndata[offset:offset + _WORD])
+
+
+def layout(outputs: List[dict]) -> Optional[Layout]:
+    """Returns the `Layout` for a function with `outputs`, or None if any of them is dynamic and we need a full abi decoder"""
+    fields: List[Optional[Slot]] = []
+    names: Dict[str, Slot] = {}
+    offset = 0
+    for output in outputs:
+        size = _static_size(output)
+        if size is None:
+            return None
+        slot = _slot(output, offset)
+        fields.append(slot)
+        if slot is not None and output.get("name"):
+            names[output["name"]] = slot
+        offset += size
+    if len(outputs) == 1 and outputs[0]["type"] == "tuple":
+        component_offset = 0
+        for component in outputs[0]["components"]:
+            if (slot := _slot(component, component_offset)) is not None and component.get("name"):
+                names[component["name"]] = slot
+            component_offset += _static_size(component)  # type: ignore [operator]
+    return Layout(fields, names, offset)
+
+
+def _slot(abi: dict, offset: int) -> Optional[Slot]:
+    decoder = _decoder(abi["type"])
+    return None if decoder is None else (offset, decoder)
+
+def _decoder(type_str: str) -> Optional[Decoder]:
+    if match := _INT.match(type_str):
+        return _int if not match.group(1) else _uint
+    if type_str == "bool":
+        return _bool
+    if type_str == "address":
+        return _address
+    if match := _BYTES.match(type_str):
+        return _bytes(int(match.group(1)))
+    return None
+
+def _static_size(abi: dict) -> Optional[int]:
+    """Returns the number of bytes `abi` takes up in the head of the return data, or None if it's dynamic"""
+    type_str = abi["type"]
+    if type_str.endswith("]"):
+        base, _, length = type_str[:-1].rpartition("[")
+        if not length:
+            return None
+        inner = _static_size({**abi, "type": base})
+        return None if inner is None else inner * int(length)
+    if type_str == "tuple":
+        sizes = [_static_size(component) for component in abi["components"]]
+        return None if None in sizes else sum(sizes)  # type: ignore [arg-type]
+    return None if _decoder(type_str) is None else _WORD
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Awaitable, Callable, DefaultDict, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CODE_SIZES_INITCODE = bytes.fromhex("602438038060246000396000" "5b81811015601f57" "80513b8152602001600c56" "5b506000f3")
+"""
+Init code for a contract that is never deployed. Its constructor returns the code size of each of the 32 byte words appended to it, read as addresses.
+We `eth_call` it with no `to` at a block to check many addresses at that block in one request:
+
+    codecopy(0, 0x24, codesize - 0x24)
+    for (i = 0; i < codesize - 0x24; i += 32) mstore(i, extcodesize(mload(i)))
+    return(0, codesize - 0x24)
+"""
+
+PROBE_SIZE = 500
+"""The most addresses we check in one call, which keeps it well under the gas cap"""
+
+
+def encode_probe(addresses: Sequence[str]) -> bytes:
+    """Returns the calldata that checks the code size of each of `addresses`"""
+    return CODE_SIZES_INITCODE + b"".join(bytes.fromhex(address[2:]).rjust(32, b"\0") for address in addresses)
+
+def decode_probe(returndata: bytes) -> List[int]:
+    return [int.from_bytes(returndata[i:i + 32], "big") for i in range(0, len(returndata), 32)]
+
+
+class DeployBlockResolver:
+    """
+    Finds the blocks at which many contracts were deployed with one shared bisection, and persists them to `path`.
+
+    Every contract starts in the same range, from genesis to the head, so contracts share their probes until their ranges diverge.
+    All the contracts whose range is the same are checked at its midpoint together, with `get_code_sizes`, and each round of probes runs concurrently.
+    """
+    def __init__(
+        self,
+        get_code_sizes: Callable[[Sequence[str], int], Awaitable[List[int]]],
+        get_height: Callable[[], Awaitable[int]],
+        path: Optional[Path] = None,
+    ) -> None:
+        self._get_code_sizes = get_code_sizes
+        self._get_height = get_height
+        self._path = path
+        self._known: Dict[str, int] = {}
+        if path is not None and path.exists():
+            self._known = json.loads(path.read_text())
+            logger.debug("loaded %s deploy blocks from %s", len(self._known), path)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} known={len(self._known)}>"
+
+    def get(self, address: str) -> Optional[int]:
+        """Returns the deploy block of `address` if we've already found it"""
+        return self._known.get(address)
+
+    async def resolve(self, addresses: Iterable[str]) -> Dict[str, Optional[int]]:
+        """Returns {address: deploy block} for `addresses`. The block is None for an address that has no code at the head."""
+        pending = list({address for address in addresses if address not in self._known})
+        if pending:
+            height = await self._get_height()
+            present = await self._probe(pending, height)
+            # NOTE: `lo` is the last block where we know there's no code, -1 means before genesis
+            ranges: Dict[str, Tuple[int, int]] = {address: (-1, height) for address, has_code in zip(pending, present) if has_code}
+            rounds = 0
+            while ranges:
+                groups: DefaultDict[Tuple[int, int], List[str]] = defaultdict(list)
+                for address, (lo, hi) in ranges.items():
+                    if hi - lo == 1:
+                        self._known[address] = hi
+                    else:
+                        groups[lo, hi].append(address)
+                ranges = {}
+                results = await asyncio.gather(*[self._probe(group, (lo + hi) // 2) for (lo, hi), group in groups.items()])
+                for ((lo, hi), group), present in zip(groups.items(), results):
+                    mid = (lo + hi) // 2
+                    for address, has_code in zip(group, present):
+                        ranges[address] = (lo, mid) if has_code else (mid, hi)
+                rounds += 1
+            logger.info("found deploy blocks for %s contracts in %s rounds", len(pending), rounds)
+            self.save()
+        return {address: self._known.get(address) for address in addresses}
+
+    def save(self) -> None:
+        if self._path is None:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._known))
+        os.replace(tmp, self._path)
+
+    async def _probe(self, addresses: Sequence[str], block: int) -> List[bool]:
+        """Returns whether each of `addresses` has code at `block`"""
+        chunks = [addresses[i:i + PROBE_SIZE] for i in range(0, len(addresses), PROBE_SIZE)]
+        sizes = await asyncio.gather(*[self._get_code_sizes(chunk, block) for chunk in chunks])
+        return [size > 0 for chunk in sizes for size in chunk]
@@ -0,0 +1,255 @@
+import math
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+Timestamp = Union[datetime, int]
+Span = Tuple[datetime, datetime]
+Run = Tuple[int, int, int]
+"""(first epoch, step in seconds, count)"""
+
+
+def epoch(timestamp: Timestamp) -> int:
+    """Returns `timestamp` as integer epoch seconds. Naive datetimes are assumed to be UTC."""
+    if isinstance(timestamp, int):
+        return timestamp
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp())
+
+def from_epoch(seconds: int) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+class TimestampIndex:
+    """
+    A sorted array of the epoch timestamps present in the datastore for one (chainid, address, metric).
+    Membership and first-missing-slot lookups are O(log n). New timestamps are added in place as inserts land.
+
+    Every timestamp before `floor`, if set, counts as present. We use this for data that was pruned by the retention policy.
+    """
+    __slots__ = "_epochs", "floor", "_on_grid"
+    def __init__(self, timestamps: Iterable[Timestamp] = (), floor: Optional[int] = None) -> None:
+        self._epochs = array("q", sorted({epoch(ts) for ts in timestamps}))
+        self.floor = floor
+        self._on_grid: Dict[Tuple[int, int], bool] = {}
+        """{(phase, step): whether every epoch is on that grid} for the grids we've been asked about, kept up to date by `add`"""
+    @classmethod
+    def from_runs(cls, runs: Iterable[Run]) -> "TimestampIndex":
+        return cls(first + i * step for first, step, count in runs for i in range(count))
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} len={len(self)}>"
+    def __len__(self) -> int:
+        return len(self._epochs)
+    def __contains__(self, timestamp: Timestamp) -> bool:
+        seconds = epoch(timestamp)
+        if self.floor is not None and seconds < self.floor:
+            return True
+        i = bisect_left(self._epochs, seconds)
+        return i < len(self._epochs) and self._epochs[i] == seconds
+    def add(self, timestamp: Timestamp) -> None:
+        seconds = epoch(timestamp)
+        epochs = self._epochs
+        # NOTE: fresh data usually lands at the end of the array so we check there first and skip the bisection
+        if not epochs or seconds > epochs[-1]:
+            epochs.append(seconds)
+        elif seconds not in self:
+            insort(epochs, seconds)
+        for phase, step in self._on_grid:
+            if (seconds - phase) % step:
+                self._on_grid[phase, step] = False
+    def discard(self, timestamp: Timestamp) -> None:
+        """Removes `timestamp` from the index if it's there"""
+        seconds = epoch(timestamp)
+        i = bisect_left(self._epochs, seconds)
+        if i < len(self._epochs) and self._epochs[i] == seconds:
+            del self._epochs[i]
+            # NOTE: this might have been the only off-grid epoch, we'll check again next time
+            self._on_grid.clear()
+    def between(self, start: Timestamp, end: Timestamp) -> "array[int]":
+        """Returns the epochs in the index from `start` to `end`, inclusive"""
+        epochs = self._epochs
+        return epochs[bisect_left(epochs, epoch(start)):bisect_right(epochs, epoch(end))]
+    def at_or_before(self, timestamp: Timestamp) -> Optional[int]:
+        """Returns the last epoch in the index at or before `timestamp`, or None if there isn't one"""
+        i = bisect_right(self._epochs, epoch(timestamp))
+        return self._epochs[i - 1] if i else None
+    def after(self, timestamp: Timestamp) -> Optional[int]:
+        """Returns the first epoch in the index after `timestamp`, or None if there isn't one"""
+        i = bisect_right(self._epochs, epoch(timestamp))
+        return self._epochs[i] if i < len(self._epochs) else None
+    def first_missing(self, start: Timestamp, interval: timedelta) -> datetime:
+        """
+        Returns the first slot on the grid `start + n * interval` that is not present in the index.
+        NOTE: This assumes the index holds a single grid for the metric, which is how the exporters write data.
+        """
+        step = int(interval.total_seconds())
+        start_seconds = self._above_floor(epoch(start), step)
+        epochs = self._epochs
+        offset = bisect_left(epochs, start_seconds)
+        if offset == len(epochs) or epochs[offset] != start_seconds:
+            return from_epoch(start_seconds)
+        if not self._is_on_grid(start_seconds, step):
+            # NOTE: epochs between the slots, from another interval or a migrated series, would throw the bisection off so we walk the grid
+            expected = start_seconds
+            for seconds in epochs[offset:]:
+                if seconds == expected:
+                    expected += step
+                elif seconds > expected:
+                    break
+            return from_epoch(expected)
+        # `epochs[offset + n] == start + n * step` holds for every n before the first gap and for none after it, so we can bisect for the gap
+        present, missing = 0, len(epochs) - offset
+        while missing - present > 1:
+            n = (present + missing) // 2
+            if epochs[offset + n] == start_seconds + n * step:
+                present = n
+            else:
+                missing = n
+        return from_epoch(start_seconds + missing * step)
+    def missing_spans(self, start: Timestamp, end: Timestamp, interval: timedelta) -> List[Span]:
+        """Returns the inclusive (first, last) ranges of slots on the grid `start + n * interval`, up to and including `end`, that are not present in the index"""
+        step = int(interval.total_seconds())
+        start_seconds = self._above_floor(epoch(start), step)
+        end_seconds = start_seconds + (epoch(end) - start_seconds) // step * step
+        if end_seconds < start_seconds:
+            return []
+        epochs = self._epochs
+        spans = []
+        expected = start_seconds
+        for i in range(bisect_left(epochs, start_seconds), bisect_right(epochs, end_seconds)):
+            seconds = epochs[i]
+            if (seconds - start_seconds) % step:
+                # not on this grid
+                continue
+            if seconds > expected:
+                spans.append((from_epoch(expected), from_epoch(seconds - step)))
+            expected = seconds + step
+        if expected <= end_seconds:
+            spans.append((from_epoch(expected), from_epoch(end_seconds)))
+        return spans
+    def runs(self, start: Optional[Timestamp] = None, end: Optional[Timestamp] = None) -> List[Run]:
+        """
+        Compresses the index into (first, step, count) runs of evenly spaced timestamps, which is tiny for data on a regular grid.
+        If `start` and `end` are passed, only the epochs between them, inclusive, are compressed.
+        """
+        epochs = self._epochs if start is None or end is None else self.between(start, end)
+        runs = []
+        i = 0
+        while i < len(epochs):
+            if i + 1 == len(epochs):
+                runs.append((epochs[i], 0, 1))
+                break
+            step = epochs[i + 1] - epochs[i]
+            j = i + 1
+            while j + 1 < len(epochs) and epochs[j + 1] - epochs[j] == step:
+                j += 1
+            runs.append((epochs[i], step, j - i + 1))
+            i = j + 1
+        return runs
+    def _is_on_grid(self, start_seconds: int, step: int) -> bool:
+        """Returns True if every epoch in the index is on the grid `start + n * step`. We only check the whole array the first time we're asked about a grid."""
+        grid = start_seconds % step, step
+        if grid not in self._on_grid:
+            self._on_grid[grid] = all((seconds - grid[0]) % step == 0 for seconds in self._epochs)
+        return self._on_grid[grid]
+    def _above_floor(self, start_seconds: int, step: int) -> int:
+        """Returns the first slot on the grid `start + n * step` that isn't below `floor`"""
+        if self.floor is None or start_seconds >= self.floor:
+            return start_seconds
+        return start_seconds + -(-(self.floor - start_seconds) // step) * step
+
+
+def update_runs(runs: List[Run], index: TimestampIndex, added: Iterable[Timestamp]) -> Tuple[List[int], List[Run]]:
+    """
+    Updates `runs`, the sorted runs of `index` from before `added` were added to it, in place so they cover `index` again.
+    Only the runs on either side of each added timestamp are recompressed, the rest are left as they are.
+    Returns the first epoch of each run that was removed and the runs that replaced them, so a stored copy can be updated the same way.
+    """
+    regions: List[List[int]] = []
+    for seconds in sorted({epoch(ts) for ts in added}):
+        i = bisect_right(runs, (seconds, math.inf))
+        lo = runs[i - 1][0] if i else seconds
+        hi = _last(runs[i]) if i < len(runs) else seconds
+        if regions and lo <= regions[-1][1]:
+            regions[-1][1] = max(regions[-1][1], hi)
+        else:
+            regions.append([lo, hi])
+    removed: List[int] = []
+    inserted: List[Run] = []
+    for lo, hi in regions:
+        i = bisect_left(runs, (lo,))
+        j = bisect_right(runs, (hi, math.inf))
+        old, new = runs[i:j], index.runs(lo, hi)
+        runs[i:j] = new
+        unchanged = set(old) & set(new)
+        removed.extend(run[0] for run in old if run not in unchanged)
+        inserted.extend(run for run in new if run not in unchanged)
+    return removed, inserted
+
+def _last(run: Run) -> int:
+    first, step, count = run
+    return first + step * (count - 1)
+
+
+class StepFunction:
+    """
+    A series stored change-only: the epochs at which its value changed, and the value it held from each one on.
+    The series holds the value of its last change at every timestamp it was observed at, which is tracked separately in a `TimestampIndex`.
+    """
+    __slots__ = "_epochs", "_values"
+    def __init__(self, changes: Iterable[Tuple[Timestamp, Any]] = ()) -> None:
+        changes = sorted((epoch(ts), value) for ts, value in changes)
+        self._epochs = array("q", (seconds for seconds, _ in changes))
+        self._values = [value for _, value in changes]
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} changes={len(self)}>"
+    def __len__(self) -> int:
+        return len(self._epochs)
+    def __contains__(self, timestamp: Timestamp) -> bool:
+        """Returns True if the value changed at `timestamp`"""
+        seconds = epoch(timestamp)
+        i = bisect_left(self._epochs, seconds)
+        return i < len(self._epochs) and self._epochs[i] == seconds
+    def at(self, timestamp: Timestamp) -> Any:
+        """Returns the value of the last change at or before `timestamp`, or None if there isn't one"""
+        i = bisect_right(self._epochs, epoch(timestamp))
+        return self._values[i - 1] if i else None
+    def expand(self, timestamps: Iterable[Timestamp]) -> List[Any]:
+        return [self.at(ts) for ts in timestamps]
+    def set(self, timestamp: Timestamp, value: Any) -> None:
+        seconds = epoch(timestamp)
+        i = bisect_left(self._epochs, seconds)
+        if i < len(self._epochs) and self._epochs[i] == seconds:
+            self._values[i] = value
+        else:
+            self._epochs.insert(i, seconds)
+            self._values.insert(i, value)
+    def remove(self, timestamp: Timestamp) -> None:
+        i = bisect_left(self._epochs, epoch(timestamp))
+        del self._epochs[i]
+        del self._values[i]
+    def observe(self, observed: TimestampIndex, timestamp: Timestamp, value: Any) -> Tuple[List[Tuple[int, Any]], List[int]]:
+        """
+        Records that the series held `value` at `timestamp`, which must not be in `observed` yet.
+        Returns the (epoch, value) changes that must be stored for it, and the epochs of the stored changes that are now redundant and must be deleted.
+
+        That's nothing if the value didn't change. If `timestamp` lands before an observation we already have, that observation may need a change of its own
+        so it keeps the value it was observed with, or the change it already has may now repeat the value before it.
+        """
+        seconds = epoch(timestamp)
+        changes, removed = [], []
+        following = observed.after(seconds)
+        following_value = None if following is None else self.at(following)
+        if self.at(seconds) != value:
+            self.set(seconds, value)
+            changes.append((seconds, value))
+            if following is not None and following in self and following_value == value:
+                # NOTE: this is what happens to every sample of a constant series when we fill newest first
+                self.remove(following)
+                removed.append(following)
+        if following is not None and self.at(following) != following_value:
+            self.set(following, following_value)
+            changes.append((following, following_value))
+        return changes, removed
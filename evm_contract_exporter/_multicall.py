@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import dank_mids
+import eth_abi
+from async_lru import alru_cache
+from generic_exporters.metric import _MathResultMetricBase
+
+from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
+from evm_contract_exporter import utils
+
+if TYPE_CHECKING:
+    from generic_exporters import Metric
+    from evm_contract_exporter.metric import ContractCallMetric
+
+logger = logging.getLogger(__name__)
+
+MULTICALL3 = "0xcA11bde05977b3631167028862bE2a173976CA11"
+"""Multicall3 is deployed at the same address on nearly every evm chain"""
+
+_AGGREGATE3 = bytes.fromhex("82ad56cb")
+"""aggregate3((address,bool,bytes)[])"""
+
+Call = Tuple[str, bytes]
+Result = Tuple[bool, bytes]
+
+
+def encode_aggregate3(calls: Sequence[Call]) -> bytes:
+    """Returns the calldata for one `aggregate3` call that makes each of `calls` with `allowFailure` set"""
+    return _AGGREGATE3 + eth_abi.encode(["(address,bool,bytes)[]"], [[(target, True, data) for target, data in calls]])
+
+def decode_aggregate3(returndata: bytes) -> List[Result]:
+    """Returns (success, returndata) for each of the calls in the batch"""
+    return list(eth_abi.decode(["(bool,bytes)[]"], returndata)[0])
+
+async def aggregate3(calls: Sequence[Call], block: int) -> List[Result]:
+    """Makes `calls` at `block` in `aggregate3` batches of at most `MULTICALL_BATCH_SIZE` calls each"""
+    size = int(ENVS.MULTICALL_BATCH_SIZE)
+    batches = [calls[i:i + size] for i in range(0, len(calls), size)]
+    responses = await asyncio.gather(*[
+        utils.rate_limited(lambda batch=batch: dank_mids.eth.call({"to": MULTICALL3, "data": encode_aggregate3(batch)}, block_identifier=block))
+        for batch in batches
+    ])
+    return [result for response in responses for result in decode_aggregate3(bytes(response))]
+
+
+async def prefetch(metrics: Iterable["Metric"], block: int) -> None:
+    """
+    Makes every contract call needed to produce `metrics` at `block` in deterministic `aggregate3` batches,
+    and hands each metric its result so it doesn't make the call itself.
+    Does nothing if Multicall3 isn't deployed at `block`, the metrics will make their calls the usual way.
+    """
+    from evm_contract_exporter.metric import _call_results
+    # NOTE: different objects can make the same call, we only make it once and cache it for each metric that will read it
+    calls: Dict[Tuple[str, bytes, int], "ContractCallMetric"] = {}
+    readers: Dict[Tuple[str, bytes, int], Dict["Metric", None]] = {}
+    for metric in metrics:
+        for reader in _readers(metric):
+            call = _call(reader)
+            if (key := call._result_key(block)) not in _call_results:
+                calls.setdefault(key, call)
+                readers.setdefault(key, {})[reader] = None
+    if not calls:
+        return
+    multicall_deploy_block = await _multicall_deploy_block()
+    if multicall_deploy_block is None or multicall_deploy_block > block:
+        return
+    # NOTE: calls to contracts that weren't deployed yet are skipped in `produce_raw` anyway
+    deploy_blocks = await asyncio.gather(*[utils.get_deploy_block(address) for address, _, _ in calls])
+    ordered = sorted(key for key, deploy_block in zip(calls, deploy_blocks) if deploy_block <= block)
+    if not ordered:
+        return
+    try:
+        results = await aggregate3([(address, calldata) for address, calldata, _ in ordered], block)
+    except Exception as e:
+        logger.warning("multicall at block %s failed, the calls will be made one by one: %s %s", block, type(e).__name__, e)
+        return
+    for key, (success, returndata) in zip(ordered, results):
+        calls[key]._prime(block, success, returndata, refs=len(readers[key]))
+    logger.debug("prefetched %s calls at block %s", len(ordered), block)
+
+def _calls(metric: "Metric") -> Iterator["ContractCallMetric"]:
+    """Yields the `ContractCallMetric` objects that `metric` is computed from"""
+    for reader in _readers(metric):
+        yield _call(reader)
+
+def _readers(metric: "Metric") -> Iterator["Metric"]:
+    """Yields the metrics that read a call result to compute `metric`, the calls themselves and the fields derived from them"""
+    from evm_contract_exporter.metric import ContractCallDerivedMetric, ContractCallMetric
+    if isinstance(metric, (ContractCallMetric, ContractCallDerivedMetric)):
+        yield metric
+    elif isinstance(metric, _MathResultMetricBase):
+        yield from _readers(metric.metric0)
+        yield from _readers(metric.metric1)
+
+def _call(reader: "Metric") -> "ContractCallMetric":
+    from evm_contract_exporter.metric import ContractCallDerivedMetric
+    return reader._call if isinstance(reader, ContractCallDerivedMetric) else reader
+
+@alru_cache(maxsize=1)
+async def _multicall_deploy_block() -> Optional[int]:
+    try:
+        return await utils.get_deploy_block(MULTICALL3)
+    except Exception as e:
+        logger.warning("Multicall3 isn't available on this chain, calls will not be batched: %s %s", type(e).__name__, e)
+        return None
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+_T = TypeVar("_T")
+
+_LATENCY_TOLERANCE = 2.0
+"""We stop raising our limits while the smoothed latency is more than this many times the best we've seen, the node is queueing our requests"""
+_LATENCY_SMOOTHING = 0.1
+_DECREASE = 0.5
+"""On a 429, the rate and concurrency limits are cut by this factor"""
+_DECREASE_INTERVAL = 1.0
+"""Providers count requests over windows of about a second, so all the 429s within a second of the one we reacted to are from the same overload"""
+_RECOVERY = 0.05
+"""After a 429, the rate grows by at least this share of the rate we were limited at every second"""
+
+
+def is_rate_limited(e: Exception) -> bool:
+    """Returns True if `e` is the node telling us to slow down"""
+    message = str(e)
+    return "429" in message or "Too Many Requests" in message or "rate limit" in message.lower()
+
+
+class RateLimiter:
+    """
+    Paces the requests we send to one rpc endpoint so we run at its actual limit instead of oscillating around it.
+
+    Requests start in FIFO order when a token is available in a bucket that refills at `rate` per second and fewer than `concurrency` are in flight.
+    Until the first 429 both limits double every round of requests, like tcp slow start. From then on they grow additively,
+    by 5% of the rate we were limited at, or `rate_increase`, tokens per second and 1 slot per round, while the node keeps up.
+    They're cut in half on a 429, at most once a second so a burst of 429s from the same overload only counts once,
+    and the rate limited request waits its turn to retry. While the latency of timed requests climbs above its baseline the limits hold still.
+    """
+    def __init__(
+        self,
+        rate: float = 50.0,
+        concurrency: float = 64.0,
+        *,
+        rate_increase: float = 10.0,
+        min_rate: float = 1.0,
+        max_rate: float = 10_000.0,
+        max_concurrency: float = 5_000.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.concurrency = concurrency
+        self._rate_increase = rate_increase
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._max_concurrency = max_concurrency
+        self._clock = clock
+        self._tokens = 1.0
+        self._refilled = clock()
+        self._active = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._latency: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._decreased = float("-inf")
+        self._slow_start = True
+        self._step = rate_increase
+        self.throttled = 0
+        """The number of 429s we've seen"""
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} rate={self.rate:.1f}/s concurrency={int(self.concurrency)} active={self._active} waiting={len(self._waiters)}>"
+
+    async def call(self, fn: Callable[[], Awaitable[_T]], *, timed: bool = True) -> _T:
+        """
+        Returns `await fn()` once the limits let it start, retrying for as long as the node rate limits it.
+        Pass `timed=False` if the time `fn` takes isn't the node's latency, so it only counts as a success and never holds the limits still.
+        """
+        while True:
+            await self._acquire()
+            start = self._clock()
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_rate_limited(e):
+                    raise
+                self._on_rate_limited()
+                continue
+            finally:
+                self._release()
+            self._on_success(self._clock() - start if timed else None)
+            return result
+
+    async def _acquire(self) -> None:
+        if not self._waiters and self._can_start():
+            self._start()
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # NOTE: we were given a slot right as we were cancelled, pass it on
+                self._release()
+            raise
+
+    def _can_start(self) -> bool:
+        now = self._clock()
+        self._tokens = min(self._tokens + (now - self._refilled) * self.rate, max(self.rate, 1.0))
+        self._refilled = now
+        return self._active < int(self.concurrency) and self._tokens >= 1
+
+    def _start(self) -> None:
+        self._tokens -= 1
+        self._active += 1
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._can_start():
+            future = self._waiters.popleft()
+            if not future.done():
+                self._start()
+                future.set_result(None)
+        if self._waiters and self._timer is None and self._active < int(self.concurrency):
+            # NOTE: we're waiting on a token, not a slot
+            self._timer = asyncio.get_running_loop().call_later((1 - self._tokens) / self.rate, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._wake()
+
+    def _on_success(self, latency: Optional[float]) -> None:
+        if latency is not None:
+            self._latency = latency if self._latency is None else self._latency + _LATENCY_SMOOTHING * (latency - self._latency)
+            self._baseline = self._latency if self._baseline is None else min(self._baseline, self._latency)
+            if self._latency > self._baseline * _LATENCY_TOLERANCE:
+                return
+        if self._slow_start:
+            self.rate = min(self.rate + 1, self._max_rate)
+            self.concurrency = min(self.concurrency + 1, self._max_concurrency)
+        else:
+            self.rate = min(self.rate + self._step / self.rate, self._max_rate)
+            self.concurrency = min(self.concurrency + 1 / self.concurrency, self._max_concurrency)
+
+    def _on_rate_limited(self) -> None:
+        self.throttled += 1
+        now = self._clock()
+        if now - self._decreased < max(self._latency or 0, _DECREASE_INTERVAL):
+            # NOTE: this 429 is from the same overload as the last one we reacted to
+            return
+        self._decreased = now
+        self._slow_start = False
+        self._step = max(self._rate_increase, self.rate * _RECOVERY)
+        self.rate = max(self.rate * _DECREASE, self._min_rate)
+        self.concurrency = max(self.concurrency * _DECREASE, 1.0)
+        self._tokens = min(self._tokens, 0.0)
+        logger.info("rate limited, slowing down to %.1f requests/s and %s at a time", self.rate, int(self.concurrency))
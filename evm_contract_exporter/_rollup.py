@@ -0,0 +1,65 @@
+from decimal import Context, Decimal
+from typing import Dict, Iterable, Tuple, Union
+
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = HOUR, DAY
+"""The bucket widths, in seconds, of the rollups we keep for each stored series"""
+
+Number = Union[int, Decimal]
+Point = Tuple[int, Number]
+"""(epoch, value)"""
+
+# NOTE: the default context only keeps 28 digits, which isn't enough for a sum of values with 20 integer digits and 18 decimals
+_CONTEXT = Context(prec=60)
+
+
+def bucket_start(seconds: int, resolution: int) -> int:
+    """Returns the epoch at which the bucket of width `resolution` that contains `seconds` starts"""
+    return seconds - seconds % resolution
+
+
+class Aggregate:
+    """The last, min, max, sum and count of the values in one bucket. The average is `sum / count`."""
+    __slots__ = "last_timestamp", "last", "min", "max", "sum", "count"
+    def __init__(self, last_timestamp: int, last: Number, min: Number, max: Number, sum: Number, count: int) -> None:
+        self.last_timestamp = last_timestamp
+        self.last = last
+        self.min = min
+        self.max = max
+        self.sum = sum
+        self.count = count
+    @classmethod
+    def of(cls, timestamp: int, value: Number) -> "Aggregate":
+        return cls(timestamp, value, value, value, value, 1)
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} last={self.last} min={self.min} max={self.max} avg={self.avg} count={self.count}>"
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Aggregate) and self.astuple() == other.astuple()
+    @property
+    def avg(self) -> Decimal:
+        return _CONTEXT.divide(Decimal(self.sum), self.count)
+    def astuple(self) -> Tuple[int, Number, Number, Number, Number, int]:
+        return self.last_timestamp, self.last, self.min, self.max, self.sum, self.count
+    def add(self, timestamp: int, value: Number) -> None:
+        self.merge(Aggregate.of(timestamp, value))
+    def merge(self, other: "Aggregate") -> None:
+        """Folds `other`, which must hold different datapoints from the same bucket, into this aggregate in place"""
+        if other.last_timestamp >= self.last_timestamp:
+            self.last_timestamp, self.last = other.last_timestamp, other.last
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sum = _CONTEXT.add(self.sum, other.sum)
+        self.count += other.count
+
+
+def aggregate(points: Iterable[Point], resolution: int) -> Dict[int, Aggregate]:
+    """Groups `points` into {bucket start: Aggregate} for buckets of width `resolution`"""
+    buckets: Dict[int, Aggregate] = {}
+    for seconds, value in points:
+        bucket = bucket_start(seconds, resolution)
+        if bucket in buckets:
+            buckets[bucket].add(seconds, value)
+        else:
+            buckets[bucket] = Aggregate.of(seconds, value)
+    return buckets
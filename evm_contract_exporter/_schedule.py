@@ -0,0 +1,104 @@
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Iterator, List, Optional
+
+NEWEST_FIRST = "newest_first"
+OLDEST_FIRST = "oldest_first"
+PROGRESSIVE = "progressive"
+SCHEDULES = NEWEST_FIRST, OLDEST_FIRST, PROGRESSIVE
+
+_COARSEST_STRIDE = 64
+"""A progressive backfill starts with every 64th timestamp on the grid, then every 32nd, and so on down to every one"""
+_LEVEL_SPAN = 2 ** 40
+"""Wider than any epoch, so every timestamp in a progressive level sorts before every timestamp in the next one"""
+
+
+def check(name: str) -> str:
+    if name not in SCHEDULES:
+        raise ValueError(f"`schedule` must be one of {SCHEDULES}, you passed {name!r}")
+    return name
+
+
+class Schedule:
+    """
+    The order in which an exporter backfills the timestamps on its grid `start + n * interval`.
+
+    - newest_first: recent data first, so current values show up right away
+    - oldest_first: history in chronological order
+    - progressive: every 64th timestamp first, newest first, then every 32nd and so on, so full range charts are usable early and sharpen as the rest fills in
+    """
+    __slots__ = "name", "_origin", "_interval", "_start", "_step"
+    def __init__(self, name: str, start: datetime, interval: timedelta) -> None:
+        self.name = check(name)
+        self._origin = start
+        self._interval = interval
+        self._start = int(start.timestamp())
+        self._step = int(interval.total_seconds())
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} {self.name}>"
+    def priority(self, timestamp: datetime) -> int:
+        """Returns the priority of `timestamp`, lower goes first"""
+        seconds = int(timestamp.timestamp())
+        if self.name == NEWEST_FIRST:
+            return -seconds
+        if self.name == OLDEST_FIRST:
+            return seconds
+        return self._level(seconds) * _LEVEL_SPAN - seconds
+    def order(self, timestamps: Iterable[datetime]) -> List[datetime]:
+        return sorted(timestamps, key=self.priority)
+    def chunks(self, end: datetime, size: int, where: Optional[Callable[[datetime], bool]] = None) -> Iterator[List[datetime]]:
+        """
+        Yields the timestamps on the grid up to `end` in order, `size` at a time, skipping any `where` returns False for.
+        They're generated as we go, so the range is never held in memory. A progressive schedule also starts a new chunk at each level, so a level never waits on the next one.
+        """
+        chunk: List[datetime] = []
+        for slots in self._runs((int(end.timestamp()) - self._start) // self._step):
+            for slot in slots:
+                timestamp = self._origin + slot * self._interval
+                if where is not None and not where(timestamp):
+                    continue
+                chunk.append(timestamp)
+                if len(chunk) == size:
+                    yield chunk
+                    chunk = []
+            if chunk and self.name == PROGRESSIVE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    def _runs(self, last: int) -> Iterator[range]:
+        """Yields the slots 0 to `last` on the grid in order, as one range per progressive level or a single range otherwise"""
+        if last < 0:
+            return
+        if self.name == NEWEST_FIRST:
+            yield range(last, -1, -1)
+        elif self.name == OLDEST_FIRST:
+            yield range(last + 1)
+        else:
+            yield range(last - last % _COARSEST_STRIDE, -1, -_COARSEST_STRIDE)
+            stride = _COARSEST_STRIDE // 2
+            while stride:
+                # NOTE: the rest of this level are the odd multiples of `stride`, the even ones were in a coarser level
+                top = last // stride
+                if top % 2 == 0:
+                    top -= 1
+                if top > 0:
+                    yield range(top * stride, 0, -2 * stride)
+                stride //= 2
+    def _level(self, seconds: int) -> int:
+        """Returns 0 for every 64th slot on the grid, 1 for the rest of every 32nd, and so on up to 6 for the odd slots"""
+        slot = (seconds - self._start) // self._step
+        level, stride = 0, _COARSEST_STRIDE
+        while stride > 1 and slot % stride:
+            level += 1
+            stride //= 2
+        return level
+
+
+current: ContextVar[Optional[Schedule]] = ContextVar("schedule", default=None)
+"""The schedule of the exporter the current task is working for"""
+
+def priority(timestamp: datetime) -> int:
+    """Returns the priority of work for `timestamp` under the `current` schedule, newest first if there isn't one. Lower goes first."""
+    schedule = current.get()
+    return -int(timestamp.timestamp()) if schedule is None else schedule.priority(timestamp)
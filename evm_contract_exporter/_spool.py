@@ -0,0 +1,107 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+Offset = Tuple[int, int]
+"""(segment, position in segment)"""
+
+_HEADER = struct.Struct(">II")
+"""(payload length, crc32 of payload)"""
+
+
+class Spool:
+    """
+    An append-only log of records, kept on disk until they're acknowledged, so they can be replayed after a crash.
+
+    Records are appended to numbered segment files in `directory`. A segment is deleted once every record in it has been acknowledged,
+    and the active segment is truncated whenever it has nothing pending, so the spool stays small while the consumer keeps up.
+    Each record carries a checksum, so a record that was only partially written when the process died is dropped on replay.
+
+    NOTE: We flush every append but don't fsync, so records survive the process dying but not the machine.
+    """
+    def __init__(self, directory: Path, segment_bytes: int = 16 * 1024 ** 2) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._segment_bytes = segment_bytes
+        self._previous = sorted(int(path.stem) for path in self.directory.glob("*.spool"))
+        """The segments left behind by previous runs, which are replayed with `replay`"""
+        self._pending: Dict[int, Set[int]] = {}
+        self._active = self._previous[-1] + 1 if self._previous else 0
+        self._open_segment()
+
+    def __len__(self) -> int:
+        """Returns the number of records that haven't been acknowledged yet"""
+        return sum(map(len, self._pending.values()))
+
+    def append(self, record: Any) -> Offset:
+        """Writes `record`, which must be json serializable, to the spool and returns its offset for `ack`"""
+        payload = json.dumps(record, separators=(",", ":")).encode()
+        position = self._size
+        self._file.write(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._file.flush()
+        self._size += _HEADER.size + len(payload)
+        offset = self._active, position
+        self._pending[self._active].add(position)
+        if self._size >= self._segment_bytes:
+            self._file.close()
+            self._active += 1
+            self._open_segment()
+        return offset
+
+    def ack(self, offsets: Iterable[Offset]) -> None:
+        """Marks the records at `offsets` as done. They won't be replayed again."""
+        for segment, position in offsets:
+            pending = self._pending.get(segment)
+            if pending is None:
+                continue
+            pending.discard(position)
+            if pending:
+                continue
+            if segment == self._active:
+                self._file.truncate(0)
+                self._size = 0
+            else:
+                del self._pending[segment]
+                self._path(segment).unlink(missing_ok=True)
+
+    def replay(self) -> List[Tuple[Offset, Any]]:
+        """Returns [(offset, record), ...] for every intact record left by previous runs. They stay in the spool until they're acknowledged."""
+        records = []
+        for segment in self._previous:
+            pending = self._pending.setdefault(segment, set())
+            with open(self._path(segment), "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                        for position, record in _read_records(buffer):
+                            pending.add(position)
+                            records.append(((segment, position), record))
+            if not pending:
+                del self._pending[segment]
+                self._path(segment).unlink()
+        self._previous = []
+        return records
+
+    def _open_segment(self) -> None:
+        self._file = open(self._path(self._active), "ab")
+        self._size = 0
+        self._pending[self._active] = set()
+
+    def _path(self, segment: int) -> Path:
+        return self.directory / f"{segment:08d}.spool"
+
+
+def _read_records(buffer: mmap.mmap) -> Iterator[Tuple[int, Any]]:
+    position = 0
+    while position + _HEADER.size <= len(buffer):
+        length, checksum = _HEADER.unpack_from(buffer, position)
+        start = position + _HEADER.size
+        payload = buffer[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            # a torn write from a crash, nothing after it can be trusted
+            return
+        yield position, json.loads(payload)
+        position = start + length
@@ -7,7 +7,7 @@ from typing import Optional
 import a_sync
 
 from evm_contract_exporter._exceptions import FixMe
-from evm_contract_exporter.datastore import GenericContractTimeSeriesKeyValueStore
+from evm_contract_exporter.datastore import ContractTimeSeriesDataStoreBase, get_default_datastore
 from evm_contract_exporter.types import address
 
 
@@ -22,7 +22,7 @@ class ContractExporterBase(a_sync.ASyncGenericBase):
         interval: timedelta = timedelta(days=1), 
         buffer: Optional[timedelta] = None,
         concurrency: Optional[int] = None,
-        datastore: Optional[GenericContractTimeSeriesKeyValueStore] = None,
+        datastore: Optional[ContractTimeSeriesDataStoreBase] = None,
         sync: bool = True,
     ) -> None:
         self.chainid = chainid
@@ -31,7 +31,7 @@ class ContractExporterBase(a_sync.ASyncGenericBase):
             raise NotImplementedError('buffer')
         self.buffer = buffer
         self.concurrency = concurrency
-        self.datastore = datastore or GenericContractTimeSeriesKeyValueStore.get_for_chain(chainid)
+        self.datastore = datastore or get_default_datastore(chainid)
         self.sync = sync
     def __await__(self):
         try:
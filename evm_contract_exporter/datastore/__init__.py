@@ -0,0 +1,18 @@
+from evm_contract_exporter.datastore._base import ContractTimeSeriesDataStoreBase
+from evm_contract_exporter.datastore.kv import (GenericContractTimeSeriesChangeStore,
+                                                GenericContractTimeSeriesKeyValueStore,
+                                                GenericContractTimeSeriesKeyValueStoreV2,
+                                                GenericContractTimeSeriesRawStore, get_default_datastore)
+from evm_contract_exporter.datastore.memory import InMemoryTimeSeriesDataStore
+from evm_contract_exporter.datastore.parquet import ParquetTimeSeriesDataStore
+
+__all__ = [
+    "ContractTimeSeriesDataStoreBase",
+    "GenericContractTimeSeriesChangeStore",
+    "GenericContractTimeSeriesKeyValueStore",
+    "GenericContractTimeSeriesKeyValueStoreV2",
+    "GenericContractTimeSeriesRawStore",
+    "InMemoryTimeSeriesDataStore",
+    "ParquetTimeSeriesDataStore",
+    "get_default_datastore",
+]
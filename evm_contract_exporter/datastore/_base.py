@@ -0,0 +1,74 @@
+import logging
+import math
+from abc import abstractmethod
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, DefaultDict, Dict, Iterable, List, Optional, Union
+
+from generic_exporters.processors.exporters.datastores.timeseries._base import TimeSeriesDataStoreBase
+from typing_extensions import Self
+
+from evm_contract_exporter import _exceptions, types
+from evm_contract_exporter._index import Span, TimestampIndex
+from evm_contract_exporter.db.errors import Error
+
+MAX_VALUE = 10 ** 20
+
+logger = logging.getLogger(__name__)
+
+class ContractTimeSeriesDataStoreBase(TimeSeriesDataStoreBase):
+    """
+    A base class for datastores that hold the contract metrics for one chain.
+    Subclasses keep a `TimestampIndex` per metric for each address so the exporters can check what exists without hitting storage.
+    """
+    push = None  # TODO refactor this in the abc
+    raw = False
+    """True if the datastore keeps the unscaled output of contract calls and applies the scale at read time"""
+    _max_value = MAX_VALUE
+    @classmethod
+    @lru_cache(maxsize=None)
+    def get_for_chain(cls, chainid: int) -> Self:
+        return cls(chainid)
+
+    def __init__(self, chain_id: int) -> None:
+        self.chainid = chain_id
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} chainid={self.chainid}>"
+
+    async def data_exists(self, address: types.address, key: str, ts: datetime) -> bool:
+        """Returns True if `key` has data in the datastore for `address` at `ts`, False if not."""
+        indexes = await self._get_indexes(address)
+        if ts in indexes[key]:
+            logger.debug('%s %s %s %s exists', self.chainid, address, key, ts)
+            return True
+        logger.debug('%s %s %s %s does not exist', self.chainid, address, key, ts)
+        return False
+
+    async def missing_spans(self, address: types.address, keys: Iterable[str], start: datetime, end: datetime, interval: timedelta) -> Dict[str, List[Span]]:
+        """Returns {key: [(first, last), ...]} with the inclusive ranges of slots on the grid `start + n * interval`, up to `end`, that are missing for each of `keys` for `address`"""
+        indexes = await self._get_indexes(address)
+        return {key: indexes[key].missing_spans(start, end, interval) for key in keys}
+
+    @abstractmethod
+    async def _get_indexes(self, address: types.address) -> DefaultDict[str, TimestampIndex]:
+        """Returns {key: TimestampIndex} for every metric stored for `address`. Implementations must keep the indexes up to date in place as data is written."""
+
+    def _prepare_value(self, address: types.address, key: Any, ts: datetime, value: Any) -> Optional[Union[Decimal, int]]:
+        """
+        Returns `value` in the form we store it, or None if it can't be stored. Any exception other than a revert is raised.
+        Reverts are returned as the `Error.REVERT` member itself, so they can be told apart from a real -1 until they're written.
+        """
+        if isinstance(value, Exception):
+            if not _exceptions._is_revert(value):
+                raise value
+            logger.debug("%s %s at %s reverted with %s %s", address, key, ts, value.__class__.__name__, value)
+            return Error.REVERT
+        if isinstance(value, (float, Decimal)) and not math.isfinite(value):
+            logger.warning("%s.%s at %s: %s cannot be stored", address, key, ts, value)
+            return None
+        if isinstance(value, (int, float, Decimal)) and abs(value) >= self._max_value:
+            logger.warning("%s.%s at %s: %s exceeds max value for db", address, key, ts, value)
+            return None
+        return value
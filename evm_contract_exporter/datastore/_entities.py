@@ -0,0 +1,251 @@
+"""
+Batched creation of the `Address` entities our datastores need before they can write data for a contract.
+
+Addresses are queued as they're seen, then resolved together: the ERC20 metadata and uniswap pool probe for the whole batch go out in one round of `aggregate3` calls,
+the pool token symbols in a second one, and the resulting entities are inserted in a single transaction.
+Anything the multicall can't classify cleanly, like a bytes32 `symbol`, falls back to the slower per-address path that knows about those quirks.
+"""
+
+import asyncio
+import logging
+from functools import cached_property
+from typing import Any, Dict, List, NoReturn, Optional, Set, Tuple, Type
+
+import a_sync
+import eth_abi
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
+from y import ERC20, Network, NonStandardERC20
+from y.contracts import is_contract
+from y.prices.dex.uniswap.v2 import UniswapV2Pool
+
+from evm_contract_exporter import db, types
+from evm_contract_exporter._multicall import _multicall_deploy_block, aggregate3
+from evm_contract_exporter.utils import _get_height, get_batch, rate_limited
+
+logger = logging.getLogger(__name__)
+
+_BATCH_SIZE = 500
+_BATCH_LATENCY = 0.5
+_MAX_ATTEMPTS = 3
+"""How many times the per-address path tries to fetch the metadata for an address before we insert it without any"""
+_RETRY_DELAY = 5
+
+_Entity = Tuple[Type[db.Address], Dict[str, Any]]
+
+_ERC20_CALLS = {
+    "name": "name()(string)",
+    "symbol": "symbol()(string)",
+    "decimals": "decimals()(uint8)",
+}
+_POOL_CALLS = {
+    "reserves": "getReserves()(uint112,uint112,uint32)",
+    "supply": "totalSupply()(uint256)",
+    "token0": "token0()(address)",
+    "token1": "token1()(address)",
+}
+
+_entity_semaphore = a_sync.Semaphore(5_000, name='evm_contract_exporter entity semaphore')
+"""an `a_sync.Semaphore` used to limit concurrency of the per-address fallback so not to block the threadpools"""
+
+
+class EntityEnricher:
+    """Collects addresses that need an entity in the db and resolves them in batches"""
+    def __init__(self, chainid: int) -> None:
+        self.chainid = chainid
+        self._known: Set[types.address] = set()
+        """Addresses we know have an entity. Each batch checks the db for its addresses first, so we don't need to preload these."""
+        self._symbols: Dict[types.address, Optional[str]] = {}
+        """The symbols of pool underlyings. None means the token is non-standard."""
+        self._pending: Dict[types.address, asyncio.Future] = {}
+        self._queue: a_sync.Queue[types.address] = a_sync.Queue()
+
+    async def ensure(self, address: types.address) -> None:
+        """Ensure `address` is associated with an object in the database"""
+        if address in self._known:
+            return
+        if address not in self._pending:
+            # ensure daemon is running
+            self._daemon_task
+            self._pending[address] = asyncio.get_running_loop().create_future()
+            self._queue.put_nowait(address)
+        await asyncio.shield(self._pending[address])
+
+    @cached_property
+    def _daemon_task(self) -> "asyncio.Task[NoReturn]":
+        return asyncio.create_task(self._daemon())
+
+    async def _daemon(self) -> NoReturn:
+        while True:
+            addresses = await get_batch(self._queue, _BATCH_SIZE, _BATCH_LATENCY)
+            # NOTE: we don't wait for a batch to finish before collecting the next one
+            asyncio.create_task(self._resolve_batch(addresses))
+
+    async def _resolve_batch(self, addresses: List[types.address]) -> None:
+        try:
+            existing = await db.read_threads.run(db.Address.existing, self.chainid, addresses)
+            self._known.update(existing)
+            if todo := [address for address in addresses if address not in self._known]:
+                await self._resolve(todo)
+        except Exception as e:
+            logger.info("%s when ensuring entities for %s addresses on %s: %s", e.__class__.__name__, len(addresses), Network(self.chainid), e)
+        finally:
+            for address in addresses:
+                self._pending.pop(address).set_result(None)
+
+    async def _resolve(self, addresses: List[types.address]) -> None:
+        if await _multicall_deploy_block() is None:
+            # NOTE: there's no Multicall3 on this chain, so we can't batch
+            await asyncio.gather(*map(self._resolve_one, addresses))
+            return
+        results = await _multicall(addresses, {**_ERC20_CALLS, **_POOL_CALLS})
+        pools = {address for address in addresses if _is_pool(results[address])}
+        await self._fetch_symbols({results[pool][token] for pool in pools for token in ("token0", "token1")})
+
+        entities: List[_Entity] = []
+        fallback: List[types.address] = []
+        bare: List[types.address] = []
+        non_tokens: List[types.address] = []
+        for address in addresses:
+            name, symbol, decimals = (results[address][k] for k in _ERC20_CALLS)
+            if name is None and symbol is None and decimals is None:
+                non_tokens.append(address)
+            elif not name or not symbol:
+                # NOTE: this could be bytes32 or some other quirk that our multicall signatures can't decode
+                fallback.append(address)
+            elif decimals is None:
+                # Could be a NFT
+                entities.append((db.Token, {"chainid": self.chainid, "address": address, "name": name, "symbol": symbol}))
+            elif address not in pools:
+                entities.append((db.ERC20, {"chainid": self.chainid, "address": address, "name": name, "symbol": symbol, "decimals": decimals}))
+            elif None in (token_symbols := tuple(self._symbols[results[address][token]] for token in ("token0", "token1"))):
+                logger.info("Non-standard underlying token for %s", address)
+                bare.append(address)
+            else:
+                extra = " ({}/{})".format(*token_symbols)
+                entities.append((db.ERC20, {"chainid": self.chainid, "address": address, "name": name + extra, "symbol": symbol + extra, "decimals": decimals}))
+
+        if non_tokens:
+            codes = await asyncio.gather(*[rate_limited(lambda address=address: db.read_threads.run(is_contract, address)) for address in non_tokens])
+            entities.extend(
+                (db.Contract if has_code else db.Address, {"chainid": self.chainid, "address": address})
+                for address, has_code in zip(non_tokens, codes)
+            )
+        # NOTE: the datastores still need a row to point at for these, even without metadata
+        entities.extend((db.Address, {"chainid": self.chainid, "address": address}) for address in bare)
+        if entities:
+            await db.write_threads.run(db.Address.insert_entities, entities)
+            self._known.update(kwargs["address"] for _, kwargs in entities)
+            logger.debug("inserted %s entities on %s", len(entities), Network(self.chainid))
+        if fallback:
+            await asyncio.gather(*[self._resolve_one(address) for address in fallback])
+
+    async def _fetch_symbols(self, tokens: Set[types.address]) -> None:
+        if todo := [token for token in tokens if token not in self._symbols]:
+            results = await _multicall(todo, {"symbol": _ERC20_CALLS["symbol"]})
+            for token in todo:
+                if (symbol := results[token]["symbol"]) is None:
+                    try:
+                        symbol = await ERC20(token, asynchronous=True).symbol
+                    except NonStandardERC20:
+                        pass
+                self._symbols[token] = symbol
+
+    async def _resolve_one(self, address: types.address) -> None:
+        """The unbatched path, for addresses with metadata our multicall can't handle"""
+        for attempt in range(1, _MAX_ATTEMPTS + 1):
+            try:
+                await self._try_resolve_one(address)
+                return
+            except Exception as e:
+                if attempt == _MAX_ATTEMPTS:
+                    logger.info('%s when ensuring entity for %s on %s, inserting it without metadata: %s', e.__class__.__name__, address, Network(self.chainid), e)
+                    await self._insert_bare(address)
+                    return
+                logger.info('%s when ensuring entity for %s on %s, retrying: %s', e.__class__.__name__, address, Network(self.chainid), e)
+                await asyncio.sleep(_RETRY_DELAY * attempt)
+
+    async def _try_resolve_one(self, address: types.address) -> None:
+        kwargs = {'chainid': self.chainid, 'address': address}
+        try:
+            async with _entity_semaphore:
+                erc20 = ERC20(address, asynchronous=True)
+                name, symbol, decimals = await asyncio.gather(rate_limited(lambda: erc20.name), rate_limited(lambda: erc20.symbol), rate_limited(lambda: erc20.decimals))
+                if await (pool:=UniswapV2Pool(address, asynchronous=True)).is_uniswap_pool():
+                    token0, token1 = await asyncio.gather(pool.token0, pool.token1)
+                    if not isinstance(token0, ERC20):
+                        token0 = ERC20(token0, asynchronous=True)
+                    if not isinstance(token1, ERC20):
+                        token1 = ERC20(token1, asynchronous=True)
+                    try:
+                        token0_symbol, token1_symbol = await asyncio.gather(token0.symbol, token1.symbol)
+                    except NonStandardERC20:
+                        logger.info("Non-standard underlying token for %s", address)
+                        await self._insert_bare(address)
+                        return
+                    extra = f" ({token0_symbol}/{token1_symbol})"
+                    name += extra
+                    symbol += extra
+                await db.write_threads.run(db.ERC20.insert_entity, **kwargs, name=name, symbol=symbol, decimals=decimals)
+        except NonStandardERC20 as e:
+            if 'decimals' in str(e):
+                # Could be a NFT
+                # TODO: implement this but raise for now..  with suppress(NonStandardERC20):
+                kwargs['name'], kwargs['symbol'] = await asyncio.gather(erc20.name, erc20.symbol)
+                await db.write_threads.run(db.Token.insert_entity, **kwargs)
+            elif await db.read_threads.run(is_contract, address):
+                await db.write_threads.run(db.Contract.insert_entity, **kwargs)
+            else:
+                await db.write_threads.run(db.Address.insert_entity, **kwargs)
+        except AssertionError as e:
+            if 'probe' not in str(e):
+                if str(e) != 'uint112,uint112':  # this just addresses an easter egg that needs fixin' in ypricemagic
+                    raise
+            logger.info('investigate probe issue %s on %s', address, Network(self.chainid))
+            await self._insert_bare(address)
+            return
+        self._known.add(address)
+
+    async def _insert_bare(self, address: types.address) -> None:
+        """Inserts `address` without any metadata, so the datastores can still write data for it"""
+        await db.write_threads.run(db.Address.insert_entity, chainid=self.chainid, address=address)
+        self._known.add(address)
+
+
+async def ensure_entity(chainid: int, address: types.address) -> None:
+    """Ensure `address` is associated with an object in the database"""
+    await _get_enricher(chainid).ensure(address)
+
+_enrichers: Dict[int, EntityEnricher] = {}
+
+def _get_enricher(chainid: int) -> EntityEnricher:
+    if chainid not in _enrichers:
+        _enrichers[chainid] = EntityEnricher(chainid)
+    return _enrichers[chainid]
+
+async def _multicall(addresses: List[types.address], signatures: Dict[str, str]) -> Dict[types.address, Dict[str, Any]]:
+    """Calls every signature in `signatures` on every address in `addresses` at the head in `aggregate3` batches. Failed calls return None."""
+    parsed = {key: _parse_signature(signature) for key, signature in signatures.items()}
+    calls = [(address, selector) for address in addresses for selector, _ in parsed.values()]
+    results = iter(await aggregate3(calls, await _get_height()))
+    return {address: {key: _decode(output_types, *next(results)) for key, (_, output_types) in parsed.items()} for address in addresses}
+
+def _parse_signature(signature: str) -> Tuple[bytes, List[str]]:
+    """Returns the selector and output types of a signature like `getReserves()(uint112,uint112,uint32)`"""
+    end = signature.index(")") + 1
+    return function_signature_to_4byte_selector(signature[:end]), signature[end + 1:-1].split(",")
+
+def _decode(output_types: List[str], success: bool, returndata: bytes) -> Any:
+    """Returns the output of a call, or a tuple of them if there are several. None if the call failed or doesn't decode as `output_types`."""
+    if not success:
+        return None
+    try:
+        outputs = eth_abi.decode(output_types, returndata)
+    except Exception:
+        # NOTE: this is how we see non-contracts and quirks like a bytes32 `symbol`
+        return None
+    outputs = tuple(to_checksum_address(output) if output_type == "address" else output for output_type, output in zip(output_types, outputs))
+    return outputs[0] if len(outputs) == 1 else outputs
+
+def _is_pool(results: Dict[str, Any]) -> bool:
+    # NOTE: we don't need the reserves, just to know that `getReserves` succeeded
+    return results["reserves"] is not None and bool(results["supply"] and results["token0"] and results["token1"])
@@ -0,0 +1,646 @@
+import asyncio
+import logging
+from brownie.convert.datatypes import ReturnValue
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from functools import cached_property, partial
+from pathlib import Path
+from time import time
+from typing import Any, DefaultDict, Dict, Iterable, Iterator, List, NoReturn, Optional, Set, Tuple
+
+import a_sync
+from async_lru import alru_cache
+from generic_exporters import Metric
+#from generic_exporters.plan import ReturnValue
+from msgspec import Struct
+from pony.orm import InterfaceError, OperationalError, select
+from y import Network
+
+from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
+from evm_contract_exporter import _rollup, db, types
+from evm_contract_exporter._exceptions import FixMe
+from evm_contract_exporter._index import Run, StepFunction, TimestampIndex, epoch, from_epoch, update_runs
+from evm_contract_exporter._spool import Offset, Spool
+from evm_contract_exporter.datastore._base import ContractTimeSeriesDataStoreBase
+from evm_contract_exporter.datastore._entities import ensure_entity
+from evm_contract_exporter.db import changes, read, rollup
+from evm_contract_exporter.metric import _ContractCallMetricBase
+from evm_contract_exporter.utils import get_batch, get_block_at_timestamp
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+_FIXED_POINT = 10 ** 18
+_MAX_EPOCH = 2 ** 62
+_RETENTION_INTERVAL = 60 * 60
+"""How often, in seconds, the retention daemon prunes old rows"""
+_TRANSIENT_ERRORS = OperationalError, InterfaceError
+"""Errors that mean the db is unavailable, not that the rows are bad. We retry these until the db comes back."""
+_MIN_BACKOFF, _MAX_BACKOFF = 1, 300
+
+logger = logging.getLogger(__name__)
+
+class GenericContractTimeSeriesKeyValueStore(ContractTimeSeriesDataStoreBase):
+    _entity = db.ContractDataTimeSeriesKV
+    _columns = "address_chainid", "address_address", "metric", "timestamp", "blockno", "value"
+    _rollups = True
+    """False if this store can't keep rollups, even when `DB_ROLLUPS` is set"""
+    def __init__(self, chain_id: int) -> None:
+        super().__init__(chain_id)
+        self._addresses: Set[types.address] = set()
+        self._rollup_lock = asyncio.Lock()
+        self._insert_queue: a_sync.Queue["BulkInsertItem"] = a_sync.Queue()
+        self._pending_inserts: DefaultDict["BulkInsertItem", asyncio.Future] = defaultdict(lambda: asyncio.get_event_loop().create_future())
+        self._exc: Optional[Exception] = None
+        self.__errd = False  # we flip this true for token/method combos that have err issues. TODO: debug this
+        self._spool = Spool(Path(str(ENVS.SPOOL_PATH)) / f"chainid={chain_id}" / self._entity.__name__) if ENVS.DB_SPOOL else None
+        self._spooled: DefaultDict["BulkInsertItem", List[Offset]] = defaultdict(list)
+
+        class BulkInsertItem(Struct, frozen=True):
+            # TODO refactor this
+            address: types.address
+            metric: Any
+            timestamp: datetime
+            block: int
+            value: Decimal
+            def __await__(item) -> None:
+                logger.debug("inserting %s", item)
+                # ensure daemon is running
+                self._bulk_insert_daemon_task
+                if self._exc:
+                    raise self._exc
+                if self._spool is not None:
+                    self._spooled[item].append(self._spool.append(self._to_record(item)))
+                self._insert_queue.put_nowait(item)
+                return self._pending_inserts[item].__await__()
+            def __iter__(item) -> Iterator:
+                """Yields the row in the same order as `_columns`"""
+                return iter(self._to_row(item))
+            @classmethod
+            async def bulk_insert(cls, items: List["self.BulkInsertItem"]) -> None:
+                logger.info('starting bulk insert for %s items', len(items))
+                try:
+                    await self._ingest(items)
+                except (KeyError, *_TRANSIENT_ERRORS):
+                    raise
+                except Exception as e:
+                    if len(items) == 1:
+                        if (item := items[0]) in self._pending_inserts:
+                            # NOTE: why is this not always here?
+                            self._pending_inserts.pop(items[0]).set_exception(e)
+                        # NOTE: this row will never go in, there's no point in replaying it
+                        self._ack(items)
+                        return
+                    # NOTE: duplicate keys are ignored by the db so this only happens for genuinely bad rows, we bisect the batch so only those rows fail
+                    #       one half at a time, so a batch full of bad rows costs 2n-1 inserts in sequence instead of n at once
+                    logger.info("%s %s when performing bulk insert of length %s, isolating the offending rows", e.__class__.__name__, e, len(items))
+                    middle = len(items) // 2
+                    await cls.bulk_insert(items[:middle])
+                    await cls.bulk_insert(items[middle:])
+                    return
+                self._ack(items)
+                try:
+                    await self._index_inserted(items)
+                finally:
+                    # NOTE: we resolve the inserts last, so a caller never sees its datapoint before the change store has written its coverage
+                    for item in items:
+                        # item may have already been popped with Future result set
+                        if item in self._pending_inserts:
+                            self._pending_inserts.pop(item).set_result(None)
+                logger.info("bulk insert complete")
+        
+        self.BulkInsertItem = BulkInsertItem
+        self.push = a_sync.ProcessingQueue(self._push, num_workers=10_000, return_data=False)
+    
+    async def read(self, address: types.address, keys: Iterable[str], start: Optional[datetime] = None, end: Optional[datetime] = None, drop_reverts: bool = False, exact: bool = False) -> "pd.DataFrame":
+        """
+        Reads the stored values of `keys` for `address` between `start` and `end`, inclusive, in one query.
+        Returns a float64 DataFrame indexed by utc timestamp with a column for each key. Missing datapoints are NaN, and so are reverts if `drop_reverts` is True.
+        If `exact` is True the columns hold the Decimals as stored instead.
+        """
+        _check_pandas()
+        keys = list(keys)
+        start_epoch = 0 if start is None else epoch(start)
+        end_epoch = _MAX_EPOCH if end is None else epoch(end)
+        rows = await db.read_threads.run(read.read_rows, self._entity, self.chainid, address, keys, start_epoch, end_epoch)
+        if drop_reverts:
+            rows = [row for row in rows if not self._is_revert(row[2])]
+        frame = await self._to_frame(address, rows, exact)
+        wide = frame.pivot(index="timestamp", columns="metric", values="value").reindex(columns=keys)
+        wide.columns.name = None
+        return wide
+    
+    async def read_asof(self, address: types.address, keys: Iterable[str], timestamp: datetime) -> "pd.DataFrame":
+        """
+        Returns the last stored value at or before `timestamp` of each of `keys` for `address`.
+        The DataFrame is indexed by key and has the `timestamp` of each value alongside it. Keys with no value are NaN.
+        """
+        _check_pandas()
+        keys = list(keys)
+        rows = await db.read_threads.run(read.read_asof, self._entity, self.chainid, address, keys, epoch(timestamp))
+        return (await self._to_frame(address, rows)).set_index("metric").reindex(keys)
+    
+    def _is_revert(self, value: Any) -> bool:
+        """Returns True if `value`, as returned by the db driver, is the marker we store for a reverted call"""
+        return float(value) == db.Error.REVERT
+    
+    # NOTE: the annotation is a string because `read` is the method above here, not the module
+    async def _to_frame(self, address: types.address, rows: "List[read.Row]", exact: bool = False) -> "pd.DataFrame":
+        frame = pd.DataFrame(rows, columns=["metric", "timestamp", "value"])
+        frame["timestamp"] = pd.to_datetime(frame["timestamp"], unit="s", utc=True)
+        frame["value"] = frame["value"].map(_decimal).astype(object) if exact else frame["value"].astype("float64")
+        return frame
+    
+    async def _get_indexes(self, address: types.address) -> DefaultDict[str, TimestampIndex]:
+        return await get_cached_datapoints_for_address(self.chainid, address)
+
+    async def _push(self, address: types.address, key: Any, ts: datetime, value: "ReturnValue", metric: Optional[Metric] = None) -> None:
+        """Exports `data` to Victoria Metrics using `key` somehow. lol"""
+        if self._retention_enabled:
+            self._addresses.add(address)
+            # ensure daemon is running
+            self._retention_daemon_task
+        value = self._prepare_value(address, key, ts, value)
+        if value is None:
+            return
+        # NOTE: we know by this point in the code execution, the block is already in the block time index so this won't hit the rpc
+        block = await get_block_at_timestamp(ts)
+        await self._insert(self.BulkInsertItem(address, key, ts, block, value))
+    
+    async def _insert(self, item: "BulkInsertItem") -> None:
+        try:
+            await item
+            logger.debug('exported %s', item)
+        except InvalidOperation as e:
+            if not self.__errd:
+                logger.info("%s %s for %s scalevalue=%s", e.__class__.__name__, e, item, len(str(item.value).split('.')[0]))
+                logger.info("bob will fix this before pushing the lib to prod")
+                self.__errd = True
+                raise FixMe(e) from None
+    
+    async def _ingest(self, items: List["BulkInsertItem"]) -> None:
+        if not self._rollups_enabled:
+            await db.write_threads.run(db.ingest, self._entity, self._columns, items)
+            return
+        async with self._rollup_lock:
+            # NOTE: we must check which rows are new before we insert them, duplicates are ignored by the db but would be counted twice in the rollups
+            new_rows = await self._new_rows(items)
+            for metric in {metric for _, metric, _, _ in new_rows}:
+                await db.write_threads.run(db.MetricName.get_or_insert_id, metric)
+            # NOTE: the rollups are updated in the same transaction as the insert so they can't drift from the rows
+            await db.write_threads.run(db.ingest, self._entity, self._columns, items, partial(rollup.update_rollups, self.chainid, new_rows))
+    
+    def _to_row(self, item: "BulkInsertItem") -> Tuple:
+        return self.chainid, item.address, item.metric, item.timestamp, item.block, _db_value(item.value)
+    
+    def _to_record(self, item: "BulkInsertItem") -> List:
+        # NOTE: reverts are spooled as null so a replay can still tell them apart from a real -1
+        value = None if item.value is db.Error.REVERT else str(item.value)
+        return [item.address, item.metric, item.timestamp.isoformat(), item.block, value]
+    
+    async def _from_record(self, record: List) -> "BulkInsertItem":
+        address, metric, timestamp, block, value = record
+        return self.BulkInsertItem(address, metric, datetime.fromisoformat(timestamp), block, db.Error.REVERT if value is None else Decimal(value))
+    
+    def _ack(self, items: List["BulkInsertItem"]) -> None:
+        if self._spool is not None:
+            self._spool.ack(offset for item in items for offset in self._spooled.pop(item, ()))
+    
+    async def _index_inserted(self, items: List["BulkInsertItem"]) -> None:
+        """Adds freshly inserted `items` to the in-memory timestamp indexes so `data_exists` sees them without a reload"""
+        indexes = {address: await self._get_indexes(address) for address in {item.address for item in items}}
+        for item in items:
+            indexes[item.address][item.metric].add(item.timestamp)
+    
+    @property
+    def _rollups_enabled(self) -> bool:
+        return self._rollups and bool(ENVS.DB_ROLLUPS)
+    
+    @property
+    def _retention_enabled(self) -> bool:
+        return self._rollups_enabled and ENVS.DB_RETENTION_DAYS > 0
+    
+    async def _new_rows(self, items: List["BulkInsertItem"]) -> List[rollup.Row]:
+        """Returns the rollup rows for the members of `items` that aren't in the datastore yet"""
+        indexes = {address: await self._get_indexes(address) for address in {item.address for item in items}}
+        rows = {
+            (item.address, item.metric, epoch(item.timestamp)): item.value
+            for item in items
+            if item.timestamp not in indexes[item.address][item.metric]
+        }
+        return [(*key, value) for key, value in rows.items()]
+    
+    @cached_property
+    def _retention_daemon_task(self) -> "asyncio.Task[NoReturn]":
+        return asyncio.create_task(self._retention_daemon())
+    
+    async def _retention_daemon(self) -> NoReturn:
+        while True:
+            cutoff = _rollup.bucket_start(int(time()) - ENVS.DB_RETENTION_DAYS * _rollup.DAY, _rollup.DAY)
+            for address in list(self._addresses):
+                try:
+                    async with self._rollup_lock:
+                        watermark = await db.write_threads.run(rollup.prune, self.chainid, address, self._entity, cutoff)
+                except Exception as e:
+                    logger.warning("%s %s when pruning %s", e.__class__.__name__, e, address)
+                    continue
+                if watermark is not None:
+                    _set_floor(await self._get_indexes(address), watermark)
+            await asyncio.sleep(_RETENTION_INTERVAL)
+    
+    @cached_property
+    def _bulk_insert_daemon_task(self) -> "asyncio.Task[NoReturn]":
+        return asyncio.create_task(self._bulk_insert_daemon())
+            
+    async def _bulk_insert_daemon(self) -> NoReturn:
+        try:
+            if self._spool is not None:
+                await self._replay_spool()
+            while True:
+                logger.info('waiting for next bulk insert')
+                items: List[self.BulkInsertItem] = await get_batch(self._insert_queue, ENVS.BULK_INSERT_MAX_ROWS, ENVS.BULK_INSERT_MAX_LATENCY)
+                await self._bulk_insert_with_backoff(items)
+        except Exception as e:
+            self._exc = e
+            raise e
+    
+    async def _bulk_insert_with_backoff(self, items: List["BulkInsertItem"]) -> None:
+        """Inserts `items`, waiting for the db to come back if it's unavailable instead of failing every pending insert"""
+        delay = _MIN_BACKOFF
+        while True:
+            try:
+                return await self.BulkInsertItem.bulk_insert(items)
+            except _TRANSIENT_ERRORS as e:
+                logger.warning("%s %s when inserting %s rows, retrying in %ss", e.__class__.__name__, e, len(items), delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _MAX_BACKOFF)
+    
+    async def _replay_spool(self) -> None:
+        """Inserts the datapoints that were spooled but not acknowledged by a previous run"""
+        records = self._spool.replay()
+        if not records:
+            return
+        logger.info("replaying %s spooled datapoints for %s", len(records), self)
+        items = []
+        for offset, record in records:
+            item = await self._from_record(record)
+            self._spooled[item].append(offset)
+            items.append(item)
+        for i in range(0, len(items), ENVS.BULK_INSERT_MAX_ROWS):
+            await self._bulk_insert_with_backoff(items[i:i + ENVS.BULK_INSERT_MAX_ROWS])
+
+
+class GenericContractTimeSeriesKeyValueStoreV2(GenericContractTimeSeriesKeyValueStore):
+    """
+    Stores data in the compact v2 schema, see `db.ContractDataTimeSeriesV2`, with integer metric ids and epoch timestamps.
+    Existing data can be moved over with `evm_contract_exporter.db.migrate.migrate_kv_to_v2`.
+    """
+    _entity = db.ContractDataTimeSeriesV2
+    def __init__(self, chain_id: int) -> None:
+        super().__init__(chain_id)
+        self._metric_ids: Dict[str, int] = {}
+    
+    async def _get_indexes(self, address: types.address) -> DefaultDict[str, TimestampIndex]:
+        return await get_cached_datapoints_for_address_v2(self.chainid, address)
+    
+    async def _push(self, address: types.address, key: Any, ts: datetime, value: "ReturnValue", metric: Optional[Metric] = None) -> None:
+        await self._metric_id(key)
+        await super()._push(address, key, ts, value, metric)
+    
+    async def _metric_id(self, key: str) -> int:
+        if key not in self._metric_ids:
+            self._metric_ids[key] = await db.write_threads.run(db.MetricName.get_or_insert_id, key)
+        return self._metric_ids[key]
+    
+    def _to_row(self, item: "BulkInsertItem") -> Tuple:
+        return self.chainid, item.address, self._metric_ids[item.metric], epoch(item.timestamp), item.block, _db_value(item.value)
+    
+    async def _from_record(self, record: List) -> "BulkInsertItem":
+        item = await super()._from_record(record)
+        await self._metric_id(item.metric)
+        return item
+
+
+class GenericContractTimeSeriesRawStore(GenericContractTimeSeriesKeyValueStoreV2):
+    """
+    Stores unscaled integer results exactly, up to uint256/int256, with the scale recorded once per metric in `db.MetricScale`.
+    Scaling is applied at read time with `get_scale` or the `contractdatatimeseriesscaled` view, so there's no Decimal division in the export loop
+    and big values like reserves and cumulative prices are no longer dropped.
+
+    Metrics that aren't contract calls, like math results, are stored as fixed point integers with a scale of 10**18.
+    Every integer is a valid raw value so reverts are stored as NULL, and read back as `Error.REVERT` like the other stores.
+    """
+    _entity = db.ContractDataTimeSeriesRaw
+    _max_value = 2 ** 256
+    # NOTE: the rollup table holds scaled decimals, we don't convert raw values at insert time
+    _rollups = False
+    raw = True
+    def __init__(self, chain_id: int) -> None:
+        super().__init__(chain_id)
+        self._scales: Dict[Tuple[types.address, str], Decimal] = {}
+        self._multipliers: Dict[Tuple[types.address, str], int] = {}
+    
+    async def get_scale(self, address: types.address, key: str) -> Decimal:
+        """Returns the scale to divide the raw values of `key` for `address` by"""
+        if (address, key) not in self._scales:
+            scale = await db.read_threads.run(db.MetricScale.get_scale, self.chainid, address, await self._metric_id(key))
+            if scale is None:
+                raise KeyError(f"no scale recorded for {key} on {address}")
+            self._scales[address, key] = scale
+        return self._scales[address, key]
+    
+    async def _get_indexes(self, address: types.address) -> DefaultDict[str, TimestampIndex]:
+        return await get_cached_datapoints_for_address_raw(self.chainid, address)
+    
+    def _is_revert(self, value: Any) -> bool:
+        return value is None
+    
+    async def _to_frame(self, address: types.address, rows: List[read.Row], exact: bool = False) -> "pd.DataFrame":
+        frame = await super()._to_frame(address, rows, exact)
+        scales = {key: await self.get_scale(address, key) for key in frame["metric"].unique()}
+        if exact:
+            frame["value"] = [None if value is None else value / scales[key] for key, value in zip(frame["metric"], frame["value"])]
+        else:
+            frame["value"] /= frame["metric"].map({key: float(scale) for key, scale in scales.items()})
+        frame.loc[[self._is_revert(value) for _, _, value in rows], "value"] = db.Error.REVERT
+        return frame
+    
+    async def _push(self, address: types.address, key: Any, ts: datetime, value: "ReturnValue", metric: Optional[Metric] = None) -> None:
+        if (address, key) not in self._multipliers:
+            await self._record_scale(address, key, metric)
+        await super()._push(address, key, ts, value, metric)
+    
+    async def _record_scale(self, address: types.address, key: str, metric: Optional[Metric]) -> None:
+        if isinstance(metric, _ContractCallMetricBase):
+            # NOTE: the exporter pushes the unscaled output of contract calls, see `ContractCallMetric.produce_raw`
+            scale = Decimal(await metric.get_scale()) if metric._should_scale else Decimal(1)
+            multiplier = 1
+        else:
+            scale, multiplier = Decimal(_FIXED_POINT), _FIXED_POINT
+        await db.write_threads.run(db.MetricScale.set_scale, self.chainid, address, await self._metric_id(key), scale)
+        self._scales[address, key] = scale
+        self._multipliers[address, key] = multiplier
+    
+    def _prepare_value(self, address: types.address, key: Any, ts: datetime, value: Any) -> Optional[int]:
+        value = super()._prepare_value(address, key, ts, value)
+        if value is None or value is db.Error.REVERT:
+            return value
+        return int(value * self._multipliers[address, key])
+    
+    def _to_row(self, item: "BulkInsertItem") -> Tuple:
+        # NOTE: we pass the value as a string so sqlite doesn't parse big ints into floats. -1 is a valid raw value so reverts are written as NULL.
+        value = None if item.value is db.Error.REVERT else str(item.value)
+        return self.chainid, item.address, self._metric_ids[item.metric], epoch(item.timestamp), item.block, value
+
+
+class GenericContractTimeSeriesChangeStore(GenericContractTimeSeriesKeyValueStoreV2):
+    """
+    Only stores a value when it differs from the previous one for that (address, metric), in `db.ContractDataTimeSeriesChanges`,
+    which cuts the row count way down for metrics that rarely change like fees, caps and admin params.
+    The timestamps each series was observed at are kept in `db.ContractDataCoverage`, so `data_exists` knows an unchanged timestamp is present,
+    and `read` expands the changes back into a value at every observed timestamp.
+    """
+    _entity = db.ContractDataTimeSeriesChanges
+    # NOTE: a rollup of the changes alone would have the wrong averages and counts
+    _rollups = False
+    def __init__(self, chain_id: int) -> None:
+        super().__init__(chain_id)
+        self._coverage_lock = asyncio.Lock()
+        self._redundant: DefaultDict[Tuple[types.address, str, int], List[int]] = defaultdict(list)
+        """{(address, key, epoch of a change): [epochs of the changes it made redundant]}, the rows are deleted when the change is inserted"""
+    
+    async def read(self, address: types.address, keys: Iterable[str], start: Optional[datetime] = None, end: Optional[datetime] = None, drop_reverts: bool = False, exact: bool = False) -> "pd.DataFrame":
+        """
+        Returns the same frame as `GenericContractTimeSeriesKeyValueStore.read`, with a row for each observed timestamp.
+        NOTE: This reads from memory, so it includes datapoints that are still waiting to be inserted.
+        """
+        _check_pandas()
+        keys = list(keys)
+        series = await self._get_series(address)
+        start_epoch = 0 if start is None else epoch(start)
+        end_epoch = _MAX_EPOCH if end is None else epoch(end)
+        columns = {}
+        for key in keys:
+            timestamps = series.observed[key].between(start_epoch, end_epoch).tolist()
+            index = pd.to_datetime(timestamps, unit="s", utc=True)
+            values = series.steps[key].expand(timestamps)
+            columns[key] = pd.Series([_decimal(value) for value in values] if exact else values, index=index, dtype=object if exact else "float64")
+            if drop_reverts:
+                columns[key] = columns[key][columns[key] != db.Error.REVERT]
+        wide = pd.concat(columns, axis=1).sort_index()
+        wide.index.name = "timestamp"
+        return wide
+    
+    async def read_asof(self, address: types.address, keys: Iterable[str], timestamp: datetime) -> "pd.DataFrame":
+        """Returns the same frame as `GenericContractTimeSeriesKeyValueStore.read_asof`, with the last timestamp each key was observed at"""
+        _check_pandas()
+        keys = list(keys)
+        series = await self._get_series(address)
+        rows = []
+        for key in keys:
+            if (seconds := series.observed[key].at_or_before(timestamp)) is not None:
+                rows.append((key, seconds, series.steps[key].at(seconds)))
+        return (await self._to_frame(address, rows)).set_index("metric").reindex(keys)
+    
+    async def _get_indexes(self, address: types.address) -> DefaultDict[str, TimestampIndex]:
+        return (await self._get_series(address)).observed
+    
+    async def _get_series(self, address: types.address) -> "ChangeSeries":
+        return await get_cached_changes_for_address(self.chainid, address)
+    
+    async def _push(self, address: types.address, key: Any, ts: datetime, value: "ReturnValue", metric: Optional[Metric] = None) -> None:
+        await self._metric_id(key)
+        value = self._prepare_value(address, key, ts, value)
+        if value is None:
+            return
+        series = await self._get_series(address)
+        # NOTE: we know by this point in the code execution, the block is already in the block time index so this won't hit the rpc
+        block = await get_block_at_timestamp(ts)
+        observed = series.observed[key]
+        if ts in observed:
+            return
+        # NOTE: nothing can be awaited between here and `observed.add` or a concurrent push could see a stale step function
+        writes, removed = series.steps[key].observe(observed, ts, value)
+        observed.add(ts)
+        for seconds in removed:
+            # NOTE: a redundant change that was still waiting to be inserted hands us the rows it was going to delete
+            self._redundant[address, key, epoch(ts)].extend((seconds, *self._redundant.pop((address, key, seconds), ())))
+        # NOTE: unchanged datapoints still go through the insert queue, that's where their coverage is written once the changes before them are in
+        items = [self.BulkInsertItem(address, key, ts, block, value)]
+        for seconds, previous in writes:
+            if seconds != epoch(ts):
+                # an earlier observation of this series that kept its value until now, it needs its own row
+                items.append(self.BulkInsertItem(address, key, from_epoch(seconds), await get_block_at_timestamp(from_epoch(seconds)), previous))
+        await asyncio.gather(*map(self._insert, items))
+    
+    async def _ingest(self, items: List["BulkInsertItem"]) -> None:
+        rows = [item for item in items if await self._is_change(item)]
+        if not rows:
+            return
+        redundant = {(item.address, item.metric, epoch(item.timestamp)): self._redundant.pop((item.address, item.metric, epoch(item.timestamp)), []) for item in rows}
+        deletes = [(address, self._metric_ids[key], seconds) for (address, key, _), epochs in redundant.items() for seconds in epochs]
+        try:
+            # NOTE: the redundant rows are deleted in the same transaction that inserts the changes that replace them
+            await db.write_threads.run(db.ingest, self._entity, self._columns, rows, partial(changes.delete_changes, self.chainid, deletes) if deletes else None)
+        except BaseException:
+            for key, epochs in redundant.items():
+                if epochs:
+                    self._redundant[key].extend(epochs)
+            raise
+    
+    async def _is_change(self, item: "BulkInsertItem") -> bool:
+        series = await self._get_series(item.address)
+        if item.timestamp not in series.observed[item.metric]:
+            # NOTE: this was replayed from the spool so we don't know if it was a change. We store it anyway, an extra row doesn't change the step function.
+            series.steps[item.metric].set(item.timestamp, item.value)
+            series.observed[item.metric].add(item.timestamp)
+            return True
+        return item.timestamp in series.steps[item.metric]
+    
+    async def _index_inserted(self, items: List["BulkInsertItem"]) -> None:
+        """
+        Writes the coverage of the series in `items`. We only cover timestamps that are fully inserted so a crash can't leave a gap in a step function.
+        Only the runs next to the new timestamps are rewritten.
+        """
+        # NOTE: the lock keeps our coverage writes in the same order as the in-memory runs they were computed from
+        async with self._coverage_lock:
+            added: DefaultDict[Tuple[types.address, str], List[datetime]] = defaultdict(list)
+            for item in items:
+                committed = (await self._get_series(item.address)).committed[item.metric]
+                if item.timestamp not in committed:
+                    committed.add(item.timestamp)
+                    added[item.address, item.metric].append(item.timestamp)
+            updates = {}
+            for (address, key), timestamps in added.items():
+                series = await self._get_series(address)
+                updates[address, self._metric_ids[key]] = update_runs(series.coverage[key], series.committed[key], timestamps)
+            if updates:
+                await db.write_threads.run(changes.update_coverage, self.chainid, updates)
+
+
+class ChangeSeries:
+    """The in-memory state of the change-only series for one address"""
+    __slots__ = "observed", "committed", "coverage", "steps"
+    def __init__(self, coverage: Dict[str, List[Run]], changed: Dict[str, List[changes.Change]]) -> None:
+        self.observed: DefaultDict[str, TimestampIndex] = defaultdict(TimestampIndex, {key: TimestampIndex.from_runs(runs) for key, runs in coverage.items()})
+        """Every timestamp pushed for each key, including those still waiting to be inserted"""
+        self.committed: DefaultDict[str, TimestampIndex] = defaultdict(TimestampIndex, {key: TimestampIndex.from_runs(runs) for key, runs in coverage.items()})
+        """The timestamps for each key that are fully inserted, which is what we write to the coverage table"""
+        self.coverage: DefaultDict[str, List[Run]] = defaultdict(list, {key: sorted(runs) for key, runs in coverage.items()})
+        """The runs in the coverage table for each key, which cover `committed`"""
+        self.steps: DefaultDict[str, StepFunction] = defaultdict(StepFunction, {key: StepFunction(points) for key, points in changed.items()})
+
+
+def get_default_datastore(chainid: int) -> GenericContractTimeSeriesKeyValueStore:
+    """Returns the KV store for `chainid` that matches `DB_RAW_VALUES`, `DB_CHANGES_ONLY` and `DB_SCHEMA_VERSION`"""
+    if ENVS.DB_RAW_VALUES:
+        if ENVS.DB_CHANGES_ONLY:
+            logger.warning("DB_CHANGES_ONLY can't be combined with DB_RAW_VALUES, every raw value will be stored")
+        return GenericContractTimeSeriesRawStore.get_for_chain(chainid)
+    if ENVS.DB_CHANGES_ONLY:
+        return GenericContractTimeSeriesChangeStore.get_for_chain(chainid)
+    if ENVS.DB_SCHEMA_VERSION == 2:
+        return GenericContractTimeSeriesKeyValueStoreV2.get_for_chain(chainid)
+    return GenericContractTimeSeriesKeyValueStore.get_for_chain(chainid)
+
+async def get_cached_timestamps(chainid: int, address: types.address, key: str) -> TimestampIndex:
+    """return the index of all timestamps currently present for `key` for `address` on chain `chainid`"""
+    indexes = await get_cached_datapoints_for_address(chainid, address)
+    return indexes[key]
+
+@alru_cache(maxsize=None)
+async def get_cached_datapoints_for_address(chainid: int, address: types.address) -> DefaultDict[str, TimestampIndex]:
+    """
+    query a dict {key: TimestampIndex} which contains all timestamps currently present for each known metric for `address` on chain `chainid`
+    
+    NOTE: This is loaded from the db once and then kept up to date in place by `bulk_insert`, so we never need to reload it.
+    """
+    await ensure_entity(chainid, address)
+    indexes = await db.read_threads.run(_timestamps_present, chainid, address)
+    logger.debug("timestamps found for %s on %s: %s", address, Network(chainid), {k: len(v) for k, v in indexes.items()})
+    return indexes
+
+@alru_cache(maxsize=None)
+async def get_cached_datapoints_for_address_v2(chainid: int, address: types.address) -> DefaultDict[str, TimestampIndex]:
+    """The v2 schema version of `get_cached_datapoints_for_address`"""
+    await ensure_entity(chainid, address)
+    indexes = await db.read_threads.run(_timestamps_present_v2, chainid, address)
+    logger.debug("timestamps found for %s on %s: %s", address, Network(chainid), {k: len(v) for k, v in indexes.items()})
+    return indexes
+
+@db.session
+def _timestamps_present(chainid: int, address: types.address) -> DefaultDict[str, TimestampIndex]:
+    """query a dict {key: TimestampIndex} which contains all timestamps currently present for each known metric for `address` on chain `chainid`"""
+    query = select(
+        (d.metric, d.timestamp)
+        for d in db.ContractDataTimeSeriesKV 
+        if d.address.chainid == chainid 
+        and d.address.address == address
+    )
+    present: DefaultDict[str, List[datetime]] = defaultdict(list)
+    for key, datetimedata in query:
+        if isinstance(datetimedata, str):
+            # when using sqlite provider
+            present[key].append(datetime.fromisoformat(datetimedata))
+        elif isinstance(datetimedata, datetime):
+            # when using postgres provider
+            present[key].append(datetimedata.astimezone(timezone.utc))
+        else:
+            raise TypeError(datetimedata)
+    logger.debug("timestamps present for %s: %s", address, {k: len(v) for k, v in present.items()})
+    return _to_indexes(present, rollup.get_watermark(chainid, address))
+
+@alru_cache(maxsize=None)
+async def get_cached_datapoints_for_address_raw(chainid: int, address: types.address) -> DefaultDict[str, TimestampIndex]:
+    """The raw value version of `get_cached_datapoints_for_address`"""
+    await ensure_entity(chainid, address)
+    indexes = await db.read_threads.run(_timestamps_present_v2, chainid, address, db.ContractDataTimeSeriesRaw)
+    logger.debug("timestamps found for %s on %s: %s", address, Network(chainid), {k: len(v) for k, v in indexes.items()})
+    return indexes
+
+@alru_cache(maxsize=None)
+async def get_cached_changes_for_address(chainid: int, address: types.address) -> ChangeSeries:
+    """The change-only version of `get_cached_datapoints_for_address`, with the stored changes alongside the observed timestamps"""
+    await ensure_entity(chainid, address)
+    series = ChangeSeries(*await db.read_threads.run(changes.load_series, chainid, address))
+    logger.debug("timestamps found for %s on %s: %s", address, Network(chainid), {k: len(v) for k, v in series.observed.items()})
+    return series
+
+@db.session
+def _timestamps_present_v2(chainid: int, address: types.address, entity: db.db.Entity = db.ContractDataTimeSeriesV2) -> DefaultDict[str, TimestampIndex]:
+    """The v2 schema version of `_timestamps_present`. Timestamps are stored as epoch seconds so there's no per-row parsing."""
+    query = select(
+        (d.metric.name, d.timestamp)
+        for d in entity
+        if d.address.chainid == chainid
+        and d.address.address == address
+    )
+    present: DefaultDict[str, List[int]] = defaultdict(list)
+    for key, timestamp in query:
+        present[key].append(timestamp)
+    logger.debug("timestamps present for %s: %s", address, {k: len(v) for k, v in present.items()})
+    return _to_indexes(present, rollup.get_watermark(chainid, address))
+
+def _to_indexes(present: Dict[str, List[Any]], floor: Optional[int]) -> DefaultDict[str, TimestampIndex]:
+    """Builds the {key: TimestampIndex} for an address. Data before `floor` was pruned by the retention policy, so it counts as present for every key."""
+    return defaultdict(partial(TimestampIndex, floor=floor), {key: TimestampIndex(timestamps, floor) for key, timestamps in present.items()})
+
+def _set_floor(indexes: DefaultDict[str, TimestampIndex], floor: int) -> None:
+    for index in indexes.values():
+        index.floor = floor
+    indexes.default_factory = partial(TimestampIndex, floor=floor)
+
+def _db_value(value: Any) -> Any:
+    # NOTE: the scaled tables store reverts in-band, we have to force the marker into an int here or it won't insert properly to sql
+    return int(value) if value is db.Error.REVERT else value
+
+def _decimal(value: Any) -> Optional[Decimal]:
+    # NOTE: the driver can hand numerics back as Decimal, int, str or float depending on the db, the str round trip keeps what's shown
+    return value if value is None or isinstance(value, Decimal) else Decimal(str(value))
+
+def _check_pandas() -> None:
+    if pd is None:
+        raise ImportError("Cannot find library `pandas`. You must `pip install pandas` before you can use this functionality.")
@@ -0,0 +1,97 @@
+import atexit
+import csv
+import logging
+from array import array
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, DefaultDict, Iterator, Optional, Tuple
+
+import a_sync
+from generic_exporters import Metric
+
+from evm_contract_exporter import types
+from evm_contract_exporter._index import TimestampIndex, epoch
+from evm_contract_exporter.datastore._base import ContractTimeSeriesDataStoreBase
+from evm_contract_exporter.utils import get_block_at_timestamp
+
+logger = logging.getLogger(__name__)
+
+
+class _Columns:
+    """The datapoints for one (address, metric), in the order they were pushed"""
+    __slots__ = "timestamps", "blocks", "values"
+    def __init__(self) -> None:
+        self.timestamps = array("q")
+        self.blocks = array("q")
+        self.values = array("d")
+    def __len__(self) -> int:
+        return len(self.timestamps)
+    def append(self, timestamp: int, block: int, value: float) -> None:
+        self.timestamps.append(timestamp)
+        self.blocks.append(block)
+        self.values.append(value)
+    def sorted(self) -> Tuple["array[int]", "array[int]", "array[float]"]:
+        order = sorted(range(len(self)), key=self.timestamps.__getitem__)
+        return (
+            array("q", map(self.timestamps.__getitem__, order)),
+            array("q", map(self.blocks.__getitem__, order)),
+            array("d", map(self.values.__getitem__, order)),
+        )
+
+
+class InMemoryTimeSeriesDataStore(ContractTimeSeriesDataStoreBase):
+    """
+    Keeps every datapoint in memory, in typed arrays for each (address, metric), and never touches the db.
+    Use it as a baseline for benchmarks, or for short-lived jobs. If you pass `dump_path` the data is written there as csv when the process exits.
+
+    NOTE: Values are kept as float64 so they lose precision past ~15 significant digits.
+    """
+    def __init__(self, chain_id: int, dump_path: Optional[str] = None) -> None:
+        super().__init__(chain_id)
+        self._indexes: DefaultDict[types.address, DefaultDict[str, TimestampIndex]] = defaultdict(lambda: defaultdict(TimestampIndex))
+        self._columns: DefaultDict[Tuple[types.address, str], _Columns] = defaultdict(_Columns)
+        self.push = a_sync.ProcessingQueue(self._push, num_workers=10_000, return_data=False)
+        if dump_path is not None:
+            atexit.register(self.dump, dump_path)
+
+    def __len__(self) -> int:
+        return sum(map(len, self._columns.values()))
+
+    def series(self, address: types.address, key: str) -> Tuple["array[int]", "array[int]", "array[float]"]:
+        """Returns (epochs, blocks, values) for `key` on `address`, ordered by timestamp"""
+        if (address, key) not in self._columns:
+            return array("q"), array("q"), array("d")
+        return self._columns[address, key].sorted()
+
+    def dump(self, path: str) -> None:
+        """Writes every datapoint to a csv file at `path`"""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("chainid", "address", "metric", "timestamp", "block", "value"))
+            writer.writerows(self._rows())
+        logger.info("dumped %s datapoints from %s to %s", len(self), self, path)
+
+    async def _get_indexes(self, address: types.address) -> DefaultDict[str, TimestampIndex]:
+        return self._indexes[address]
+
+    async def _push(self, address: types.address, key: Any, ts: datetime, value: Any, metric: Optional[Metric] = None) -> None:
+        value = self._prepare_value(address, key, ts, value)
+        if value is None:
+            return
+        index = self._indexes[address][key]
+        if ts in index:
+            return
+        # NOTE: we mark it present before we await anything, so a concurrent push of the same datapoint is skipped too
+        index.add(ts)
+        try:
+            # NOTE: we know by this point in the code execution, the block is already in the block time index so this won't hit the rpc
+            block = await get_block_at_timestamp(ts)
+        except BaseException:
+            index.discard(ts)
+            raise
+        self._columns[address, key].append(epoch(ts), block, float(value))
+
+    def _rows(self) -> Iterator[Tuple[Any, ...]]:
+        for (address, key), columns in self._columns.items():
+            for timestamp, block, value in zip(*columns.sorted()):
+                yield self.chainid, address, key, timestamp, block, value
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from decimal import Context, Decimal
+from functools import cached_property
+from pathlib import Path
+from typing import Any, DefaultDict, Dict, Iterable, List, NoReturn, Optional, Set, Tuple
+from uuid import uuid4
+
+import a_sync
+from async_lru import alru_cache
+from generic_exporters import Metric
+from msgspec import Struct
+
+from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
+from evm_contract_exporter import types
+from evm_contract_exporter._index import TimestampIndex
+from evm_contract_exporter.datastore._base import ContractTimeSeriesDataStoreBase
+from evm_contract_exporter.utils import get_batch, get_block_at_timestamp
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+logger = logging.getLogger(__name__)
+
+_INDEX_METADATA_KEY = b"evm_contract_exporter.index"
+"""The footer metadata key that holds {metric: [(first, step, count), ...]} for the timestamps in a file"""
+_COMPACTED_METADATA_KEY = b"evm_contract_exporter.compacted"
+"""The footer metadata key that holds the names of the part files a compacted file replaces, so we can finish a compaction that was interrupted before it deleted them"""
+
+# NOTE: we quantize with a wider context than the default so 20 integer digits + 18 decimals never lose precision
+_DECIMAL_CONTEXT = Context(prec=38)
+_SCALE = Decimal(10) ** -18
+
+_io_threads = a_sync.AsyncThreadPoolExecutor(8, thread_name_prefix="evm_contract_exporter__parquet_thread")
+
+
+class _Row(Struct, frozen=True):
+    address: types.address
+    metric: str
+    timestamp: datetime
+    block: int
+    value: Any
+
+
+class ParquetTimeSeriesDataStore(ContractTimeSeriesDataStoreBase):
+    """
+    Stores contract metrics in columnar parquet files partitioned by chain, address and month:
+    `{root}/chainid={chainid}/address={address}/month={YYYY-MM}/part-{uuid}.parquet`
+
+    Metric names are dictionary-encoded and files are zstd-compressed. Each file carries an index of the timestamps it holds in its footer,
+    so `data_exists` is served from footers alone and the row data is only read for analytics via `read_table`.
+
+    NOTE: Values are always stored scaled, this store doesn't support `DB_RAW_VALUES`.
+    """
+    raw = False
+    def __init__(self, chain_id: int, root: Optional[str] = None) -> None:
+        if pa is None:
+            raise ImportError("Cannot find library `pyarrow`. You must `pip install pyarrow` before you can use this functionality.")
+        super().__init__(chain_id)
+        if ENVS.DB_RAW_VALUES:
+            logger.warning("%s can't store raw values, DB_RAW_VALUES is ignored and every value will be stored scaled", self.__class__.__name__)
+        self.root = Path(root or str(ENVS.PARQUET_PATH)) / f"chainid={chain_id}"
+        self._write_lock = threading.Lock()
+        """Held while files are written or compacted, so a compaction never races the write daemon"""
+        self._write_queue: a_sync.Queue[Tuple[_Row, asyncio.Future]] = a_sync.Queue()
+        self._exc: Optional[Exception] = None
+        self.push = a_sync.ProcessingQueue(self._push, num_workers=10_000, return_data=False)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} chainid={self.chainid} root={self.root}>"
+
+    def read_table(self, address: types.address, keys: Optional[Iterable[str]] = None, start: Optional[datetime] = None, end: Optional[datetime] = None) -> "pa.Table":
+        """Reads the stored data for `address` into a pyarrow Table. Row groups outside the requested keys and time range are skipped using the footer statistics."""
+        directory = self._address_dir(address)
+        if not directory.exists():
+            return _SCHEMA.empty_table()
+        with self._write_lock:
+            for month in directory.glob("month=*"):
+                _live_parts(month)
+        filters = []
+        if keys is not None:
+            filters.append(("metric", "in", list(keys)))
+        if start is not None:
+            filters.append(("timestamp", ">=", start))
+        if end is not None:
+            filters.append(("timestamp", "<=", end))
+        return pq.read_table(directory, filters=filters or None, partitioning="hive").drop_columns(["month"])
+
+    def compact(self, address: types.address) -> None:
+        """
+        Merges the part files in each month partition for `address` into a single file.
+        It's safe to interrupt, the merged file lists the parts it replaces and whichever of them are left behind are deleted the next time the partition is loaded.
+        """
+        with self._write_lock:
+            for directory in self._address_dir(address).glob("month=*"):
+                parts = _live_parts(directory)
+                if len(parts) < 2:
+                    continue
+                table = pa.concat_tables([pq.read_table(path, schema=_SCHEMA) for path in parts])
+                self._write_file(directory, table, _footer_indexes(parts), compacted=[path.name for path in parts])
+                for path in parts:
+                    path.unlink()
+                logger.info("compacted %s files in %s", len(parts), directory)
+
+    @alru_cache(maxsize=None)
+    async def _get_indexes(self, address: types.address) -> DefaultDict[str, TimestampIndex]:
+        """
+        Loads {key: TimestampIndex} for `address` from the file footers.
+
+        NOTE: This is loaded from disk once and then kept up to date in place by `_push`, so we never need to reload it.
+        """
+        paths = await _io_threads.run(self._live_paths, address)
+        indexes = await _io_threads.run(_footer_indexes, paths)
+        logger.debug("timestamps found for %s in %s files: %s", address, len(paths), {k: len(v) for k, v in indexes.items()})
+        return indexes
+
+    async def _push(self, address: types.address, key: Any, ts: datetime, value: Any, metric: Optional[Metric] = None) -> None:
+        value = self._prepare_value(address, key, ts, value)
+        if value is None:
+            return
+        index = (await self._get_indexes(address))[key]
+        if ts in index:
+            # NOTE: files are append-only so we skip data we already have instead of writing a duplicate
+            return
+        # NOTE: we mark it present before we await anything, so a concurrent push of the same datapoint is skipped too
+        index.add(ts)
+        try:
+            # NOTE: we know by this point in the code execution, the block is already in the block time index so this won't hit the rpc
+            block = await get_block_at_timestamp(ts)
+            # ensure daemon is running
+            self._write_daemon_task
+            if self._exc:
+                raise self._exc
+            future = asyncio.get_running_loop().create_future()
+            self._write_queue.put_nowait((_Row(address, key, ts, block, value), future))
+            await future
+        except BaseException:
+            # NOTE: the row never made it to disk
+            index.discard(ts)
+            raise
+
+    @cached_property
+    def _write_daemon_task(self) -> "asyncio.Task[NoReturn]":
+        return asyncio.create_task(self._write_daemon())
+
+    async def _write_daemon(self) -> NoReturn:
+        try:
+            while True:
+                batch = await get_batch(self._write_queue, ENVS.BULK_INSERT_MAX_ROWS, ENVS.BULK_INSERT_MAX_LATENCY)
+                rows = [row for row, _ in batch]
+                try:
+                    await _io_threads.run(self._write, rows)
+                except Exception as e:
+                    logger.info("%s %s when writing %s rows", e.__class__.__name__, e, len(rows))
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+                for _, future in batch:
+                    future.set_result(None)
+        except Exception as e:
+            self._exc = e
+            raise e
+
+    def _live_paths(self, address: types.address) -> List[Path]:
+        with self._write_lock:
+            return [path for directory in self._address_dir(address).glob("month=*") for path in _live_parts(directory)]
+
+    def _write(self, rows: List[_Row]) -> None:
+        with self._write_lock:
+            self._write_partitions(rows)
+
+    def _write_partitions(self, rows: List[_Row]) -> None:
+        partitions: DefaultDict[Tuple[types.address, str], List[_Row]] = defaultdict(list)
+        for row in rows:
+            partitions[row.address, row.timestamp.astimezone(timezone.utc).strftime("%Y-%m")].append(row)
+        for (address, month), partition in partitions.items():
+            # NOTE: sorting keeps each metric's timestamps together which makes the row group statistics and compression much better
+            partition.sort(key=lambda row: (row.metric, row.timestamp))
+            indexes: DefaultDict[str, TimestampIndex] = defaultdict(TimestampIndex)
+            for row in partition:
+                indexes[row.metric].add(row.timestamp)
+            table = pa.Table.from_arrays(
+                [
+                    pa.array([row.metric for row in partition], pa.string()).dictionary_encode(),
+                    pa.array([row.timestamp for row in partition], _SCHEMA.field("timestamp").type),
+                    pa.array([row.block for row in partition], pa.int64()),
+                    pa.array([_DECIMAL_CONTEXT.quantize(Decimal(row.value), _SCALE) for row in partition], _SCHEMA.field("value").type),
+                ],
+                schema=_SCHEMA,
+            )
+            self._write_file(self._address_dir(address) / f"month={month}", table, indexes)
+
+    @staticmethod
+    def _write_file(directory: Path, table: "pa.Table", indexes: Dict[str, TimestampIndex], compacted: Iterable[str] = ()) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        metadata = {**(table.schema.metadata or {}), _INDEX_METADATA_KEY: json.dumps({key: index.runs() for key, index in indexes.items()})}
+        if compacted:
+            metadata[_COMPACTED_METADATA_KEY] = json.dumps(list(compacted))
+        path = directory / f"part-{uuid4().hex}.parquet"
+        tmp = directory / f".{path.name}.tmp"
+        pq.write_table(table.replace_schema_metadata(metadata), tmp, compression="zstd")
+        # NOTE: the rename is atomic so readers never see a partial file
+        os.replace(tmp, path)
+
+    def _address_dir(self, address: types.address) -> Path:
+        return self.root / f"address={address}"
+
+
+def _live_parts(directory: Path) -> List[Path]:
+    """Returns the part files in the month partition at `directory`, after deleting any that were already merged into a compacted file"""
+    parts = sorted(directory.glob("*.parquet"))
+    compacted: Set[str] = set()
+    for path in parts:
+        if names := (pq.read_metadata(path).metadata or {}).get(_COMPACTED_METADATA_KEY):
+            compacted.update(json.loads(names))
+    for path in parts:
+        if path.name in compacted:
+            logger.info("deleting %s, it was compacted by an interrupted run", path)
+            path.unlink()
+    return [path for path in parts if path.name not in compacted]
+
+def _footer_indexes(paths: Iterable[Path]) -> DefaultDict[str, TimestampIndex]:
+    """Merges the timestamp indexes from the footers of the parquet files at `paths` without reading any row data"""
+    runs: DefaultDict[str, list] = defaultdict(list)
+    for path in paths:
+        for key, key_runs in json.loads(pq.read_metadata(path).metadata[_INDEX_METADATA_KEY]).items():
+            runs[key].extend(key_runs)
+    return defaultdict(TimestampIndex, {key: TimestampIndex.from_runs(key_runs) for key, key_runs in runs.items()})
+
+
+if pa is not None:
+    _SCHEMA = pa.schema([
+        ("metric", pa.dictionary(pa.int32(), pa.string())),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("block", pa.int64()),
+        ("value", pa.decimal128(38, 18)),
+    ])
@@ -3,3 +3,4 @@ from evm_contract_exporter.db.common import db_session as session
 from evm_contract_exporter.db.common import read_threads, write_threads
 from evm_contract_exporter.db.entities import *
 from evm_contract_exporter.db.errors import Error
+from evm_contract_exporter.db.ingest import ingest, insert_or_ignore
@@ -0,0 +1,92 @@
+"""
+Encoders for postgres' binary COPY format. This module only depends on the stdlib so it can be used and tested without a db.
+
+https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+"""
+
+import struct
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Sequence
+
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+TRAILER = struct.pack(">h", -1)
+
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_NUMERIC_POS = 0x0000
+_NUMERIC_NEG = 0x4000
+_NUMERIC_NAN = 0xC000
+
+
+def encode_int4(value: int) -> bytes:
+    return struct.pack(">i", value)
+
+def encode_int8(value: int) -> bytes:
+    return struct.pack(">q", value)
+
+def encode_text(value: str) -> bytes:
+    return value.encode()
+
+def encode_timestamp(value: datetime) -> bytes:
+    """Encodes `value` as microseconds since 2000-01-01 UTC. Naive datetimes are assumed to be UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _PG_EPOCH
+    return struct.pack(">q", (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds)
+
+def encode_numeric(value: Any) -> bytes:
+    """Encodes `value` as a postgres numeric, which is a list of base-10000 digits plus a weight, sign and display scale."""
+    if not isinstance(value, Decimal):
+        value = Decimal(str(int(value)) if isinstance(value, bool) else str(value))
+    if value.is_nan():
+        return struct.pack(">hhHh", 0, 0, _NUMERIC_NAN, 0)
+    if value.is_infinite():
+        raise ValueError(f"cannot encode {value} as numeric")
+    sign, digits, exponent = value.as_tuple()
+    coefficient = "".join(map(str, digits))
+    if exponent >= 0:
+        integer, fraction = coefficient + "0" * exponent, ""
+    elif len(coefficient) > -exponent:
+        integer, fraction = coefficient[:exponent], coefficient[exponent:]
+    else:
+        integer, fraction = "", coefficient.rjust(-exponent, "0")
+    dscale = len(fraction)
+    integer = integer.rjust(-(-len(integer) // 4) * 4, "0")
+    fraction = fraction.ljust(-(-len(fraction) // 4) * 4, "0")
+    groups = [int(integer[i:i+4]) for i in range(0, len(integer), 4)]
+    weight = len(groups) - 1
+    groups += (int(fraction[i:i+4]) for i in range(0, len(fraction), 4))
+    # postgres stores numerics without leading or trailing zero digits
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        return struct.pack(">hhHh", 0, 0, _NUMERIC_POS, dscale)
+    return struct.pack(f">hhHh{len(groups)}h", len(groups), weight, _NUMERIC_NEG if sign else _NUMERIC_POS, dscale, *groups)
+
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {
+    "int4": encode_int4,
+    "int8": encode_int8,
+    "text": encode_text,
+    "timestamp": encode_timestamp,
+    "numeric": encode_numeric,
+}
+
+def encode_rows(types: Sequence[str], rows: Iterable[Iterable[Any]]) -> bytes:
+    """Returns a complete binary COPY payload for `rows`, each of which holds one value for each of the postgres `types`"""
+    encoders = [ENCODERS[t] for t in types]
+    field_count = struct.pack(">h", len(encoders))
+    chunks = [HEADER]
+    for row in rows:
+        chunks.append(field_count)
+        for encode, value in zip(encoders, row):
+            if value is None:
+                chunks.append(b"\xff\xff\xff\xff")
+            else:
+                data = encode(value)
+                chunks.append(struct.pack(">i", len(data)))
+                chunks.append(data)
+    chunks.append(TRAILER)
+    return b"".join(chunks)
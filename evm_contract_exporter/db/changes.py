@@ -0,0 +1,66 @@
+"""
+Storage for change-only series. Rows in `ContractDataTimeSeriesChanges` are only written when a value changes,
+and the timestamps each series was observed at are kept in `ContractDataCoverage` as compact runs.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import DefaultDict, Dict, Iterable, List, Tuple
+
+from pony.orm import commit, select
+
+from evm_contract_exporter import types
+from evm_contract_exporter._index import Run
+from evm_contract_exporter.db.common import db_session
+from evm_contract_exporter.db.entities import ContractDataCoverage, ContractDataTimeSeriesChanges
+
+Change = Tuple[int, Decimal]
+"""(epoch, value)"""
+
+
+@db_session
+def load_series(chainid: int, address: types.address) -> Tuple[Dict[str, List[Run]], Dict[str, List[Change]]]:
+    """Returns ({metric: coverage runs}, {metric: changes}) for every change-only series stored for `address`"""
+    coverage: DefaultDict[str, List[Run]] = defaultdict(list)
+    query = select(
+        (c.metric.name, c.first, c.step, c.count)
+        for c in ContractDataCoverage
+        if c.address.chainid == chainid
+        and c.address.address == address
+    )
+    for metric, first, step, count in query:
+        coverage[metric].append((first, step, count))
+    changes: DefaultDict[str, List[Change]] = defaultdict(list)
+    query = select(
+        (d.metric.name, d.timestamp, d.value)
+        for d in ContractDataTimeSeriesChanges
+        if d.address.chainid == chainid
+        and d.address.address == address
+    )
+    for metric, timestamp, value in query:
+        changes[metric].append((timestamp, value))
+    return coverage, changes
+
+def delete_changes(chainid: int, changes: Iterable[Tuple[types.address, int, int]]) -> None:
+    """
+    Deletes the change rows at each (address, metric id, epoch) in `changes`.
+    This doesn't commit, call it inside the transaction that inserts the earlier changes that made them redundant.
+    """
+    for address, metric_id, seconds in changes:
+        select(
+            d for d in ContractDataTimeSeriesChanges
+            if d.address.chainid == chainid and d.address.address == address and d.metric.id == metric_id and d.timestamp == seconds
+        ).delete(bulk=True)
+
+@db_session
+def update_coverage(chainid: int, updates: Dict[Tuple[types.address, int], Tuple[List[int], List[Run]]]) -> None:
+    """Applies ([first epoch of each run to remove], [runs to insert]) to the coverage runs of each (address, metric id) in `updates`, see `_index.update_runs`"""
+    for (address, metric_id), (removed, inserted) in updates.items():
+        if removed:
+            select(
+                c for c in ContractDataCoverage
+                if c.address.chainid == chainid and c.address.address == address and c.metric.id == metric_id and c.first in removed
+            ).delete(bulk=True)
+        for first, step, count in inserted:
+            ContractDataCoverage(address=(chainid, address), metric=metric_id, first=first, step=step, count=count)
+    commit()
@@ -1,6 +1,41 @@
 
+import threading
+from functools import wraps
+
 import pony.orm
+from a_sync import AsyncThreadPoolExecutor
 from generic_exporters.processors.exporters.datastores.default import read_threads, write_threads
 from y._db.common import retry_locked
 
-db_session = lambda fn: retry_locked(pony.orm.db_session(fn))
\ No newline at end of file
+from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
+
+SQLITE_TUNED = ENVS.DB_PROVIDER == "sqlite" and bool(ENVS.SQLITE_TUNING)
+
+if SQLITE_TUNED:
+    # NOTE: pony keeps one connection per thread, so a single write thread means every write goes through one long-lived connection.
+    #       In WAL mode the readers in `read_threads` don't block it and it doesn't block them.
+    write_threads = AsyncThreadPoolExecutor(1, thread_name_prefix="evm_contract_exporter__write_thread")
+
+_setup_lock = threading.Lock()
+_is_setup = False
+
+def setup_db() -> None:
+    """Binds the db and generates the mapping the first time it's called. Nothing touches the db until then, so importing the package stays cheap."""
+    global _is_setup
+    if _is_setup:
+        return
+    with _setup_lock:
+        if not _is_setup:
+            # NOTE: we import here because entities imports this module
+            from evm_contract_exporter.db.entities import _bind
+            _bind()
+            _is_setup = True
+
+def db_session(fn):
+    """`pony.orm.db_session` with retries for a locked db, which also makes sure the db is set up before `fn` runs"""
+    session = retry_locked(pony.orm.db_session(fn))
+    @wraps(fn)
+    def db_session_wrap(*args, **kwargs):
+        setup_db()
+        return session(*args, **kwargs)
+    return db_session_wrap
@@ -2,13 +2,13 @@
 import errno
 import logging
 from datetime import datetime
-from decimal import Decimal
+from decimal import Decimal, localcontext
 from functools import lru_cache
 from os import mkdir
+from typing import Any, Dict, List, Tuple, Type, Union
 
-from brownie import chain
 from pony.orm import (Database, LongStr, ObjectNotFound, Optional, PrimaryKey,
-                      Required, Set, TransactionIntegrityError, commit, db_session, select)
+                      Required, Set, TransactionIntegrityError, commit, db_session, rollback, select)
 
 from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
 from evm_contract_exporter import types
@@ -30,6 +30,13 @@ class Address(db.Entity):
     wallets_funded = Set("Address")
     contracts_deployed = Set("Contract")
     time_series_kv_data = Set("ContractDataTimeSeriesKV")
+    time_series_v2_data = Set("ContractDataTimeSeriesV2")
+    time_series_raw_data = Set("ContractDataTimeSeriesRaw")
+    time_series_changes_data = Set("ContractDataTimeSeriesChanges")
+    coverage = Set("ContractDataCoverage")
+    metric_scales = Set("MetricScale")
+    rollups = Set("ContractDataRollup")
+    retention_watermark = Optional("RetentionWatermark")
 
     @classmethod
     @common.db_session
@@ -57,6 +64,29 @@ class Address(db.Entity):
         else:
             logger.debug("inserted %s to db", entity)
 
+    @classmethod
+    @common.db_session
+    def existing(cls, chainid: int, addresses: List[types.address]) -> List[types.address]:
+        """Returns the members of `addresses` that already have an entity in the db"""
+        return select(a.address for a in cls if a.chainid == chainid and a.address in addresses)[:]
+
+    @staticmethod
+    def insert_entities(entities: List[Tuple[Type["Address"], Dict[str, Any]]]) -> None:
+        """Inserts [(entity_cls, kwargs), ...] in one transaction, falling back to one at a time if another thread beat us to any of them"""
+        try:
+            Address._insert_entities(entities)
+        except TransactionIntegrityError:
+            for entity_cls, kwargs in entities:
+                entity_cls.insert_entity(**kwargs)
+
+    @staticmethod
+    @common.db_session
+    def _insert_entities(entities: List[Tuple[Type["Address"], Dict[str, Any]]]) -> None:
+        for entity_cls, kwargs in entities:
+            entity_cls(**kwargs)
+        commit()
+        logger.debug("inserted %s entities to db", len(entities))
+
 
 class Contract(Address):
     deployer = Optional(Address)
@@ -98,6 +128,144 @@ class ContractDataTimeSeriesKV(db.Entity):
     value = Required(Decimal, precision=38, scale=18)
 
 
+class MetricName(db.Entity):
+    """A dictionary of metric keys so the v2 data table can store a small int instead of repeating the full key on every row"""
+    id = PrimaryKey(int, auto=True)
+    name = Required(str, unique=True)
+    time_series_v2_data = Set("ContractDataTimeSeriesV2")
+    time_series_raw_data = Set("ContractDataTimeSeriesRaw")
+    time_series_changes_data = Set("ContractDataTimeSeriesChanges")
+    coverage = Set("ContractDataCoverage")
+    metric_scales = Set("MetricScale")
+    rollups = Set("ContractDataRollup")
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    @common.db_session
+    def get_or_insert_id(cls, name: str) -> int:
+        if entity := cls.get(name=name):
+            return entity.id
+        try:
+            entity = cls(name=name)
+            commit()
+        except TransactionIntegrityError:
+            # another thread has already added it
+            rollback()
+            return cls.get(name=name).id
+        logger.debug("inserted %s to db", entity)
+        return entity.id
+
+
+class ContractDataTimeSeriesV2(db.Entity):
+    """The compact version of `ContractDataTimeSeriesKV` with integer metric ids and timestamps stored as epoch seconds"""
+    address = Required(Address, reverse="time_series_v2_data")
+    metric = Required(MetricName)
+    timestamp = Required(int, size=64)
+    PrimaryKey(address, metric, timestamp)
+
+    blockno = Required(int)
+    value = Required(Decimal, precision=38, scale=18)
+
+
+# NOTE: sqlite silently rounds integers over 2**63 to floats in a numeric column so we store the big ones as text there
+_BIG_DECIMAL_OPTIONS = {"sql_type": "TEXT"} if ENVS.DB_PROVIDER == "sqlite" else {}
+# NOTE: pony quantizes decimals in the thread's decimal context, the default 28 digits can't hold a 78 digit scale
+_BIG_DECIMAL_PRECISION = 96
+
+
+class ContractDataTimeSeriesRaw(db.Entity):
+    """Unscaled integer results, stored exactly up to uint256/int256. Divide by the `MetricScale` for the metric to get the real value."""
+    address = Required(Address, reverse="time_series_raw_data")
+    metric = Required(MetricName)
+    timestamp = Required(int, size=64)
+    PrimaryKey(address, metric, timestamp)
+
+    blockno = Required(int)
+    # NOTE: pony requires a positive scale, 79 digits with 1 decimal place still fits every uint256 and int256
+    value = Optional(Decimal, precision=79, scale=1, **_BIG_DECIMAL_OPTIONS)
+    """The raw value, or NULL if the call reverted. Every int256 is a valid value so we can't use an in-band marker here."""
+
+
+class MetricScale(db.Entity):
+    """The scale to divide a metric's raw values by, stored once per metric instead of on every row"""
+    address = Required(Address, reverse="metric_scales")
+    metric = Required(MetricName)
+    PrimaryKey(address, metric)
+
+    scale = Required(Decimal, precision=78, scale=18, **_BIG_DECIMAL_OPTIONS)
+
+    @classmethod
+    @common.db_session
+    def get_scale(cls, chainid: int, address: types.address, metric_id: int) -> Union[Decimal, None]:
+        with localcontext() as ctx:
+            ctx.prec = _BIG_DECIMAL_PRECISION
+            entity = cls.get(address=(chainid, address), metric=metric_id)
+            return None if entity is None else entity.scale
+
+    @classmethod
+    @common.db_session
+    def set_scale(cls, chainid: int, address: types.address, metric_id: int, scale: Decimal) -> None:
+        with localcontext() as ctx:
+            ctx.prec = _BIG_DECIMAL_PRECISION
+            if entity := cls.get(address=(chainid, address), metric=metric_id):
+                if entity.scale != scale:
+                    logger.warning("scale for %s %s changed from %s to %s", address, entity.metric.name, entity.scale, scale)
+                    entity.scale = scale
+            else:
+                cls(address=(chainid, address), metric=metric_id, scale=scale)
+            commit()
+
+
+class ContractDataRollup(db.Entity):
+    """
+    A downsampled series derived from the stored data, kept up to date as new rows are inserted.
+    `resolution` is the width of the bucket in seconds and `bucket` is the epoch it starts at. The average is `sum_value / samples`.
+    """
+    address = Required(Address, reverse="rollups")
+    metric = Required(MetricName)
+    resolution = Required(int)
+    bucket = Required(int, size=64)
+    PrimaryKey(address, metric, resolution, bucket)
+
+    last_timestamp = Required(int, size=64)
+    last_value = Required(Decimal, precision=38, scale=18)
+    min_value = Required(Decimal, precision=38, scale=18)
+    max_value = Required(Decimal, precision=38, scale=18)
+    sum_value = Required(Decimal, precision=48, scale=18)
+    samples = Required(int)
+
+
+class ContractDataTimeSeriesChanges(db.Entity):
+    """
+    Like `ContractDataTimeSeriesV2` but a row is only written when the value changes.
+    The series holds the value of its last change at every timestamp in its `ContractDataCoverage`.
+    """
+    address = Required(Address, reverse="time_series_changes_data")
+    metric = Required(MetricName)
+    timestamp = Required(int, size=64)
+    PrimaryKey(address, metric, timestamp)
+
+    blockno = Required(int)
+    value = Required(Decimal, precision=38, scale=18)
+
+
+class ContractDataCoverage(db.Entity):
+    """The timestamps observed for a series in `ContractDataTimeSeriesChanges`, as `count` epochs spaced `step` seconds apart starting at `first`"""
+    address = Required(Address, reverse="coverage")
+    metric = Required(MetricName)
+    first = Required(int, size=64)
+    PrimaryKey(address, metric, first)
+
+    step = Required(int, size=64)
+    count = Required(int, size=64)
+
+
+class RetentionWatermark(db.Entity):
+    """The retention policy has deleted every row for `address` from before `pruned_before`, only their rollups remain"""
+    address = PrimaryKey(Address, reverse="retention_watermark")
+    pruned_before = Required(int, size=64)
+
+
 def _ensure_storage_path_exists(sqlite_path: str) -> None:
     try:
         mkdir(sqlite_path)
@@ -107,27 +275,58 @@ def _ensure_storage_path_exists(sqlite_path: str) -> None:
         if e.errno != errno.EEXIST:
             raise
 
-# TODO: make configurable
-if ENVS.DB_PROVIDER == "sqlite":
-    _ensure_storage_path_exists(ENVS.SQLITE_PATH)  # type: ignore [arg-type]
-    db.bind(
-        provider = "sqlite",
-        filename = f"{ENVS.SQLITE_PATH}/evm_contract_exporter.sqlite",
-        create_db = True,
-    )
-else:
-    connection_settings = {
-        'provider': str(ENVS.DB_PROVIDER),
-        'host': str(ENVS.DB_HOST),
-        'user': str(ENVS.DB_USER),
-        'password': str(ENVS.DB_PASSWORD),
-        'database': str(ENVS.DB_DATABASE),
-    }
-    if ENVS.DB_PORT:
-        connection_settings['port'] = int(ENVS.DB_PORT)  # type: ignore [call-overload]
-    db.bind(**connection_settings)
-
-db.generate_mapping(create_tables=True)
-
-with db_session:
-    known_entities_at_startup = select(a.address for a in Address if a.chainid == chain.id)[:]
\ No newline at end of file
+_SQLITE_PRAGMAS = (
+    "journal_mode = WAL",
+    "synchronous = NORMAL",
+    f"mmap_size = {256 * 1024 ** 2}",
+    # NOTE: a negative cache size is in KiB
+    f"cache_size = -{64 * 1024}",
+    "temp_store = MEMORY",
+)
+
+if common.SQLITE_TUNED:
+    @db.on_connect(provider="sqlite")
+    def _tune_sqlite(db: Database, connection) -> None:
+        cursor = connection.cursor()
+        for pragma in _SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}")
+
+_SCALED_VALUE_SQL = {
+    "sqlite": "CAST(r.value AS REAL) / CAST(s.scale AS REAL)",
+    "postgres": "r.value / s.scale",
+}
+
+def _bind() -> None:
+    """Connects to the db and creates any missing tables. Don't call this directly, `common.setup_db` makes sure it only runs once."""
+    # TODO: make configurable
+    if ENVS.DB_PROVIDER == "sqlite":
+        _ensure_storage_path_exists(ENVS.SQLITE_PATH)  # type: ignore [arg-type]
+        db.bind(
+            provider = "sqlite",
+            filename = f"{ENVS.SQLITE_PATH}/evm_contract_exporter.sqlite",
+            create_db = True,
+        )
+    else:
+        connection_settings = {
+            'provider': str(ENVS.DB_PROVIDER),
+            'host': str(ENVS.DB_HOST),
+            'user': str(ENVS.DB_USER),
+            'password': str(ENVS.DB_PASSWORD),
+            'database': str(ENVS.DB_DATABASE),
+        }
+        if ENVS.DB_PORT:
+            connection_settings['port'] = int(ENVS.DB_PORT)  # type: ignore [call-overload]
+        db.bind(**connection_settings)
+
+    db.generate_mapping(create_tables=True)
+
+    with db_session:
+        # NOTE: raw values are scaled at query time by this view, so dashboards can read them like the scaled tables. Reverts are NULL.
+        db.execute(
+            f"{'CREATE VIEW IF NOT EXISTS' if db.provider_name == 'sqlite' else 'CREATE OR REPLACE VIEW'} contractdatatimeseriesscaled AS "
+            f"SELECT r.address_chainid AS chainid, r.address_address AS address, m.name AS metric, r.timestamp AS timestamp, r.blockno AS blockno, {_SCALED_VALUE_SQL[db.provider_name]} AS value "
+            f"FROM {ContractDataTimeSeriesRaw._table_} r "
+            f"JOIN {MetricName._table_} m ON m.id = r.metric "
+            f"JOIN {MetricScale._table_} s ON s.address_chainid = r.address_chainid AND s.address_address = r.address_address AND s.metric = r.metric"
+        )
+        commit()
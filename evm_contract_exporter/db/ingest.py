@@ -0,0 +1,106 @@
+import logging
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from io import BytesIO
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+from pony.orm import commit
+from pony.orm.core import Attribute, EntityMeta
+from y._db.utils import bulk
+from y._db.utils.stringify import build_query
+
+from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
+from evm_contract_exporter.db import _pgcopy
+from evm_contract_exporter.db.common import db_session, setup_db
+from evm_contract_exporter.db.entities import db
+
+logger = logging.getLogger(__name__)
+
+_INGEST_METHODS = "insert", "copy"
+
+_STAGING_TYPES: Dict[type, str] = {
+    int: "int8",
+    str: "text",
+    datetime: "timestamp",
+    Decimal: "numeric",
+}
+"""postgres types of the staging columns used by `copy_or_ignore` for each python type, the merge into the real table casts them to the entity's column types"""
+
+def ingest(entity: db.Entity, columns: Sequence[str], rows: Sequence[Iterable[Any]], then: Optional[Callable[[], None]] = None) -> None:
+    """
+    Writes `rows` into the table for `entity` with the method selected by `DB_INGEST_METHOD`, ignoring rows whose primary key already exists.
+    If you pass `then` it runs in the same transaction once the rows are written, so its writes commit or roll back together with them.
+    """
+    if then is not None:
+        _ingest_and_then(entity, columns, rows, then)
+    elif len(rows) > 1 and _use_copy():
+        copy_or_ignore(entity, columns, rows)
+    else:
+        insert_or_ignore(entity, columns, rows)
+
+
+def insert_or_ignore(entity: db.Entity, columns: Sequence[str], rows: Sequence[Iterable[Any]]) -> None:
+    """Inserts `rows` into the table for `entity` in one multi-row statement with ypricemagic's bulk insert, which skips rows whose primary key already exists"""
+    if not rows:
+        return
+    # NOTE: ypricemagic opens its own session, so we make sure the db is bound first
+    setup_db()
+    try:
+        bulk.insert(entity, columns, rows, db=db, sync=True)
+    except bulk.SQLError as e:
+        # NOTE: ypricemagic wraps every db error, we raise the original so callers can tell an unavailable db from bad rows
+        raise e.__cause__ from None
+
+@db_session
+def copy_or_ignore(entity: db.Entity, columns: Sequence[str], rows: Sequence[Iterable[Any]]) -> None:
+    """
+    Streams `rows` into a temp staging table with a binary COPY and merges them into the table for `entity`.
+    Rows whose primary key already exists are skipped. Postgres only.
+    """
+    _copy(entity, columns, rows)
+    commit()
+
+@db_session
+def _ingest_and_then(entity: db.Entity, columns: Sequence[str], rows: Sequence[Iterable[Any]], then: Callable[[], None]) -> None:
+    if len(rows) > 1 and _use_copy():
+        _copy(entity, columns, rows)
+    elif rows:
+        # NOTE: we can't use ypricemagic's bulk insert here, it commits on its own
+        db.execute(build_query(db.provider_name, entity.__name__.lower(), columns, rows))
+    then()
+    commit()
+
+def _copy(entity: db.Entity, columns: Sequence[str], rows: Sequence[Iterable[Any]]) -> None:
+    table = entity._table_
+    staging = f"{table}_staging"
+    types = [staging_types(entity)[column] for column in columns]
+    cursor = db.get_connection().cursor()
+    # NOTE: temp tables are per-connection and `ON COMMIT DELETE ROWS` empties it whether we commit or roll back
+    cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} ({','.join(f'{c} {t}' for c, t in zip(columns, types))}) ON COMMIT DELETE ROWS")
+    cursor.copy_expert(f"COPY {staging} ({','.join(columns)}) FROM STDIN WITH (FORMAT binary)", BytesIO(_pgcopy.encode_rows(types, rows)))
+    cursor.execute(f"INSERT INTO {table} ({','.join(columns)}) SELECT {','.join(columns)} FROM {staging} ON CONFLICT DO NOTHING")
+    logger.debug("copied %s rows into %s", len(rows), table)
+
+@lru_cache(maxsize=None)
+def staging_types(entity: db.Entity) -> Dict[str, str]:
+    """Returns {column: postgres type} for the staging table `copy_or_ignore` uses for `entity`, derived from the entity's own columns"""
+    return dict(_column_types(attr for attr in entity._attrs_ if not attr.is_collection))
+
+def _column_types(attrs: Iterable[Attribute]) -> Iterator[Tuple[str, str]]:
+    for attr in attrs:
+        if isinstance(attr.py_type, EntityMeta):
+            # NOTE: a reference is stored as the primary key of the entity it points to, which may span many columns
+            yield from zip(attr.get_columns(), (t for _, t in _column_types(attr.py_type._pk_attrs_)))
+        elif t := next((t for py_type, t in _STAGING_TYPES.items() if issubclass(attr.py_type, py_type)), None):
+            yield from ((column, t) for column in attr.get_columns())
+
+@lru_cache(maxsize=1)
+def _use_copy() -> bool:
+    method = str(ENVS.DB_INGEST_METHOD)
+    if method not in _INGEST_METHODS:
+        raise ValueError(f"DB_INGEST_METHOD must be one of {_INGEST_METHODS}, not {method}")
+    if method == "copy" and ENVS.DB_PROVIDER != "postgres":
+        logger.warning("DB_INGEST_METHOD=copy is only supported on postgres, falling back to multi-row inserts")
+        return False
+    return method == "copy"
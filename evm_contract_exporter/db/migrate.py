@@ -0,0 +1,62 @@
+"""
+Tools for moving data from the original `ContractDataTimeSeriesKV` schema to the compact `ContractDataTimeSeriesV2` schema.
+
+Run `migrate_kv_to_v2()` once, then set `EVM_CONTRACT_EXPORTER_DB_SCHEMA_VERSION=2` so the exporters read and write the v2 tables.
+The migration is idempotent and runs one address at a time, so it is safe to interrupt and re-run.
+"""
+
+import logging
+from typing import List, Optional, Tuple
+
+from pony.orm import commit, select
+
+from evm_contract_exporter import types
+from evm_contract_exporter.db.common import db_session
+from evm_contract_exporter.db.entities import Address, ContractDataTimeSeriesKV, ContractDataTimeSeriesV2, MetricName, db
+
+logger = logging.getLogger(__name__)
+
+# NOTE: sqlite stores the v1 timestamps as iso strings, postgres as naive utc timestamps
+_EPOCH_SQL = {
+    "sqlite": "CAST(strftime('%s', kv.timestamp) AS INTEGER)",
+    "postgres": "CAST(EXTRACT(EPOCH FROM kv.timestamp) AS BIGINT)",
+}
+_INSERT_OR_IGNORE = {
+    "sqlite": ("INSERT OR IGNORE INTO", ""),
+    "postgres": ("INSERT INTO", " ON CONFLICT DO NOTHING"),
+}
+
+
+def migrate_kv_to_v2(chainid: Optional[int] = None) -> int:
+    """Copies every row from `ContractDataTimeSeriesKV` into `ContractDataTimeSeriesV2`, optionally only for `chainid`. Returns the number of rows copied."""
+    _populate_metric_names()
+    addresses = _addresses_with_v1_data(chainid)
+    copied = 0
+    for i, (address_chainid, address) in enumerate(addresses, start=1):
+        copied += _migrate_address(address_chainid, address)
+        logger.info("migrated %s/%s addresses to v2 schema, %s rows so far", i, len(addresses), copied)
+    return copied
+
+@db_session
+def _populate_metric_names() -> None:
+    insert, on_conflict = _INSERT_OR_IGNORE[db.provider_name]
+    db.execute(f"{insert} {MetricName._table_} (name) SELECT DISTINCT metric FROM {ContractDataTimeSeriesKV._table_}{on_conflict}")
+    commit()
+
+@db_session
+def _addresses_with_v1_data(chainid: Optional[int]) -> List[Tuple[int, types.address]]:
+    if chainid is None:
+        return select((a.chainid, a.address) for a in Address if a.time_series_kv_data)[:]
+    return select((a.chainid, a.address) for a in Address if a.chainid == chainid and a.time_series_kv_data)[:]
+
+@db_session
+def _migrate_address(chainid: int, address: types.address) -> int:
+    insert, on_conflict = _INSERT_OR_IGNORE[db.provider_name]
+    cursor = db.execute(
+        f"{insert} {ContractDataTimeSeriesV2._table_} (address_chainid, address_address, metric, timestamp, blockno, value) "
+        f"SELECT kv.address_chainid, kv.address_address, m.id, {_EPOCH_SQL[db.provider_name]}, kv.blockno, kv.value "
+        f"FROM {ContractDataTimeSeriesKV._table_} kv JOIN {MetricName._table_} m ON m.name = kv.metric "
+        f"WHERE kv.address_chainid = $chainid AND kv.address_address = $address{on_conflict}"
+    )
+    commit()
+    return max(cursor.rowcount, 0)
@@ -0,0 +1,69 @@
+"""
+Bulk reads of stored series. The address, metric and time range predicates are pushed down into sql so we only fetch the rows we need, in one query.
+"""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+from evm_contract_exporter import types
+from evm_contract_exporter.db.common import db_session
+from evm_contract_exporter.db.entities import ContractDataTimeSeriesKV, MetricName, db
+
+Row = Tuple[str, int, Union[Decimal, float, str]]
+"""(metric, epoch, value) as returned by the db driver"""
+
+# NOTE: sqlite stores the v1 timestamps as iso strings, postgres as naive utc timestamps
+_EPOCH_SQL = {
+    "sqlite": "CAST(strftime('%s', d.timestamp) AS INTEGER)",
+    "postgres": "CAST(EXTRACT(EPOCH FROM d.timestamp) AS BIGINT)",
+}
+
+
+@db_session
+def read_rows(entity: db.Entity, chainid: int, address: types.address, metrics: Sequence[str], start: int, end: int) -> List[Row]:
+    """Returns the rows of `entity` for `metrics` on `address` between epochs `start` and `end`, inclusive, ordered by timestamp"""
+    params = _params(chainid, address, metrics)
+    params["start"], params["end"] = _bound(entity, start), _bound(entity, end)
+    sql = f"{_select(entity, len(metrics))} AND {_timestamp_column(entity)} >= $start AND {_timestamp_column(entity)} <= $end ORDER BY 2"
+    return [(metric, int(ts), value) for metric, ts, value in db.select(sql, {}, params)]
+
+@db_session
+def read_asof(entity: db.Entity, chainid: int, address: types.address, metrics: Sequence[str], timestamp: int) -> List[Row]:
+    """Returns the last row of `entity` at or before epoch `timestamp` for each of `metrics` on `address` that has one"""
+    rows = []
+    for metric in metrics:
+        params = _params(chainid, address, [metric])
+        params["timestamp"] = _bound(entity, timestamp)
+        # NOTE: on the v2 tables each of these is a single seek on the primary key index
+        sql = f"{_select(entity, 1)} AND {_timestamp_column(entity)} <= $timestamp ORDER BY {_timestamp_column(entity)} DESC LIMIT 1"
+        rows.extend((metric, int(ts), value) for metric, ts, value in db.select(sql, {}, params))
+    return rows
+
+def _select(entity: db.Entity, n_metrics: int) -> str:
+    metrics = ",".join(f"$metric{i}" for i in range(n_metrics))
+    if entity is ContractDataTimeSeriesKV:
+        return (
+            f"SELECT d.metric, {_EPOCH_SQL[db.provider_name]}, d.value FROM {entity._table_} d "
+            f"WHERE d.address_chainid = $chainid AND d.address_address = $address AND d.metric IN ({metrics})"
+        )
+    return (
+        f"SELECT m.name, d.timestamp, d.value FROM {entity._table_} d JOIN {MetricName._table_} m ON m.id = d.metric "
+        f"WHERE d.address_chainid = $chainid AND d.address_address = $address AND m.name IN ({metrics})"
+    )
+
+def _timestamp_column(entity: db.Entity) -> str:
+    if entity is ContractDataTimeSeriesKV and db.provider_name == "sqlite":
+        # NOTE: the iso strings aren't all in one format so we compare them as epochs
+        return _EPOCH_SQL["sqlite"]
+    return "d.timestamp"
+
+def _bound(entity: db.Entity, seconds: int) -> Union[datetime, int]:
+    if entity is ContractDataTimeSeriesKV and db.provider_name == "postgres":
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+    return seconds
+
+def _params(chainid: int, address: types.address, metrics: Sequence[str]) -> Dict[str, Any]:
+    params: Dict[str, Any] = {"chainid": chainid, "address": address}
+    params.update((f"metric{i}", metric) for i, metric in enumerate(metrics))
+    return params
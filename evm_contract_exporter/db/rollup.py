@@ -0,0 +1,149 @@
+"""
+Hourly and daily rollups of the stored series in `ContractDataRollup`, and the retention policy that prunes fine grained rows once they're rolled up.
+
+The datastores call `update_rollups` with each batch of new rows, in the same transaction that inserts them, so the rollups never need a full rescan and never drift from the rows.
+`prune` deletes old rows one chunk at a time, and first builds the rollups that are missing for each chunk from the rows themselves,
+so data that was written before rollups were enabled is rolled up before it's deleted.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import DefaultDict, Iterable, List, Optional, Tuple, Union
+
+from pony.orm import commit, select
+
+from evm_contract_exporter import _rollup, types
+from evm_contract_exporter._index import epoch
+from evm_contract_exporter.db.common import db_session
+from evm_contract_exporter.db.entities import ContractDataRollup, ContractDataTimeSeriesKV, MetricName, RetentionWatermark, db
+from evm_contract_exporter.db.errors import Error
+
+logger = logging.getLogger(__name__)
+
+Row = Tuple[types.address, str, int, Union[_rollup.Number, Error]]
+"""(address, metric, epoch, value), the value is the `Error.REVERT` member itself if the call reverted"""
+
+_PRUNE_CHUNK = 30 * _rollup.DAY
+"""`prune` works through the rows this many seconds at a time so it never holds too much in memory and can be interrupted safely"""
+
+
+def update_rollups(chainid: int, rows: Iterable[Row]) -> None:
+    """
+    Folds freshly inserted `rows` into the rollups for their buckets. This doesn't commit, call it inside the transaction that inserts `rows`.
+    NOTE: `rows` must not already be in the db, or they'd be counted twice.
+    """
+    grouped: DefaultDict[Tuple[types.address, str], List[_rollup.Point]] = defaultdict(list)
+    for address, metric, seconds, value in rows:
+        # NOTE: we check for the member itself, a real -1 is a value like any other
+        if value is not Error.REVERT:
+            grouped[address, metric].append((seconds, value))
+    for (address, metric), points in grouped.items():
+        # NOTE: we can't use `MetricName.get_or_insert_id` here because it would commit the transaction
+        metric_id = MetricName.get(name=metric) or MetricName(name=metric)
+        _merge_rollups(chainid, address, metric_id, points)
+
+def prune(chainid: int, address: types.address, entity: db.Entity, cutoff: int) -> Optional[int]:
+    """
+    Deletes the rows for `address` from `entity` from before `cutoff`, which must fall on a day boundary, after writing their rollups.
+    Returns the new retention watermark for `address`, or None if it has no data to prune.
+    """
+    if cutoff % _rollup.DAY:
+        raise ValueError(f"cutoff must fall on a day boundary, not {cutoff}")
+    start = _prune_start(chainid, address, entity)
+    if start is None:
+        return None
+    while start < cutoff:
+        end = min(start + _PRUNE_CHUNK, cutoff)
+        deleted = _prune_chunk(chainid, address, entity, start, end)
+        logger.info("pruned %s rows from %s for %s between %s and %s", deleted, entity._table_, address, start, end)
+        start = end
+    return start
+
+@db_session
+def get_watermark(chainid: int, address: types.address) -> Optional[int]:
+    watermark = RetentionWatermark.get(address=(chainid, address))
+    return None if watermark is None else watermark.pruned_before
+
+def _merge_rollups(chainid: int, address: types.address, metric_id: Union[int, MetricName], points: List[_rollup.Point]) -> None:
+    for resolution in _rollup.RESOLUTIONS:
+        for bucket, aggregate in _rollup.aggregate(points, resolution).items():
+            if rollup := ContractDataRollup.get(address=(chainid, address), metric=metric_id, resolution=resolution, bucket=bucket):
+                merged = _rollup.Aggregate(rollup.last_timestamp, rollup.last_value, rollup.min_value, rollup.max_value, rollup.sum_value, rollup.samples)
+                merged.merge(aggregate)
+                _set(rollup, merged)
+            else:
+                _create(chainid, address, metric_id, resolution, bucket, aggregate)
+
+@db_session
+def _prune_start(chainid: int, address: types.address, entity: db.Entity) -> Optional[int]:
+    """Returns the day on which the next prune for `address` should start"""
+    if watermark := RetentionWatermark.get(address=(chainid, address)):
+        return watermark.pruned_before
+    first = select(d.timestamp for d in entity if d.address.chainid == chainid and d.address.address == address).min()
+    return None if first is None else _rollup.bucket_start(_epoch(first), _rollup.DAY)
+
+@db_session
+def _prune_chunk(chainid: int, address: types.address, entity: db.Entity, start: int, end: int) -> int:
+    """Builds the missing rollups for the rows between `start` and `end`, deletes the rows and moves the watermark to `end`, all in one transaction"""
+    lo, hi = _bound(entity, start), _bound(entity, end)
+    if entity is ContractDataTimeSeriesKV:
+        query = select((d.metric, d.timestamp, d.value) for d in entity if d.address.chainid == chainid and d.address.address == address and d.timestamp >= lo and d.timestamp < hi)
+    else:
+        query = select((d.metric.id, d.timestamp, d.value) for d in entity if d.address.chainid == chainid and d.address.address == address and d.timestamp >= lo and d.timestamp < hi)
+    grouped: DefaultDict[Union[str, int], List[_rollup.Point]] = defaultdict(list)
+    for metric, timestamp, value in query:
+        # NOTE: the tables store reverts in-band, so for rows written before rollups were enabled we have to assume a -1 is a revert.
+        #       Any bucket with rows written since then already has an exact rollup, which we keep.
+        if value != Error.REVERT:
+            grouped[metric].append((_epoch(timestamp), value))
+
+    for metric, points in grouped.items():
+        # NOTE: v1 rows hold the metric name, we can't use `MetricName.get_or_insert_id` here because it would commit our transaction
+        metric_id = (MetricName.get(name=metric) or MetricName(name=metric)) if isinstance(metric, str) else metric
+        for resolution in _rollup.RESOLUTIONS:
+            for bucket, aggregate in _rollup.aggregate(points, resolution).items():
+                if not ContractDataRollup.exists(address=(chainid, address), metric=metric_id, resolution=resolution, bucket=bucket):
+                    _create(chainid, address, metric_id, resolution, bucket, aggregate)
+
+    deleted = select(d for d in entity if d.address.chainid == chainid and d.address.address == address and d.timestamp >= lo and d.timestamp < hi).delete(bulk=True)
+    if watermark := RetentionWatermark.get(address=(chainid, address)):
+        watermark.pruned_before = end
+    else:
+        RetentionWatermark(address=(chainid, address), pruned_before=end)
+    commit()
+    return deleted
+
+def _create(chainid: int, address: types.address, metric_id: Union[int, MetricName], resolution: int, bucket: int, aggregate: _rollup.Aggregate) -> None:
+    ContractDataRollup(
+        address=(chainid, address),
+        metric=metric_id,
+        resolution=resolution,
+        bucket=bucket,
+        last_timestamp=aggregate.last_timestamp,
+        last_value=aggregate.last,
+        min_value=aggregate.min,
+        max_value=aggregate.max,
+        sum_value=aggregate.sum,
+        samples=aggregate.count,
+    )
+
+def _set(rollup: ContractDataRollup, aggregate: _rollup.Aggregate) -> None:
+    rollup.last_timestamp = aggregate.last_timestamp
+    rollup.last_value = aggregate.last
+    rollup.min_value = aggregate.min
+    rollup.max_value = aggregate.max
+    rollup.sum_value = aggregate.sum
+    rollup.samples = aggregate.count
+
+def _bound(entity: db.Entity, seconds: int) -> Union[datetime, int]:
+    # NOTE: v1 stores timestamps as iso strings on sqlite, which compare correctly against pony's datetime params as long as the bound is midnight
+    if entity is ContractDataTimeSeriesKV:
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
+    return seconds
+
+def _epoch(timestamp: Union[str, datetime, int]) -> int:
+    if isinstance(timestamp, str):
+        # when using sqlite provider
+        timestamp = datetime.fromisoformat(timestamp)
+    return epoch(timestamp)
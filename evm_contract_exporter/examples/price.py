@@ -7,12 +7,13 @@ from typing import Optional
 import y
 from brownie import chain
 from y.exceptions import CantFetchParam, yPriceMagicError
-from evm_contract_exporter.datastore import GenericContractTimeSeriesKeyValueStore
+from evm_contract_exporter.datastore import ContractTimeSeriesDataStoreBase
 
 from evm_contract_exporter import types
 from evm_contract_exporter.exporters import ContractMetricExporter
 from evm_contract_exporter.metric import Metric
 from evm_contract_exporter.timeseries import TimeSeries, WideTimeSeries
+from evm_contract_exporter.utils import get_block_at_timestamp
 
 
 logger = logging.getLogger(__name__)
@@ -20,7 +21,7 @@ logger = logging.getLogger(__name__)
 class Price(Metric):
     key = "ypm_price"
     async def produce(self, timestamp: datetime) -> Decimal:
-        block = await y.get_block_at_timestamp(timestamp)
+        block = await get_block_at_timestamp(timestamp)
         if not block:
             raise ValueError(block)
         try:
@@ -42,10 +43,12 @@ class PriceExporter(ContractMetricExporter):
         *addresses: types.address, 
         interval: timedelta = timedelta(days=1), 
         buffer: Optional[timedelta] = None, 
-        datastore: Optional[GenericContractTimeSeriesKeyValueStore] = None, 
+        datastore: Optional[ContractTimeSeriesDataStoreBase] = None, 
         concurrency: Optional[int] = None, 
+        gaps_only: bool = False,
+        schedule: Optional[str] = None,
         sync: bool = True,
     ) -> None:
         metrics = [Price(address) for address in addresses]
         timeseries = TimeSeries(metrics[0]) if len(metrics) == 1 else WideTimeSeries(*metrics)
-        super().__init__(chain.id, timeseries, interval=interval, buffer=buffer, datastore=datastore, concurrency=concurrency, sync=sync)
\ No newline at end of file
+        super().__init__(chain.id, timeseries, interval=interval, buffer=buffer, datastore=datastore, concurrency=concurrency, gaps_only=gaps_only, schedule=schedule, sync=sync)
\ No newline at end of file
@@ -1,63 +1,251 @@
 
 import asyncio
+import bisect
+import itertools
 import logging
-from datetime import datetime
-from decimal import Decimal
-from typing import Any, AsyncIterable, Coroutine, Dict, List, Optional, Tuple, Union
+from datetime import datetime, timedelta, timezone
+from functools import cached_property, partial
+from typing import Any, AsyncIterable, Coroutine, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import a_sync
 from brownie.convert.datatypes import ReturnValue
 from generic_exporters import QueryPlan, TimeSeriesExporter
+from generic_exporters.metric import _MathResultMetricBase
 from multicall.utils import raise_if_exception_in
 
-from evm_contract_exporter.datastore import GenericContractTimeSeriesKeyValueStore
+from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
+from evm_contract_exporter import _dag, _multicall, _schedule, utils
+from evm_contract_exporter.datastore import ContractTimeSeriesDataStoreBase, get_default_datastore, kv
 from evm_contract_exporter.processors._base import _ContractMetricProcessorBase
-from evm_contract_exporter.metric import Metric
+from evm_contract_exporter.metric import Metric, _ContractCallMetricBase
 
 
 logger = logging.getLogger(__name__)
 
 class _ContractMetricExporterBase(_ContractMetricProcessorBase, TimeSeriesExporter):
     """A base class to adapt generic_exporter's `_TimeSeriesExporterBase` for evm analysis needs. Inherit from this class to create your bespoke metric exporters."""
-    datastore: GenericContractTimeSeriesKeyValueStore
+    datastore: ContractTimeSeriesDataStoreBase
     def __init__(
         self,
         chainid: int,
         query_plan: QueryPlan, 
         *,
-        datastore: Optional[GenericContractTimeSeriesKeyValueStore] = None, 
+        datastore: Optional[ContractTimeSeriesDataStoreBase] = None, 
         concurrency: Optional[int] = None, 
+        gaps_only: bool = False,
+        schedule: Optional[str] = None,
         sync: bool = True,
     ) -> None:
-        if datastore is not None and not isinstance(datastore, GenericContractTimeSeriesKeyValueStore):
-            raise TypeError(f"`datastore` must be an instance of `GenericContractTimeSeriesKeyValueStore`, you passed {datastore}")
+        if datastore is not None and not isinstance(datastore, ContractTimeSeriesDataStoreBase):
+            raise TypeError(f"`datastore` must be an instance of `ContractTimeSeriesDataStoreBase`, you passed {datastore}")
         _ContractMetricProcessorBase.__init__(self, chainid, query_plan, concurrency=concurrency, sync=sync)
         TimeSeriesExporter
-        self.datastore = datastore or GenericContractTimeSeriesKeyValueStore.get_for_chain(chainid)
+        self.datastore = datastore or get_default_datastore(chainid)
         self.ensure_data = a_sync.ProcessingQueue(self._ensure_data, concurrency or 10_000, return_data=False)
+        self.gaps_only = gaps_only
+        self.schedule = _schedule.check(schedule or str(ENVS.BACKFILL_SCHEDULE))
+        """The order history is backfilled in, see `_schedule.Schedule`"""
+        self._schedule: Optional[_schedule.Schedule] = None
+        self._derived: Dict[Metric, Set[datetime]] = {}
+        """The timestamps we've computed each math metric at from the datastore, which might not be inserted yet"""
+        self._starts: Dict[Metric, datetime] = {}
+        """The first timestamp at which each metric's calls stop reverting, if we've looked for it. We don't export the metric before then."""
+    
+    async def run(self, run_forever: bool = False) -> None:  # type: ignore [override]
+        """
+        Exports the full history for this exporter's metrics to the datastore, in the order set by `schedule`.
+        If `gaps_only` is True, only the timestamps missing from the datastore are walked.
+        """
+        end = await self._last_historical_timestamp()
+        interval = self.query.interval
+        self._schedule = _schedule.Schedule(self.schedule, await self.query.__start_timestamp__, interval)
+        if ENVS.DERIVE_FROM_DATASTORE:
+            await self._derive_from_datastore(end)
+        if ENVS.METHOD_AVAILABILITY:
+            await self._detect_availability()
+        spans = await self._wanted_spans(end)
+        # NOTE: we find the blocks a chunk at a time in schedule order, so the first chunk is exported while we look up the rest
+        for chunk in self._schedule.chunks(end, utils.PRELOAD_CHUNK_SIZE, partial(_within, spans)):
+            await utils.preload_blocks(chunk)
+            for ts in chunk:
+                self.ensure_data(ts)
+        if run_forever:
+            ts = end + interval
+            while True:
+                # NOTE: a timestamp is ready once it is more than 1 interval in the past, same as `_last_historical_timestamp`
+                await asyncio.sleep(max(0, (ts + interval - datetime.now(tz=timezone.utc)).total_seconds()))
+                self.ensure_data(ts)
+                ts += interval
+        # wait for all rpc activity to complete
+        await self.ensure_data.join()
+        # wait for all data to be pushed to datastore
+        await self.datastore.push.join()
+    
+    async def missing_timestamps(self, end: datetime) -> List[datetime]:
+        """Returns every timestamp in the query plan, up to `end`, for which at least one metric is missing from the datastore, newest first"""
+        interval = self.query.interval
+        spans = await self._missing_spans(self.query.metrics, await self.query.__start_timestamp__, end)
+        return [last - i * interval for first, last in reversed(spans) for i in range((last - first) // interval + 1)]
+    
+    async def _wanted_spans(self, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """
+        Returns the (first, last) spans of the query plan, up to `end`, that at least one metric needs exporting for, oldest first and merged.
+        Each metric needs the timestamps from its own start, see `_starts`, or just the ones it's missing from the datastore if `gaps_only` is True.
+        """
+        plan_start = await self.query.__start_timestamp__
+        interval = self.query.interval
+        groups: Dict[datetime, List[Metric]] = {}
+        for metric in self.query.metrics:
+            groups.setdefault(self._starts.get(metric, plan_start), []).append(metric)
+        if self.gaps_only:
+            spans = _merge(itertools.chain.from_iterable(await asyncio.gather(*[self._missing_spans(metrics, start, end) for start, metrics in groups.items() if start <= end])), interval)
+        else:
+            spans = _merge([(start, end) for start in groups if start <= end], interval)
+        logger.info("%s has %s timestamps to export", self, sum((last - first) // interval + 1 for first, last in spans))
+        return spans
+    
+    async def _missing_spans(self, metrics: Iterable[Metric], start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Returns the (first, last) spans of the query plan, from `start` to `end`, for which at least one of `metrics` is missing from the datastore, oldest first and merged"""
+        # NOTE: the metrics can be spread over many addresses and share keys, like the prices in a `PriceExporter`
+        keys: Dict[Any, Set[str]] = {}
+        for metric in metrics:
+            keys.setdefault(metric.address, set()).add(metric.key)
+        spans = await asyncio.gather(*[self.datastore.missing_spans(address, address_keys, start, end, self.query.interval) for address, address_keys in keys.items()])
+        return _merge(itertools.chain.from_iterable(span for by_key in spans for span in by_key.values()), self.query.interval)
+    
+    async def _last_historical_timestamp(self) -> datetime:
+        """Returns the last timestamp in the query plan that is ready to be exported"""
+        start = await self.query.__start_timestamp__
+        interval = self.query.interval
+        # NOTE: this matches `generic_exporters.plan._ts_is_ready`, a timestamp is ready once it is more than 1 interval in the past
+        cutoff = datetime.now(tz=timezone.utc) - interval
+        return start + (-((start - cutoff) // interval) - 1) * interval
     
     async def data_exists(self, ts: datetime) -> List[bool]:  # type: ignore [override]
-        return await asyncio.gather(*[self.datastore.data_exists(field.address, field.key, ts) for field in self.query.metrics])
+        exists = await asyncio.gather(*[self.datastore.data_exists(field.address, field.key, ts) for field in self.query.metrics])
+        return [
+            field_exists or ts in self._derived.get(field, ()) or (field in self._starts and ts < self._starts[field])
+            for field, field_exists in zip(self.query.metrics, exists)
+        ]
+    
+    async def _detect_availability(self) -> None:
+        """
+        Finds the first timestamp at which each of our metrics can be produced without a revert, so we skip the history before it
+        instead of making a call and storing a revert at every interval. Metrics whose calls revert at the head are exported as usual.
+        """
+        calls = {call: None for metric in self.query.metrics for call in _multicall._calls(metric)}
+        if not calls:
+            return
+        try:
+            deploy_blocks = await asyncio.gather(*[utils.get_deploy_block(call.address) for call in calls])
+            boundaries = await utils.get_availability_resolver(self.chainid).resolve({
+                (call.address, call._calldata): deploy_block for call, deploy_block in zip(calls, deploy_blocks)
+            })
+        except Exception as e:
+            logger.warning("%s couldn't find where its calls stop reverting, exporting its full history: %s %s", self, type(e).__name__, e)
+            return
+        start = await self.query.__start_timestamp__
+        interval = self.query.interval
+        for metric in self.query.metrics:
+            blocks = [boundaries[call.address, call._calldata] for call in _multicall._calls(metric)]
+            if not blocks or None in blocks:
+                continue
+            available = datetime.fromtimestamp(await utils._get_timestamp(max(blocks)), tz=timezone.utc)
+            # NOTE: the first timestamp in the query plan at or after the block, which rounds up like `_last_historical_timestamp` rounds down
+            self._starts[metric] = max(start, start - ((start - available) // interval) * interval)
+        skipped = sum(1 for ts in self._starts.values() if ts > start)
+        logger.info("%s skips the history before its calls stop reverting for %s of %s metrics", self, skipped, len(self.query.metrics))
+    
+    async def _derive_from_datastore(self, end: datetime) -> None:
+        """
+        Computes our math metrics from the stored series of their inputs, over every timestamp up to `end` where the inputs are all stored,
+        so only the slots with missing inputs need rpc calls. The math is done on the stored Decimals, so the values match what the rpc path would push.
+        Slots where an input reverted are left for the rpc path.
+        """
+        if kv.pd is None:
+            logger.warning("pandas isn't installed, %s will compute its math metrics from rpc", self)
+            return
+        if not hasattr(self.datastore, "read"):
+            logger.warning("%s can't read stored series, %s will compute its math metrics from rpc", self.datastore, self)
+            return
+        metrics = [
+            metric for metric in self.query.metrics
+            if isinstance(metric, _MathResultMetricBase) and metric.address is not None
+            and all(getattr(leaf, "address", None) for leaf in self._graph.leaves([metric]))
+        ]
+        if not metrics:
+            return
+        start = await self.query.__start_timestamp__
+        leaves = self._graph.leaves(metrics)
+        columns: Dict[Metric, Any] = {}
+        for address in {leaf.address for leaf in leaves}:
+            keyed = {leaf.key: leaf for leaf in leaves if leaf.address == address}
+            frame = await self.datastore.read(address, keyed, start, end, drop_reverts=True, exact=True)
+            columns.update((leaf, frame[key]) for key, leaf in keyed.items())
+        derived = self._graph.evaluate_columns(columns, metrics)
+        for metric in metrics:
+            spans = await self.datastore.missing_spans(metric.address, [metric.key], start, end, self.query.interval)
+            missing = [first + i * self.query.interval for first, last in spans[metric.key] for i in range((last - first) // self.query.interval + 1)]
+            if not missing:
+                continue
+            values = derived[metric].reindex(missing).dropna()
+            timestamps = self._derived.setdefault(metric, set())
+            for ts, value in values.items():
+                ts = ts.to_pydatetime()
+                self.datastore.push(metric.address, metric.key, ts, value, metric)
+                timestamps.add(ts)
+            logger.info("%s derived %s of %s missing %s values from the datastore", self, len(values), len(missing), metric.key)
 
     async def _ensure_data(self, ts: datetime) -> None:
+        # NOTE: this lets the priority semaphores downstream order our work by our schedule
+        _schedule.current.set(self._schedule)
         data_exists = await self.data_exists(ts, sync=False)
         if all(data_exists):
             logger.debug('complete data for %s at %s already exists in datastore', self, ts)
             return
-        elif any(data_exists):
-            coros: Dict[Metric, Coroutine[Any, Any, Decimal]] = {field: field.produce(ts, sync=False) for field, field_exists in zip(self.query.metrics, data_exists) if not field_exists}
-            data: AsyncIterable[Tuple[Metric, Union[Decimal, Exception]]] = a_sync.as_completed(coros, return_exceptions=True, aiter=True)
-        else:
-            logger.debug('no data exists for %s at %s, exporting...', self, ts)
-            tasks = self.query[ts].tasks
-            # make sure the tasks are all created
-            await tasks._init_loader
-            data = a_sync.as_completed(tasks, return_exceptions=True, aiter=True)
-        async for metric, result in data:
+        missing = [field for field, field_exists in zip(self.query.metrics, data_exists) if not field_exists]
+        if ENVS.MULTICALL_BATCHING:
+            await _multicall.prefetch(missing, await utils.get_block_at_timestamp(ts))
+        logger.debug('exporting %s of %s metrics for %s at %s', len(missing), len(data_exists), self, ts)
+        # NOTE: datastores that keep raw values get the unscaled call outputs, everything else is evaluated together through the graph
+        direct = [field for field in missing if self.datastore.raw and isinstance(field, _ContractCallMetricBase)]
+        compiled = [field for field in missing if field not in direct]
+        direct_values, compiled_values = await asyncio.gather(
+            asyncio.gather(*[self._produce(field, ts) for field in direct], return_exceptions=True),
+            self._graph.evaluate(lambda metric: metric.produce(ts, sync=False), compiled),
+        )
+        for metric, result in itertools.chain(zip(direct, direct_values), compiled_values.items()):
             if isinstance(result, ReturnValue):
                 # TODO: find where these are comign from and stop them earlier
                 raise TypeError(metric, metric._output_type, result)
             if result is None:
                 # TODO: backport None support
                 continue
-            self.datastore.push(metric.address, metric.key, ts, result)
+            self.datastore.push(metric.address, metric.key, ts, result, metric)
+    
+    @cached_property
+    def _graph(self) -> _dag.ExpressionGraph:
+        """All of our metrics compiled together, so the calls and subexpressions they share are evaluated once per timestamp"""
+        return _dag.ExpressionGraph(self.query.metrics)
+    
+    def _produce(self, metric: Metric, ts: datetime) -> Coroutine[Any, Any, Any]:
+        """Datastores that keep raw values get the unscaled output of contract calls, everything else gets the scaled value"""
+        if self.datastore.raw and isinstance(metric, _ContractCallMetricBase):
+            return metric.produce_raw(ts, sync=False)
+        return metric.produce(ts, sync=False)
+
+
+def _merge(spans: Iterable[Tuple[datetime, datetime]], interval: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Returns `spans` sorted, with the ones that overlap or touch on the grid merged"""
+    merged: List[Tuple[datetime, datetime]] = []
+    for first, last in sorted(spans):
+        if merged and first <= merged[-1][1] + interval:
+            merged[-1] = merged[-1][0], max(last, merged[-1][1])
+        else:
+            merged.append((first, last))
+    return merged
+
+def _within(spans: List[Tuple[datetime, datetime]], ts: datetime) -> bool:
+    """Returns True if `ts` falls in one of `spans`, which must be sorted and not overlap"""
+    i = bisect.bisect_right(spans, (ts, datetime.max.replace(tzinfo=ts.tzinfo))) - 1
+    return i >= 0 and ts <= spans[i][1]
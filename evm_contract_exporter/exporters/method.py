@@ -4,7 +4,7 @@ from typing import Optional
 
 from brownie import chain
 
-from evm_contract_exporter.datastore import GenericContractTimeSeriesKeyValueStore
+from evm_contract_exporter.datastore import ContractTimeSeriesDataStoreBase
 from evm_contract_exporter.exporters.metric import ContractMetricExporter
 from evm_contract_exporter.processors.method import Method, Scaley, _validate_scale, _wrap_methods
 
@@ -17,8 +17,10 @@ class ViewMethodExporter(ContractMetricExporter):
         interval: timedelta = timedelta(days=1), 
         buffer: Optional[timedelta] = None, 
         scale: Scaley = False,
-        datastore: Optional[GenericContractTimeSeriesKeyValueStore] = None,
+        datastore: Optional[ContractTimeSeriesDataStoreBase] = None,
         concurrency: Optional[int] = None,
+        gaps_only: bool = False,
+        schedule: Optional[str] = None,
         sync: bool = True,
     ) -> None:
         _validate_scale(scale)
@@ -29,5 +31,7 @@ class ViewMethodExporter(ContractMetricExporter):
             buffer=buffer, 
             datastore=datastore, 
             concurrency=concurrency, 
+            gaps_only=gaps_only,
+            schedule=schedule,
             sync=sync,
         )
\ No newline at end of file
@@ -6,7 +6,7 @@ from typing import Optional, Union
 from generic_exporters import QueryPlan
 
 from evm_contract_exporter.timeseries import TimeSeries, WideTimeSeries
-from evm_contract_exporter.datastore import GenericContractTimeSeriesKeyValueStore
+from evm_contract_exporter.datastore import ContractTimeSeriesDataStoreBase
 from evm_contract_exporter.exporters._base import _ContractMetricExporterBase
 
 
@@ -21,12 +21,14 @@ class ContractMetricExporter(_ContractMetricExporterBase):
         *, 
         interval: timedelta = timedelta(days=1), 
         buffer: Optional[timedelta] = None,
-        datastore: Optional[GenericContractTimeSeriesKeyValueStore] = None,
+        datastore: Optional[ContractTimeSeriesDataStoreBase] = None,
         concurrency: Optional[int] = None,
+        gaps_only: bool = False,
+        schedule: Optional[str] = None,
         sync: bool = True,
     ) -> None:
         if buffer:
             raise NotImplementedError('buffer')
         query: QueryPlan = timeseries[self.start_timestamp(sync=False):None:interval]
-        super().__init__(chainid, query, datastore=datastore, concurrency=concurrency, sync=sync)
+        super().__init__(chainid, query, datastore=datastore, concurrency=concurrency, gaps_only=gaps_only, schedule=schedule, sync=sync)
     
\ No newline at end of file
@@ -16,9 +16,9 @@ def is_view_method(function: ContractCall) -> bool:
 def has_no_args(function: ContractCall) -> bool:
     return not function.abi["inputs"]
 
-def exportable_return_value_type(function: ContractCall) -> bool:
+def exportable_return_value_type(function: ContractCall, raw: bool = False) -> bool:
     name = function._name.split('.')[1]
-    if name in _skip.SKIP_METHODS:
+    if name in _skip.skip_methods(raw):
         return False
     outputs = function.abi["outputs"]
     if not outputs:
@@ -1,11 +1,18 @@
-SKIP_METHODS = {
+from typing import Set
+
+CONSTANT_METHODS = {
     "decimals",
     "eip712Domain",
     "metadata",
     "MAX_UINT",
     "UINT_MAX_VALUE",
-    # these numbers are either too big to stuff into the default db or wont scale properly (or both).
-    # You can manually do things with these if you need
+    "DELEGATE_PROTOCOL_SWAP_FEES_SENTINEL",
+}
+
+# these numbers are either too big to stuff into the default db or wont scale properly (or both).
+# Datastores that keep raw values (see `ContractTimeSeriesDataStoreBase.raw`) can export them.
+# You can manually do things with these if you need
+OVERSIZED_METHODS = {
     "getReserves", 
     "reserve0",
     "reserve1",
@@ -16,5 +23,10 @@ SKIP_METHODS = {
     "reserve0CumulativeLast",
     "reserve1CumulativeLast",
     "lastObservation",
-    "DELEGATE_PROTOCOL_SWAP_FEES_SENTINEL",
-}
\ No newline at end of file
+}
+
+SKIP_METHODS = CONSTANT_METHODS | OVERSIZED_METHODS
+
+def skip_methods(raw: bool = False) -> Set[str]:
+    """Returns the method names we skip when exporting to a datastore that does or does not keep `raw` values"""
+    return CONSTANT_METHODS if raw else SKIP_METHODS
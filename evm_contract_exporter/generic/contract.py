@@ -6,9 +6,9 @@ from brownie.network.contract import ContractCall, ContractTx, OverloadedMethod
 
 from evm_contract_exporter.generic._methods import _call
 
-def safe_views(contract: Contract) -> List[ContractCall]:
-    """Returns a list of the view methods on `contract` that are suitable for exporting"""
-    return [function for function in list_view_methods(contract) if _call.has_no_args(function) and _call.exportable_return_value_type(function)]
+def safe_views(contract: Contract, raw: bool = False) -> List[ContractCall]:
+    """Returns a list of the view methods on `contract` that are suitable for exporting to a datastore that does or does not keep `raw` values"""
+    return [function for function in list_view_methods(contract) if _call.has_no_args(function) and _call.exportable_return_value_type(function, raw)]
 
 def list_view_methods(contract: Contract) -> List[ContractCall]:
     return [function for function in list_functions(contract) if _call.is_view_method(function)]
@@ -11,7 +11,7 @@ from y import Contract
 from y.datatypes import Address
 
 from evm_contract_exporter.contract import ContractExporterBase
-from evm_contract_exporter.datastore import GenericContractTimeSeriesKeyValueStore
+from evm_contract_exporter.datastore import ContractTimeSeriesDataStoreBase
 from evm_contract_exporter.exporters.method import ViewMethodExporter
 from evm_contract_exporter.generic.contract import safe_views
 from evm_contract_exporter.processors.method import _wrap_method
@@ -32,12 +32,16 @@ class GenericContractExporter(ContractExporterBase):
         *, 
         interval: timedelta = timedelta(days=1), 
         buffer: Optional[timedelta] = None,
-        datastore: Optional[GenericContractTimeSeriesKeyValueStore] = None,
+        datastore: Optional[ContractTimeSeriesDataStoreBase] = None,
         concurrency: Optional[int] = 100,
+        gaps_only: bool = False,
+        schedule: Optional[str] = None,
         sync: bool = True
     ) -> None:
         super().__init__(chain.id, interval=interval, buffer=buffer, datastore=datastore, concurrency=concurrency, sync=sync)
         self.address = convert.to_address(contract)
+        self.gaps_only = gaps_only
+        self.schedule = schedule
     def __repr__(self) -> str:
         return f"<{self.__class__.__name__} contract={self.address} interval={self.interval}>"
     @cached_property
@@ -46,7 +50,7 @@ class GenericContractExporter(ContractExporterBase):
     @async_cached_property
     async def method_exporter(self) -> Optional[ViewMethodExporter]:
         contract = await Contract.coroutine(self.address)
-        data = [d for view_method in safe_views(contract) for d in unpack(view_method)]
+        data = [d for view_method in safe_views(contract, self.datastore.raw) for d in unpack(view_method)]
         if data:
             return ViewMethodExporter(
                 *data, 
@@ -54,6 +58,8 @@ class GenericContractExporter(ContractExporterBase):
                 buffer=self.buffer, 
                 datastore=self.datastore, 
                 concurrency=self.concurrency, 
+                gaps_only=self.gaps_only,
+                schedule=self.schedule,
                 sync=self.sync,
             )
         
@@ -7,16 +7,20 @@ from decimal import Decimal, InvalidOperation
 from functools import cached_property
 from typing import Any, Dict, List, Optional, Tuple, Type, Union, overload
 
+import dank_mids
 import generic_exporters
 import inflection
 from async_lru import alru_cache
 from brownie import convert
 from brownie.convert.datatypes import ReturnValue
 from brownie.network.contract import ContractCall
+from web3.exceptions import ContractLogicError
 from datetime import timedelta
-from y import ERC20, contract_creation_block_async, get_block_at_timestamp
+from y import ERC20
 
-from evm_contract_exporter import _exceptions, _math, scale, types
+from evm_contract_exporter import _decode, _exceptions, _math, scale, types
+from evm_contract_exporter._cache import ResultCache
+from evm_contract_exporter.utils import get_block_at_timestamp, get_deploy_block, rate_limited
 from evm_contract_exporter.timeseries import TimeSeries
 
 
@@ -25,6 +29,11 @@ ARRAY_TYPE = list
 
 logger = logging.getLogger(__name__)
 
+CALL_CACHE_SIZE = 10_000
+"""The most call results we keep for the metrics derived from them"""
+
+_call_results: ResultCache[Any] = ResultCache(CALL_CACHE_SIZE)
+
 
 # NOTE: is this needed? 
 class _MetricBase(generic_exporters.Metric):
@@ -99,7 +108,6 @@ class ContractCallMetric(ContractCall, _ContractCallMetricBase):
         self._key = key
         if not isinstance(scale, bool) and not self._can_scale:
             raise ValueError(f"{self} is not scalable. output type: {self._output_type or self._outputs}")
-        self._cache: Dict[datetime, Tuple[int, asyncio.Task]] = {}
         self.__scale = scale
     def __repr__(self) -> str:
         orig = ContractCall.__repr__(self)
@@ -155,34 +163,76 @@ class ContractCallMetric(ContractCall, _ContractCallMetricBase):
         retval = await self._original_call.coroutine(*args, **kwargs)
         return self._output_type(retval) if self._should_wrap_output else retval
     async def produce(self, timestamp: datetime) -> Optional[Decimal]:
-        if await get_block_at_timestamp(timestamp, sync=False) < await contract_creation_block_async(self.address):
+        retval = await self.produce_raw(timestamp, sync=False)
+        if retval is None or not self._should_scale:
+            return retval
+        if isinstance(retval, ReturnValue):
+            logger.warning("attempted to scale %s, debug!  method: %s  should_scale: %s  output_type: %s  outputs: %s", retval, self._original_call, self._should_scale, self._output_type, self._outputs)
+            return retval
+        return retval / await self.get_scale()
+    async def produce_raw(self, timestamp: datetime) -> Optional[Any]:
+        """Returns the unscaled output of the call at `timestamp`, or None if the contract was not yet deployed"""
+        response = await self._response(timestamp)
+        return None if response is None else self._value(response)
+    async def _response(self, timestamp: datetime) -> Optional[Any]:
+        """
+        Returns the raw return data of the call at `timestamp` if we can decode it ourselves, see `_layout`, or brownie's decoded output if we can't.
+        Returns None if the contract was not yet deployed.
+        """
+        block = await get_block_at_timestamp(timestamp)
+        if block < await get_deploy_block(self.address):
             logger.debug("%s was not yet deployed at %s", self, timestamp)
             return None
-        if self._dependants:
-            if timestamp not in self._cache:
-                self._cache[timestamp] = [self._dependants, asyncio.create_task(self.__produce(timestamp))]
-            result = await self._cache[timestamp][1]
-            self._cache[timestamp][0] -= 1
-            if self._cache[timestamp][0] <= 0:
-                self._cache.pop(timestamp)
-            return result
-        return await self.__produce(timestamp)
-    async def __produce(self, timestamp: datetime) -> Decimal:
-        while True:
-            try:
-                block = await get_block_at_timestamp(timestamp)
-                retval = await self.coroutine(*self._args, block_identifier=block)
-                if self._should_scale:
-                    if isinstance(retval, ReturnValue):
-                        logger.warning("attempted to scale %s, debug!  method: %s  should_scale: %s  output_type: %s  outputs: %s", retval, self._original_call, self._should_scale, self._output_type, self._outputs)
-                    else:
-                        retval /= await self.get_scale()
-                # Force the db to accept booleans. Sqlite accepts them fine but postgres needs them wrapped.
-                return Decimal(retval) if self._output_type is bool else retval
-            except Exception as e:
-                if '429' not in str(e):
-                    raise e
-                await asyncio.sleep(1)
+        # NOTE: the tuple and struct fields derived from this call all share one call per block
+        return await _call_results.get(self._result_key(block), lambda: self.__produce(block))
+    def _value(self, response: Any) -> Any:
+        """Returns the output of the call from a `_response`"""
+        if self._layout is None:
+            return response
+        if len(self._layout.fields) == 1 and (slot := self._layout.fields[0]) is not None:
+            retval = self._layout.decode(response, slot)
+        else:
+            retval = self.decode_output(response)
+        retval = self._output_type(retval) if self._should_wrap_output else retval
+        # Force the db to accept booleans. Sqlite accepts them fine but postgres needs them wrapped.
+        return Decimal(retval) if self._output_type is bool else retval
+    @cached_property
+    def _layout(self) -> Optional[_decode.Layout]:
+        """Where each output sits in the return data, if they're all static. If not, we let brownie decode the whole response."""
+        return _decode.layout(self._outputs)
+    @cached_property
+    def _calldata(self) -> bytes:
+        return bytes.fromhex(self.encode_input(*self._args)[2:])
+    def _result_key(self, block: int) -> Tuple[types.address, bytes, int]:
+        """Identical calls share a result, even if they're made by different `ContractCallMetric` objects"""
+        return self.address, self._calldata, block
+    def _prime(self, block: int, success: bool, returndata: bytes, refs: int = 1) -> None:
+        """
+        Caches the result of a call made for us in a multicall, failures are cached as the exception a direct call would have raised.
+        The result is pinned for the `refs` readers that will read it.
+        """
+        if not success:
+            result: Any = ContractLogicError(f"execution reverted: 0x{returndata.hex()}")
+        elif not returndata:
+            # NOTE: this matches the message brownie raises, so it's recognized as a revert
+            result = ValueError("No data was returned - the call likely reverted")
+        elif self._layout is not None:
+            result = returndata
+        else:
+            retval = self.decode_output(returndata)
+            retval = self._output_type(retval) if self._should_wrap_output else retval
+            result = Decimal(retval) if self._output_type is bool else retval
+        _call_results.put(self._result_key(block), result, refs=refs)
+    async def __produce(self, block: int) -> Any:
+        if self._layout is None:
+            retval = await rate_limited(lambda: self.coroutine(*self._args, block_identifier=block))
+            # Force the db to accept booleans. Sqlite accepts them fine but postgres needs them wrapped.
+            return Decimal(retval) if self._output_type is bool else retval
+        returndata = await rate_limited(lambda: dank_mids.eth.call({"to": self.address, "data": self._calldata}, block_identifier=block))
+        if not returndata:
+            # NOTE: this matches the message brownie raises, so it's recognized as a revert
+            raise ValueError("No data was returned - the call likely reverted")
+        return bytes(returndata)
     @property
     def _outputs(self) -> List[dict]:
         return self.abi['outputs']
@@ -252,17 +302,29 @@ class ContractCallDerivedMetric(_ContractCallMetricBase):
         return self._extract(self._call(*args, **kwargs))
     async def coroutine(self, *args, **kwargs):
         return self._extract(await self._call.coroutine(*args, **kwargs))
-    async def produce(self, timestamp: datetime) -> Decimal:
-        call_response = await self._call.produce(timestamp, sync=False)
+    async def produce(self, timestamp: datetime) -> Optional[Decimal]:
+        call_response = await self._call._response(timestamp)
+        if call_response is None:
+            return None
+        extracted = self._extract_response(call_response)
         try:
-            value = Decimal(self._extract(call_response)) 
+            value = Decimal(extracted)
         except (InvalidOperation, ValueError) as e:
             if hasattr(call_response, "to_dict"):
                 raise Exception(e, call_response.to_dict(), self, self._output_type)
-            raise e.__class__(e, self._extract(call_response), call_response, self, self.abi)
+            raise e.__class__(e, extracted, call_response, self, self.abi)
         if self._should_scale:
             value /= await self.get_scale()
         return value
+    async def produce_raw(self, timestamp: datetime) -> Optional[Any]:
+        """Returns the unscaled value of this field at `timestamp`, or None if the contract was not yet deployed"""
+        call_response = await self._call._response(timestamp)
+        return None if call_response is None else self._extract_response(call_response)
+    def _extract_response(self, call_response: Any) -> Any:
+        """Returns this field from a `ContractCallMetric._response`, decoding just its own word of the return data when we can"""
+        if self._slot is not None:
+            return self._call._layout.decode(call_response, self._slot)  # type: ignore [union-attr]
+        return self._extract(self._call._value(call_response))
     @cached_property
     def address(self) -> types.address:
         return self._call.address
@@ -296,6 +358,9 @@ class ContractCallDerivedMetric(_ContractCallMetricBase):
     def abi(self) -> dict:...
     @abstractmethod
     def _extract(self, response_data) -> Any:...
+    @abstractproperty
+    def _slot(self) -> Optional[_decode.Slot]:
+        """Where this field sits in the call's return data, or None if the call's outputs aren't static"""
     @property
     def _outputs(self) -> List[dict]:
         try:
@@ -328,6 +393,9 @@ class TupleDerivedMetric(ContractCallDerivedMetric):
         return self._call._outputs[self._index]
     def _extract(self, response_data: ReturnValue) -> Any:
         return response_data[self._index]
+    @cached_property
+    def _slot(self) -> Optional[_decode.Slot]:
+        return None if self._call._layout is None else self._call._layout.fields[self._index]
 
 
 class StructDerivedMetric(ContractCallDerivedMetric):
@@ -353,6 +421,9 @@ class StructDerivedMetric(ContractCallDerivedMetric):
     @cached_property
     def key(self) -> str:
         return inflection.underscore(self._call._name.split('.')[1]) + f".{inflection.underscore(self._struct_key)}"
+    @cached_property
+    def _slot(self) -> Optional[_decode.Slot]:
+        return None if self._call._layout is None else self._call._layout.names.get(self._struct_key)
     def _extract(self, response_data: ReturnValue) -> Any:
         try:
             return response_data.dict()[self._struct_key]
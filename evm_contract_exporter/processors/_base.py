@@ -10,7 +10,7 @@ import a_sync
 import eth_retry
 from generic_exporters import QueryPlan
 from generic_exporters.processors._base import _TimeSeriesProcessorBase
-from y import contract_creation_block_async, get_block_at_timestamp
+from y import get_block_at_timestamp
 from y.time import get_block_timestamp_async
 
 from evm_contract_exporter import types, utils
@@ -67,7 +67,7 @@ class _ContractMetricProcessorBase(_TimeSeriesProcessorBase):
     """
     async def _earliest_deploy_block(self) -> int:
         await self._load_deploy_blocks_to_memory()
-        return min(await asyncio.gather(*[contract_creation_block_async(field.address) for field in self.query.metrics]))
+        return min(await asyncio.gather(*[utils.get_deploy_block(field.address) for field in self.query.metrics]))
     async def _load_deploy_blocks_to_memory(self) -> None:
         """ensure the deploy block for all relevant contracts is cached in memory before proceeding"""
         await utils.start_deploy_block_workers()
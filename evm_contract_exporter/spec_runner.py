@@ -7,6 +7,7 @@ import inflection
 from brownie.network.contract import OverloadedMethod
 from y import Contract
 
+from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
 from evm_contract_exporter import types
 from evm_contract_exporter.generic._methods import _skip
 from evm_contract_exporter.metric import ContractCallMetric
@@ -90,7 +91,7 @@ def _plan_for_abi_method(method_name: str, abi: Mapping[str, Any]) -> Tuple[List
     export: List[PlanItem] = []
     skipped: List[PlanItem] = []
 
-    if method_name in _skip.SKIP_METHODS:
+    if method_name in _skip.skip_methods(bool(ENVS.DB_RAW_VALUES)):
         skipped.append(PlanItem(method_name, None, None, None, "skip", "skip list"))
         return export, skipped
 
@@ -1,29 +1,114 @@
 
 import asyncio
+import atexit
+import logging
 from datetime import datetime
-from typing import TYPE_CHECKING, List, NoReturn
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable, Iterable, List, NoReturn, Sequence, Tuple, TypeVar
 
 import a_sync
 import dank_mids
 import y
 from async_lru import alru_cache
+from brownie import chain, web3
 from brownie.network.contract import Contract, ContractCall
+from y.time import get_block_timestamp_async
 
-from evm_contract_exporter import types
+from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
+from evm_contract_exporter import _exceptions, _schedule, types
+from evm_contract_exporter._availability import AvailabilityResolver
+from evm_contract_exporter._blocktime import BlockTimeIndex
+from evm_contract_exporter._deploy_blocks import DeployBlockResolver, decode_probe, encode_probe
+from evm_contract_exporter._ratelimit import RateLimiter
 
 if TYPE_CHECKING:
     from evm_contract_exporter.exporters.method import Scaley
 
+logger = logging.getLogger(__name__)
+
 BLOCK_AT_TIMESTAMP_CONCURRENCY = 500
-DEPLOY_BLOCK_CONCURRENCY = 100
+DEPLOY_BLOCK_CONCURRENCY = 4
+"""Each deploy block worker resolves a whole batch of contracts at once, so we only need a few"""
+DEPLOY_BLOCK_BATCH_SIZE = 5_000
+DEPLOY_BLOCK_BATCH_LATENCY = 1.0
+BLOCK_TIME_SAVE_EVERY = 1_000
+"""We persist the block time index whenever it has this many new samples"""
+PRELOAD_CHUNK_SIZE = 1_000
+"""How many timestamps an exporter finds the blocks for at once before it queues them"""
+
+_T = TypeVar('_T')
 
 _deploy_block_queue: a_sync.Queue[types.address] = a_sync.Queue()
 _block_timestamp_semaphore = a_sync.PrioritySemaphore(BLOCK_AT_TIMESTAMP_CONCURRENCY, name="block for timestamp semaphore")
 
+async def get_batch(queue: "asyncio.Queue[_T]", max_size: int, max_latency: float) -> List[_T]:
+    """
+    Waits for the next item in `queue`, then keeps collecting items until the batch holds `max_size` items
+    or `max_latency` seconds have passed since the first one arrived, whichever comes first.
+    """
+    batch = [await queue.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_latency
+    while len(batch) < max_size:
+        if not queue.empty():
+            batch.append(queue.get_nowait())
+            continue
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
 async def get_block_at_timestamp(timestamp: datetime) -> int:
     """Returns the number of the last block minted before the exact moment of `timestamp`"""
-    async with _block_timestamp_semaphore[0 - timestamp.timestamp()]:  # NOTE: We invert the priority to go high-to-low so we can get more recent data more quickly
-        return await y.get_block_at_timestamp(timestamp)
+    index = get_block_time_index(chain.id)
+    if (block := index.cached(timestamp)) is not None:
+        return block
+    async with _block_timestamp_semaphore[_schedule.priority(timestamp)]:
+        block = await index.block_at(timestamp)
+    if index.unsaved >= BLOCK_TIME_SAVE_EVERY:
+        index.save()
+    if block is None:
+        # NOTE: the block hasn't been minted yet, ypricemagic knows how to wait for it
+        return await rate_limited(lambda: y.get_block_at_timestamp(timestamp))
+    return block
+
+async def preload_blocks(timestamps: Iterable[datetime]) -> None:
+    """Finds the blocks for all of `timestamps` in a few batched rounds of header lookups, so `get_block_at_timestamp` has them in memory"""
+    index = get_block_time_index(chain.id)
+    await index.blocks_at(timestamps)
+    if index.unsaved >= BLOCK_TIME_SAVE_EVERY:
+        index.save()
+
+@lru_cache(maxsize=None)
+def get_block_time_index(chainid: int) -> BlockTimeIndex:
+    """Returns the `BlockTimeIndex` for `chainid`, which is shared by every exporter in the process and persisted across restarts"""
+    index = BlockTimeIndex(_get_timestamp, _get_height, Path(str(ENVS.BLOCKTIME_PATH)) / f"{chainid}.blocktime")
+    atexit.register(index.save)
+    return index
+
+async def _get_timestamp(block: int) -> int:
+    return await rate_limited(lambda: get_block_timestamp_async(block))
+
+async def _get_height() -> int:
+    return await rate_limited(lambda: dank_mids.eth.block_number)
+
+async def rate_limited(fn: Callable[[], Awaitable[_T]]) -> _T:
+    """
+    Returns `await fn()`, paced by the `RateLimiter` for the rpc endpoint we're connected to. Every rpc call we make ourselves should go through here.
+    NOTE: our requests go through dank_mids, which holds them back to batch them, so how long they take is mostly its batching delay and not the node's latency.
+          We don't time them, the limiter only backs off on 429s.
+    """
+    return await get_rate_limiter(getattr(web3.provider, "endpoint_uri", None) or str(chain.id)).call(fn, timed=False)
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(endpoint: str) -> RateLimiter:
+    """Returns the `RateLimiter` shared by every exporter in the process for `endpoint`"""
+    return RateLimiter()
 
 def wrap_contract(contract: Contract, scale: "Scaley" = True) -> y.Contract:
     """Converts all `ContractCall` objects in `contract.__dict__` to `ContractCallMetric` objects with more functionality"""
@@ -36,16 +121,53 @@ def wrap_contract(contract: Contract, scale: "Scaley" = True) -> y.Contract:
             object.__setattr__(contract, k, ContractCallMetric(v, scale=scale))
     return contract
 
+async def get_deploy_block(address: types.address) -> int:
+    """Returns the block at which `address` was deployed"""
+    if (block := get_deploy_block_resolver(chain.id).get(address)) is not None:
+        return block
+    # NOTE: the resolver couldn't find it, maybe the contract self destructed. ypricemagic knows how to handle these.
+    return await rate_limited(lambda: y.contract_creation_block_async(address))
+
+@lru_cache(maxsize=None)
+def get_deploy_block_resolver(chainid: int) -> DeployBlockResolver:
+    """Returns the `DeployBlockResolver` for `chainid`, which is shared by every exporter in the process and persisted across restarts"""
+    return DeployBlockResolver(_get_code_sizes, _get_height, Path(str(ENVS.DEPLOY_BLOCKS_PATH)) / f"{chainid}.json")
+
+async def _get_code_sizes(addresses: Sequence[types.address], block: int) -> List[int]:
+    # NOTE: no `to`, the node runs our init code as a contract creation and returns what it returns
+    return decode_probe(await rate_limited(lambda: dank_mids.eth.call({"data": encode_probe(addresses)}, block_identifier=block)))
+
 @alru_cache(maxsize=1)
 async def start_deploy_block_workers() -> List["asyncio.Task[NoReturn]"]:
     return [asyncio.create_task(_deploy_block_worker()) for _ in range(DEPLOY_BLOCK_CONCURRENCY)]
 
 async def _deploy_block_worker() -> NoReturn:
+    resolver = get_deploy_block_resolver(chain.id)
     while True:
-        contract_address = await _deploy_block_queue.get()
+        addresses = await get_batch(_deploy_block_queue, DEPLOY_BLOCK_BATCH_SIZE, DEPLOY_BLOCK_BATCH_LATENCY)
         try:
-            await y.contract_creation_block_async(contract_address)
+            await resolver.resolve(addresses)
         except Exception as e:
-            # the exception will raise later on, we can ignore it
-            pass
-        _deploy_block_queue.task_done()
+            # NOTE: some nodes won't run an `eth_call` without a `to`, ypricemagic can find them one at a time
+            logger.warning("batched deploy block lookup failed with %s: %s, falling back to ypricemagic", type(e).__name__, e)
+            # the exceptions will raise later on, we can ignore them
+            await asyncio.gather(*[rate_limited(lambda address=address: y.contract_creation_block_async(address)) for address in addresses], return_exceptions=True)
+        for _ in addresses:
+            _deploy_block_queue.task_done()
+
+@lru_cache(maxsize=None)
+def get_availability_resolver(chainid: int) -> AvailabilityResolver:
+    """Returns the `AvailabilityResolver` for `chainid`, which is shared by every exporter in the process and persisted across restarts"""
+    return AvailabilityResolver(_are_available, _get_height, Path(str(ENVS.METHOD_AVAILABILITY_PATH)) / f"{chainid}.json")
+
+async def _are_available(calls: Sequence[Tuple[types.address, bytes]], block: int) -> List[bool]:
+    return await asyncio.gather(*[_is_available(address, calldata, block) for address, calldata in calls])
+
+async def _is_available(address: types.address, calldata: bytes, block: int) -> bool:
+    try:
+        await rate_limited(lambda: dank_mids.eth.call({"to": address, "data": calldata}, block_identifier=block))
+    except Exception as e:
+        if _exceptions._is_revert(e):
+            return False
+        raise
+    return True
@@ -18,6 +18,10 @@ setup(
     url='https://github.com/BobTheBuidler/evm_contract_exporter',
     license='MIT',
     install_requires=requirements,
+    extras_require={
+        # NOTE: only needed to read stored series into DataFrames, see `GenericContractTimeSeriesKeyValueStore.read`
+        'pandas': ['pandas'],
+    },
     setup_requires=[
         'setuptools_scm',
     ],
@@ -14,3 +14,15 @@ def weth():
 @pytest.fixture
 def weth_smart_scale(weth):
     return SmartScale(weth.address)
+
+@pytest.fixture(scope="session")
+def sqlite_db(tmp_path_factory):
+    """Binds the db to a fresh sqlite file. Pony can only bind once per process, so every test that uses this shares one db."""
+    from evm_contract_exporter import ENVIRONMENT_VARIABLES as ENVS
+    from evm_contract_exporter import db
+    if ENVS.DB_PROVIDER != "sqlite":
+        pytest.skip("these tests need DB_PROVIDER=sqlite")
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr(ENVS, "SQLITE_PATH", str(tmp_path_factory.mktemp("db")))
+        db.common.setup_db()
+    return db
@@ -0,0 +1,61 @@
+import asyncio
+import importlib.util
+import random
+from pathlib import Path
+
+_AVAILABILITY_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_availability.py"
+_AVAILABILITY_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._availability", _AVAILABILITY_PATH)
+)
+assert _AVAILABILITY_MODULE.__spec__ and _AVAILABILITY_MODULE.__spec__.loader
+_AVAILABILITY_MODULE.__spec__.loader.exec_module(_AVAILABILITY_MODULE)
+
+AvailabilityResolver = _AVAILABILITY_MODULE.AvailabilityResolver
+
+
+class _Chain:
+    def __init__(self, contracts: int, methods: int, height: int) -> None:
+        rng = random.Random(0)
+        self.height = height
+        self.deploy_blocks = {}
+        self.boundaries = {}
+        for i in range(1, contracts + 1):
+            address = f"0x{i:040x}"
+            deploy_block = rng.randrange(height)
+            for selector in range(methods):
+                call = address, selector.to_bytes(4, "big")
+                self.deploy_blocks[call] = deploy_block
+                # NOTE: most methods work from deploy, some are added by an upgrade and some still revert at the head
+                self.boundaries[call] = rng.choice([deploy_block, deploy_block, rng.randrange(deploy_block, height + 1), height + 1])
+        self.calls = 0
+    async def is_available(self, calls, block):
+        self.calls += 1
+        return [self.boundaries[call] <= block for call in calls]
+    async def get_height(self) -> int:
+        return self.height
+
+
+def test_resolves_and_persists(tmp_path):
+    chain = _Chain(20, 10, 20_000_000)
+    expected = {call: None if block > chain.height else block for call, block in chain.boundaries.items()}
+    path = tmp_path / "1.json"
+    resolver = AvailabilityResolver(chain.is_available, chain.get_height, path)
+    assert asyncio.run(resolver.resolve(chain.deploy_blocks)) == expected
+
+    chain.calls = 0
+    restarted = AvailabilityResolver(chain.is_available, chain.get_height, path)
+    assert all(restarted.get(call) == block for call, block in expected.items())
+    # NOTE: only the calls that still revert at the head are checked again
+    assert asyncio.run(restarted.resolve(chain.deploy_blocks)) == expected
+    assert chain.calls == 1
+
+
+def test_non_monotonic_call_keeps_its_history():
+    call = "0x" + "11" * 20, bytes(4)
+    # NOTE: the method worked early on, was removed by an upgrade and added back later
+    async def is_available(calls, block):
+        return [100 <= block < 300 or block >= 900 for _ in calls]
+    async def get_height():
+        return 1_000
+    resolver = AvailabilityResolver(is_available, get_height)
+    assert asyncio.run(resolver.resolve({call: 0})) == {call: 0}
@@ -0,0 +1,66 @@
+import asyncio
+import importlib.util
+import random
+import sys
+from bisect import bisect_right
+from pathlib import Path
+
+# NOTE: _blocktime imports _index, so we load that first under its real name
+_INDEX_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_index.py"
+_INDEX_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._index", _INDEX_PATH)
+)
+assert _INDEX_MODULE.__spec__ and _INDEX_MODULE.__spec__.loader
+_INDEX_MODULE.__spec__.loader.exec_module(_INDEX_MODULE)
+sys.modules.setdefault("evm_contract_exporter._index", _INDEX_MODULE)
+
+_BLOCKTIME_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_blocktime.py"
+_BLOCKTIME_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._blocktime", _BLOCKTIME_PATH)
+)
+assert _BLOCKTIME_MODULE.__spec__ and _BLOCKTIME_MODULE.__spec__.loader
+_BLOCKTIME_MODULE.__spec__.loader.exec_module(_BLOCKTIME_MODULE)
+
+BlockTimeIndex = _BLOCKTIME_MODULE.BlockTimeIndex
+
+
+class _Chain:
+    def __init__(self, blocks: int) -> None:
+        rng = random.Random(0)
+        self.timestamps = [1_600_000_000]
+        for _ in range(blocks - 1):
+            # mostly 12s blocks with the odd missed slot, and some blocks in the same second
+            self.timestamps.append(self.timestamps[-1] + rng.choice([12] * 20 + [24, 0]))
+        self.lookups = 0
+    async def get_timestamp(self, block: int) -> int:
+        self.lookups += 1
+        return self.timestamps[block]
+    async def get_height(self) -> int:
+        return len(self.timestamps) - 1
+    def block_at(self, seconds: int) -> int:
+        return bisect_right(self.timestamps, seconds) - 1
+
+
+def test_resolves_grid_and_persists(tmp_path):
+    chain = _Chain(200_000)
+    grid = list(range(chain.timestamps[0] + 3600, chain.timestamps[-1] - 3600, 3600))
+    path = tmp_path / "1.blocktime"
+    index = BlockTimeIndex(chain.get_timestamp, chain.get_height, path)
+    assert asyncio.run(index.blocks_at(grid)) == [chain.block_at(s) for s in grid]
+    # a bisection would take about 18 lookups for each
+    assert chain.lookups < 6 * len(grid)
+    index.save()
+
+    chain.lookups = 0
+    restarted = BlockTimeIndex(chain.get_timestamp, chain.get_height, path)
+    assert [restarted.cached(s) for s in grid] == [chain.block_at(s) for s in grid]
+    assert asyncio.run(restarted.block_at(grid[3] + 1800)) == chain.block_at(grid[3] + 1800)
+    assert chain.lookups < 18
+
+
+def test_outside_the_chain():
+    chain = _Chain(1_000)
+    index = BlockTimeIndex(chain.get_timestamp, chain.get_height)
+    assert asyncio.run(index.block_at(chain.timestamps[0] - 1)) is None
+    assert asyncio.run(index.block_at(chain.timestamps[-1] + 1)) is None
+    assert asyncio.run(index.block_at(chain.timestamps[0])) == chain.block_at(chain.timestamps[0])
@@ -0,0 +1,69 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+_CACHE_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_cache.py"
+_CACHE_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._cache", _CACHE_PATH)
+)
+assert _CACHE_MODULE.__spec__ and _CACHE_MODULE.__spec__.loader
+_CACHE_MODULE.__spec__.loader.exec_module(_CACHE_MODULE)
+
+ResultCache = _CACHE_MODULE.ResultCache
+
+
+def test_shared_by_readers():
+    calls = []
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return 42
+    async def main():
+        cache = ResultCache(maxsize=10)
+        assert await asyncio.gather(*[cache.get("key", produce, refs=3) for _ in range(3)]) == [42, 42, 42]
+        # every reader has read it, so it's no longer pinned
+        assert not cache._pinned and "key" in cache
+    asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_exceptions_are_shared():
+    calls = []
+    async def produce():
+        calls.append(1)
+        raise ValueError("reverted")
+    async def main():
+        cache = ResultCache(maxsize=10)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await cache.get("key", produce, refs=2)
+    asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_only_completed_entries_are_evicted():
+    released = asyncio.Event()
+    async def slow():
+        await released.wait()
+        return "slow"
+    async def main():
+        cache = ResultCache(maxsize=100)
+        # NOTE: one reader that hasn't shown up yet, and one call that's still in flight
+        cache.put("waiting", "waiting", refs=2)
+        assert await cache.get("waiting", None) == "waiting"
+        in_flight = asyncio.ensure_future(cache.get("slow", slow))
+        await asyncio.sleep(0)
+        for block in range(1_000):
+            cache.put(block, block)
+            assert await cache.get(block, None) == block
+        assert len(cache._done) == 100
+        assert 999 in cache and 899 not in cache
+        assert "waiting" in cache and "slow" in cache
+        assert await cache.get("waiting", None) == "waiting"
+        released.set()
+        assert await in_flight == "slow"
+        # NOTE: now they're done and unreferenced they're bounded like the rest
+        assert list(cache._done)[-2:] == ["waiting", "slow"] and not cache._pinned
+    asyncio.run(main())
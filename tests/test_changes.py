@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from evm_contract_exporter.datastore import kv
+from evm_contract_exporter.db import changes
+from tests.fixtures import sqlite_db
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+HOUR = timedelta(hours=1)
+ADDRESS = "0x0000000000000000000000000000000000000031"
+# pushed out of order, hour 6 fills the gap between the runs before it and after it
+VALUES = {0: 1, 1: 1, 2: 2, 3: 2, 4: 2, 5: 1, 7: 1, 6: 1}
+
+
+@pytest.fixture
+def store(sqlite_db, monkeypatch):
+    async def get_block_at_timestamp(ts):
+        return int(ts.timestamp()) // 12
+    async def ensure_entity(chainid, address):
+        sqlite_db.Address.insert_entity(chainid=chainid, address=address)
+    monkeypatch.setattr(kv, "get_block_at_timestamp", get_block_at_timestamp)
+    monkeypatch.setattr(kv, "ensure_entity", ensure_entity)
+    monkeypatch.setattr(kv.ENVS, "BULK_INSERT_MAX_LATENCY", 0.01)
+    yield kv.GenericContractTimeSeriesChangeStore
+    kv.get_cached_changes_for_address.cache_clear()
+
+
+def test_round_trip(store):
+    async def export():
+        exporter_store = store(1)
+        for hour, value in VALUES.items():
+            await exporter_store._push(ADDRESS, "fee", START + hour * HOUR, Decimal(value))
+        return await exporter_store.read(ADDRESS, ["fee"])
+
+    frame = asyncio.run(export())
+    assert list(frame["fee"]) == [VALUES[hour] for hour in range(8)]
+
+    coverage, changed = changes.load_series(1, ADDRESS)
+    start = int(START.timestamp())
+    # the coverage is merged into one run, the rows it replaced are gone
+    assert coverage == {"fee": [(start, 3600, 8)]}
+    assert changed == {"fee": [(start, 1), (start + 2 * 3600, 2), (start + 5 * 3600, 1)]}
+
+    # a restarted store rebuilds the series from the db
+    kv.get_cached_changes_for_address.cache_clear()
+    assert list(asyncio.run(store(1).read(ADDRESS, ["fee"]))["fee"]) == list(frame["fee"])
+
+
+def test_newest_first(store):
+    address = "0x0000000000000000000000000000000000000032"
+
+    async def export():
+        exporter_store = store(1)
+        # NOTE: the exporter fills newest first by default, every sample here is earlier than the ones already stored
+        for hour in reversed(range(100)):
+            await exporter_store._push(address, "fee", START + hour * HOUR, Decimal(2 if hour >= 50 else 1))
+        return await exporter_store.read(address, ["fee"])
+
+    frame = asyncio.run(export())
+    assert list(frame["fee"]) == [1] * 50 + [2] * 50
+    _, changed = changes.load_series(1, address)
+    start = int(START.timestamp())
+    assert changed == {"fee": [(start, 1), (start + 50 * 3600, 2)]}
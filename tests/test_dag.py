@@ -0,0 +1,74 @@
+import asyncio
+import importlib.util
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+from generic_exporters import Metric
+
+_DAG_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_dag.py"
+_DAG_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._dag", _DAG_PATH)
+)
+assert _DAG_MODULE.__spec__ and _DAG_MODULE.__spec__.loader
+_DAG_MODULE.__spec__.loader.exec_module(_DAG_MODULE)
+
+ExpressionGraph = _DAG_MODULE.ExpressionGraph
+
+
+class _Leaf(Metric):
+    def __init__(self, key: str, value) -> None:
+        super().__init__()
+        self._key = key
+        self.value = value
+    @property
+    def key(self) -> str:
+        return self._key
+    async def produce(self, timestamp):
+        return self.value
+
+
+def test_shared_leaves_and_subexpressions():
+    a, b, c = _Leaf("a", Decimal(6)), _Leaf("b", Decimal(2)), _Leaf("c", Decimal(4))
+    ratio, product, spread = a / b, a * c, (a - b) / c
+    # a separate object for the same expression shares its node
+    graph = ExpressionGraph([ratio, product, spread, a / b])
+    assert repr(graph) == "<ExpressionGraph outputs=4 leaves=3 nodes=4>"
+    produced = []
+    async def produce(metric):
+        produced.append(metric.key)
+        return metric.value
+    values = asyncio.run(graph.evaluate(produce, [ratio, product, spread]))
+    assert values == {ratio: 3, product: 24, spread: 1}
+    assert sorted(produced) == ["a", "b", "c"]
+
+
+def test_none_and_exceptions_pass_through():
+    a, b, c, zero = _Leaf("a", Decimal(6)), _Leaf("b", None), _Leaf("c", ValueError("reverted")), _Leaf("zero", Decimal(0))
+    outputs = [a / b, a * c, a / zero]
+    graph = ExpressionGraph(outputs)
+    async def produce(metric):
+        if isinstance(metric.value, Exception):
+            raise metric.value
+        return metric.value
+    values = asyncio.run(graph.evaluate(produce, outputs))
+    assert values[outputs[0]] is None
+    assert isinstance(values[outputs[1]], ValueError)
+    assert isinstance(values[outputs[2]], ArithmeticError)
+
+
+def test_columns():
+    pd = pytest.importorskip("pandas")
+    a, b = _Leaf("a", None), _Leaf("b", None)
+    ratio = (a - b) / b
+    graph = ExpressionGraph([ratio])
+    assert graph.leaves([ratio]) == [a, b]
+    index = pd.date_range("2024-01-01", periods=3, freq="D", tz="utc")
+    columns = {a: pd.Series([4.0, 9.0, None], index=index), b: pd.Series([2.0, 3.0, 1.0], index=index)}
+    derived = graph.evaluate_columns(columns, [ratio])[ratio]
+    assert derived.dropna().tolist() == [1.0, 2.0]
+    # NOTE: Decimal columns are computed exactly, like the rpc path, and a failed operation is NaN
+    index = pd.date_range("2024-01-01", periods=3, freq="D", tz="utc")
+    columns = {a: pd.Series([Decimal(4), Decimal(1), Decimal(1)], index=index, dtype=object), b: pd.Series([Decimal(3), Decimal(3), Decimal(0)], index=index, dtype=object)}
+    derived = graph.evaluate_columns(columns, [ratio])[ratio]
+    assert derived.dropna().tolist() == [Decimal(1) / Decimal(3), Decimal(-2) / Decimal(3)]
@@ -0,0 +1,61 @@
+import importlib.util
+from pathlib import Path
+
+import eth_abi
+import pytest
+from brownie.convert.normalize import format_output
+from web3.exceptions import ContractLogicError
+
+_DECODE_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_decode.py"
+_DECODE_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._decode", _DECODE_PATH)
+)
+assert _DECODE_MODULE.__spec__ and _DECODE_MODULE.__spec__.loader
+_DECODE_MODULE.__spec__.loader.exec_module(_DECODE_MODULE)
+
+layout = _DECODE_MODULE.layout
+
+
+def test_tuple_outputs():
+    outputs = [{"name": "", "type": "uint112"}, {"name": "", "type": "int24"}, {"name": "", "type": "uint256[2]"}, {"name": "", "type": "bool"}]
+    returndata = eth_abi.encode(["uint112", "int24", "uint256[2]", "bool"], [10**30, -5, [1, 2], True])
+    plan = layout(outputs)
+    assert plan.decode(returndata, plan.fields[0]) == 10**30
+    assert plan.decode(returndata, plan.fields[1]) == -5
+    assert plan.fields[2] is None
+    assert plan.decode(returndata, plan.fields[3]) is True
+    # NOTE: return data shorter than the abi says is handled like a revert
+    with pytest.raises(ContractLogicError):
+        plan.decode(returndata[:64], plan.fields[3])
+
+
+def test_same_types_as_brownie():
+    outputs = [{"name": "", "type": "uint256"}, {"name": "", "type": "int24"}, {"name": "", "type": "address"}, {"name": "", "type": "bytes4"}, {"name": "", "type": "bool"}]
+    values = [10**30, -5, "0x" + "ab" * 20, b"abcd", True]
+    returndata = eth_abi.encode([output["type"] for output in outputs], values)
+    plan = layout(outputs)
+    decoded = [plan.decode(returndata, slot) for slot in plan.fields]
+    expected = format_output({"name": "f", "outputs": outputs}, values)
+    assert [type(value) for value in decoded] == [type(value) for value in expected]
+    assert [bytes(value) if isinstance(value, bytes) else value for value in decoded] == [bytes(value) if isinstance(value, bytes) else value for value in expected]
+    # NOTE: addresses come back checksummed
+    assert str(decoded[2]) == "0xABaBaBaBABabABabAbAbABAbABabababaBaBABaB"
+
+
+def test_struct_fields():
+    outputs = [{"name": "", "type": "tuple", "components": [
+        {"name": "token", "type": "address"},
+        {"name": "inner", "type": "tuple", "components": [{"name": "a", "type": "uint8"}, {"name": "b", "type": "uint8"}]},
+        {"name": "balance", "type": "uint256"},
+    ]}]
+    returndata = eth_abi.encode(["(address,(uint8,uint8),uint256)"], [("0x" + "ab" * 20, (1, 2), 12345)])
+    plan = layout(outputs)
+    assert str(plan.decode(returndata, plan.names["token"])) == "0xABaBaBaBABabABabAbAbABAbABabababaBaBABaB"
+    assert plan.decode(returndata, plan.names["balance"]) == 12345
+    assert "inner" not in plan.names
+
+
+def test_dynamic_outputs():
+    assert layout([{"name": "", "type": "string"}]) is None
+    assert layout([{"name": "", "type": "uint256[]"}]) is None
+    assert layout([{"name": "", "type": "tuple", "components": [{"name": "data", "type": "bytes"}]}]) is None
@@ -0,0 +1,42 @@
+import asyncio
+import importlib.util
+import random
+from pathlib import Path
+
+_DEPLOY_BLOCKS_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_deploy_blocks.py"
+_DEPLOY_BLOCKS_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._deploy_blocks", _DEPLOY_BLOCKS_PATH)
+)
+assert _DEPLOY_BLOCKS_MODULE.__spec__ and _DEPLOY_BLOCKS_MODULE.__spec__.loader
+_DEPLOY_BLOCKS_MODULE.__spec__.loader.exec_module(_DEPLOY_BLOCKS_MODULE)
+
+DeployBlockResolver = _DEPLOY_BLOCKS_MODULE.DeployBlockResolver
+
+
+class _Chain:
+    def __init__(self, contracts: int, height: int) -> None:
+        rng = random.Random(0)
+        self.height = height
+        self.deploy_blocks = {f"0x{i:040x}": rng.randrange(height + 1) for i in range(1, contracts + 1)}
+        self.calls = 0
+    async def get_code_sizes(self, addresses, block):
+        self.calls += 1
+        return [int(address in self.deploy_blocks and self.deploy_blocks[address] <= block) for address in addresses]
+    async def get_height(self) -> int:
+        return self.height
+
+
+def test_resolves_together_and_persists(tmp_path):
+    chain = _Chain(2_000, 20_000_000)
+    eoa = f"0x{0xdead:040x}"
+    path = tmp_path / "1.json"
+    resolver = DeployBlockResolver(chain.get_code_sizes, chain.get_height, path)
+    assert asyncio.run(resolver.resolve([*chain.deploy_blocks, eoa])) == {**chain.deploy_blocks, eoa: None}
+    # bisecting each contract alone would take about 50_000 calls, the contracts share their probes until their ranges diverge
+    assert chain.calls < 30_000
+
+    chain.calls = 0
+    restarted = DeployBlockResolver(chain.get_code_sizes, chain.get_height, path)
+    assert all(restarted.get(address) == block for address, block in chain.deploy_blocks.items())
+    assert asyncio.run(restarted.resolve(chain.deploy_blocks)) == chain.deploy_blocks
+    assert chain.calls == 0
@@ -0,0 +1,167 @@
+import importlib.util
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+_INDEX_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_index.py"
+_INDEX_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._index", _INDEX_PATH)
+)
+assert _INDEX_MODULE.__spec__ and _INDEX_MODULE.__spec__.loader
+_INDEX_MODULE.__spec__.loader.exec_module(_INDEX_MODULE)
+
+TimestampIndex = _INDEX_MODULE.TimestampIndex
+StepFunction = _INDEX_MODULE.StepFunction
+update_runs = _INDEX_MODULE.update_runs
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+HOUR = timedelta(hours=1)
+
+
+def _grid(*hours):
+    return [START + h * HOUR for h in hours]
+
+
+def test_membership():
+    index = TimestampIndex(_grid(0, 1, 3))
+    assert START in index
+    assert START + 3 * HOUR in index
+    assert START + 2 * HOUR not in index
+    assert len(index) == 3
+
+
+def test_naive_datetimes_are_utc():
+    index = TimestampIndex([START.replace(tzinfo=None)])
+    assert START in index
+
+
+def test_add_in_place():
+    index = TimestampIndex(_grid(0, 2))
+    index.add(START + 3 * HOUR)
+    index.add(START + HOUR)
+    index.add(START + HOUR)
+    assert len(index) == 4
+    assert all(ts in index for ts in _grid(0, 1, 2, 3))
+    index.discard(START + HOUR)
+    index.discard(START + 5 * HOUR)
+    assert len(index) == 3
+    assert START + HOUR not in index
+
+
+def test_first_missing():
+    assert TimestampIndex().first_missing(START, HOUR) == START
+    assert TimestampIndex(_grid(1, 2)).first_missing(START, HOUR) == START
+    assert TimestampIndex(_grid(0, 1, 2, 3)).first_missing(START, HOUR) == START + 4 * HOUR
+    assert TimestampIndex(_grid(0, 1, 2, 4, 5)).first_missing(START, HOUR) == START + 3 * HOUR
+    assert TimestampIndex(_grid(0, 1, 2, 4, 5)).first_missing(START + 4 * HOUR, HOUR) == START + 6 * HOUR
+
+
+def test_first_missing_off_grid():
+    # NOTE: the epoch at hour 1 is between the slots of a 2 hour grid and makes the count after the gap at hour 2 look complete
+    index = TimestampIndex(_grid(0, 1, 4, 6, 8, 10))
+    assert index.first_missing(START, 2 * HOUR) == START + 2 * HOUR
+    # it's found again once the index is back on the grid, and after an off-grid add
+    index = TimestampIndex(_grid(0, 2, 4))
+    assert index.first_missing(START, 2 * HOUR) == START + 6 * HOUR
+    index.add(START + 5 * HOUR)
+    index.add(START + 7 * HOUR)
+    assert index.first_missing(START, 2 * HOUR) == START + 6 * HOUR
+
+
+def test_missing_spans():
+    end = START + 9 * HOUR
+    assert TimestampIndex().missing_spans(START, end, HOUR) == [(START, end)]
+    assert TimestampIndex(_grid(*range(10))).missing_spans(START, end, HOUR) == []
+    index = TimestampIndex(_grid(0, 1, 4, 5, 6, 8))
+    assert index.missing_spans(START, end, HOUR) == [
+        (START + 2 * HOUR, START + 3 * HOUR),
+        (START + 7 * HOUR, START + 7 * HOUR),
+        (START + 9 * HOUR, end),
+    ]
+    # `end` is rounded down onto the grid
+    assert index.missing_spans(START, end + HOUR / 2, HOUR)[-1] == (START + 9 * HOUR, end)
+    assert index.missing_spans(end, START, HOUR) == []
+
+
+def test_runs_round_trip():
+    index = TimestampIndex(_grid(0, 1, 2, 3, 7, 9, 11, 20))
+    start = int(START.timestamp())
+    assert index.runs() == [(start, 3600, 4), (start + 7 * 3600, 7200, 3), (start + 20 * 3600, 0, 1)]
+    assert TimestampIndex.from_runs(index.runs()).runs() == index.runs()
+    assert TimestampIndex().runs() == []
+
+
+def test_update_runs():
+    index = TimestampIndex(_grid(0, 1, 2, 3, 7, 9, 11, 20, 21, 40, 41, 42))
+    runs = index.runs()
+    stored = {run[0]: run for run in runs}
+    added = _grid(4, 5, 6, 22)
+    for ts in added:
+        index.add(ts)
+    removed, inserted = update_runs(runs, index, added)
+    for first in removed:
+        del stored[first]
+    stored.update((run[0], run) for run in inserted)
+    start = int(START.timestamp())
+    assert runs == sorted(stored.values())
+    assert TimestampIndex.from_runs(runs)._epochs == index._epochs
+    # the gap between the first 2 runs is filled, and the run after 22 is recompressed but doesn't change so it isn't rewritten
+    assert runs == [(start, 3600, 8), (start + 9 * 3600, 7200, 2), (start + 20 * 3600, 3600, 3), (start + 40 * 3600, 3600, 3)]
+    assert start + 40 * 3600 not in removed
+    assert update_runs(runs, index, []) == ([], [])
+
+
+def test_floor():
+    floor = int((START + 2 * HOUR).timestamp())
+    index = TimestampIndex(_grid(3), floor=floor)
+    assert START in index
+    assert START + 2 * HOUR not in index
+    assert index.first_missing(START, HOUR) == START + 2 * HOUR
+    assert index.missing_spans(START, START + 5 * HOUR, HOUR) == [(START + 2 * HOUR, START + 2 * HOUR), (START + 4 * HOUR, START + 5 * HOUR)]
+
+
+def test_neighbours():
+    index = TimestampIndex(_grid(1, 3))
+    start = int(START.timestamp())
+    assert list(index.between(START, START + 3 * HOUR)) == [start + 3600, start + 3 * 3600]
+    assert index.at_or_before(START + 2 * HOUR) == start + 3600
+    assert index.at_or_before(START) is None
+    assert index.after(START + HOUR) == start + 3 * 3600
+    assert index.after(START + 3 * HOUR) is None
+
+
+def _observe(steps, observed, hour, value, removed=None):
+    changes, redundant = steps.observe(observed, START + hour * HOUR, value)
+    observed.add(START + hour * HOUR)
+    if removed is not None:
+        removed.extend((seconds - int(START.timestamp())) // 3600 for seconds in redundant)
+    return [((seconds - int(START.timestamp())) // 3600, value) for seconds, value in changes]
+
+
+def test_step_function_only_keeps_changes():
+    steps, observed = StepFunction(), TimestampIndex()
+    assert _observe(steps, observed, 0, 1) == [(0, 1)]
+    assert _observe(steps, observed, 1, 1) == []
+    assert _observe(steps, observed, 2, 2) == [(2, 2)]
+    assert len(steps) == 2
+    assert steps.expand(_grid(0, 1, 2, 3)) == [1, 1, 2, 2]
+    assert steps.at(START - HOUR) is None
+
+
+def test_step_function_out_of_order():
+    steps, observed = StepFunction(), TimestampIndex()
+    _observe(steps, observed, 0, 1)
+    _observe(steps, observed, 2, 1)
+    # the observation at hour 2 has to keep its value once hour 1 changes it
+    assert _observe(steps, observed, 1, 5) == [(1, 5), (2, 1)]
+    assert steps.expand(_grid(0, 1, 2)) == [1, 5, 1]
+    assert _observe(steps, observed, 3, 1) == []
+
+
+def test_step_function_newest_first():
+    steps, observed, removed = StepFunction(), TimestampIndex(), []
+    for hour in reversed(range(6)):
+        _observe(steps, observed, hour, 2 if hour >= 4 else 1, removed)
+    # each earlier sample moves the change back instead of adding a new one
+    assert len(steps) == 2
+    assert removed == [5, 3, 2, 1]
+    assert steps.expand(_grid(*range(6))) == [1, 1, 1, 1, 2, 2]
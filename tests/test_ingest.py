@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from pony.orm import select
+from web3.exceptions import ContractLogicError
+
+from evm_contract_exporter.datastore import kv
+from evm_contract_exporter.db import _pgcopy, read
+from evm_contract_exporter.db.ingest import staging_types
+from tests.fixtures import sqlite_db
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+HOUR = timedelta(hours=1)
+
+
+@pytest.mark.parametrize("store_type, address", [
+    (kv.GenericContractTimeSeriesKeyValueStore, "0x0000000000000000000000000000000000000021"),
+    (kv.GenericContractTimeSeriesKeyValueStoreV2, "0x0000000000000000000000000000000000000022"),
+    (kv.GenericContractTimeSeriesRawStore, "0x0000000000000000000000000000000000000023"),
+    (kv.GenericContractTimeSeriesChangeStore, "0x0000000000000000000000000000000000000024"),
+])
+def test_ingest(sqlite_db, store_type, address):
+    async def items():
+        store = store_type(1)
+        sqlite_db.Address.insert_entity(chainid=1, address=address)
+        if store.raw:
+            await store._record_scale(address, "totalSupply", None)
+        elif isinstance(store, kv.GenericContractTimeSeriesKeyValueStoreV2):
+            await store._metric_id("totalSupply")
+        return store, [
+            store.BulkInsertItem(address, "totalSupply", START + i * HOUR, i, store._prepare_value(address, "totalSupply", START + i * HOUR, Decimal(i) / 4))
+            for i in range(2)
+        ]
+
+    store, rows = asyncio.run(items())
+    # NOTE: the copy path needs postgres, but we can check every column has a staging type the rows can be encoded as
+    assert set(staging_types(store._entity)) == set(store._columns)
+    types = [staging_types(store._entity)[column] for column in store._columns]
+    assert _pgcopy.encode_rows(types, rows)
+    # the second batch is all duplicates, which are ignored
+    sqlite_db.ingest(store._entity, store._columns, rows)
+    sqlite_db.ingest(store._entity, store._columns, rows)
+    stored = read.read_rows(store._entity, 1, address, ["totalSupply"], 0, 2 ** 62)
+    assert [ts for _, ts, _ in stored] == [int((START + i * HOUR).timestamp()) for i in range(2)]
+
+
+def test_bad_rows_are_isolated(sqlite_db, monkeypatch):
+    address = "0x0000000000000000000000000000000000000025"
+    async def ensure_entity(chainid, address):
+        sqlite_db.Address.insert_entity(chainid=chainid, address=address)
+    monkeypatch.setattr(kv, "ensure_entity", ensure_entity)
+    inserted, running = [], []
+
+    async def insert():
+        store = kv.GenericContractTimeSeriesKeyValueStore(1)
+        items = [store.BulkInsertItem(address, "totalSupply", START + i * HOUR, i, Decimal(i)) for i in range(8)]
+        async def ingest(batch):
+            running.append(batch)
+            await asyncio.sleep(0)
+            # NOTE: the retries must not pile up, we only ever want one insert in flight
+            assert running == [batch]
+            running.remove(batch)
+            if items[5] in batch:
+                raise ValueError("bad row")
+            inserted.extend(batch)
+        store._ingest = ingest
+        futures = [store._pending_inserts[item] for item in items]
+        await store.BulkInsertItem.bulk_insert(items)
+        return items, futures
+
+    items, futures = asyncio.run(insert())
+    assert sorted(inserted, key=items.index) == items[:5] + items[6:]
+    assert isinstance(futures[5].exception(), ValueError)
+    assert all(future.result() is None for i, future in enumerate(futures) if i != 5)
+
+
+def test_rollups_commit_with_the_rows(sqlite_db, monkeypatch):
+    address = "0x0000000000000000000000000000000000000026"
+    async def ensure_entity(chainid, address):
+        sqlite_db.Address.insert_entity(chainid=chainid, address=address)
+    monkeypatch.setattr(kv, "ensure_entity", ensure_entity)
+    monkeypatch.setattr(kv.ENVS, "DB_ROLLUPS", True)
+    update_rollups = kv.rollup.update_rollups
+    def fail(chainid, rows):
+        update_rollups(chainid, rows)
+        raise RuntimeError("rollup failed")
+
+    async def insert():
+        store = kv.GenericContractTimeSeriesKeyValueStoreV2(1)
+        await store._metric_id("totalSupply")
+        items = [store.BulkInsertItem(address, "totalSupply", START + i * HOUR, i, Decimal(i)) for i in range(2)]
+        monkeypatch.setattr(kv.rollup, "update_rollups", fail)
+        with pytest.raises(RuntimeError):
+            await store._ingest(items)
+        # NOTE: the rows were rolled back along with the rollups
+        assert read.read_rows(store._entity, 1, address, ["totalSupply"], 0, 2 ** 62) == []
+        monkeypatch.setattr(kv.rollup, "update_rollups", update_rollups)
+        await store._ingest(items)
+
+    asyncio.run(insert())
+    assert len(read.read_rows(sqlite_db.ContractDataTimeSeriesV2, 1, address, ["totalSupply"], 0, 2 ** 62)) == 2
+
+    @sqlite_db.session
+    def samples():
+        return select((r.resolution, r.bucket, r.samples) for r in sqlite_db.ContractDataRollup if r.address.address == address)[:]
+
+    start = int(START.timestamp())
+    assert sorted(samples()) == [(3600, start, 1), (3600, start + 3600, 1), (86400, start, 2)]
+
+
+def test_rollups_skip_reverts_not_minus_one(sqlite_db, monkeypatch):
+    address = "0x0000000000000000000000000000000000000027"
+    async def ensure_entity(chainid, address):
+        sqlite_db.Address.insert_entity(chainid=chainid, address=address)
+    monkeypatch.setattr(kv, "ensure_entity", ensure_entity)
+    monkeypatch.setattr(kv.ENVS, "DB_ROLLUPS", True)
+
+    async def insert():
+        store = kv.GenericContractTimeSeriesKeyValueStoreV2(1)
+        await store._metric_id("totalSupply")
+        values = [Decimal(-1), ContractLogicError("execution reverted")]
+        await store._ingest([
+            store.BulkInsertItem(address, "totalSupply", START + i * HOUR, i, store._prepare_value(address, "totalSupply", START + i * HOUR, value))
+            for i, value in enumerate(values)
+        ])
+
+    asyncio.run(insert())
+
+    @sqlite_db.session
+    def rollups():
+        return select((r.resolution, r.bucket, r.min_value, r.samples) for r in sqlite_db.ContractDataRollup if r.address.address == address)[:]
+
+    start = int(START.timestamp())
+    assert sorted(rollups()) == [(3600, start, -1, 1), (86400, start, -1, 1)]
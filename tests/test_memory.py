@@ -0,0 +1,106 @@
+import asyncio
+import csv
+from collections import namedtuple
+from types import MethodType, SimpleNamespace
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from evm_contract_exporter.datastore import memory
+from evm_contract_exporter.exporters import _base
+from evm_contract_exporter.exporters._base import _ContractMetricExporterBase
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+HOUR = timedelta(hours=1)
+ADDRESS = "0x0000000000000000000000000000000000000001"
+_Metric = namedtuple("_Metric", ["address", "key"])
+
+
+@pytest.fixture
+def blocks(monkeypatch):
+    async def get_block_at_timestamp(ts):
+        # NOTE: yield to the loop like a real lookup would, so concurrent pushes interleave
+        await asyncio.sleep(0)
+        return int(ts.timestamp()) // 12
+    monkeypatch.setattr(memory, "get_block_at_timestamp", get_block_at_timestamp)
+
+
+def test_push(tmp_path, blocks):
+    # pushed out of order, to check `series` sorts them
+    timestamps = [START + 2 * HOUR, START, START + HOUR]
+
+    async def export():
+        store = memory.InMemoryTimeSeriesDataStore(1)
+        # NOTE: the same datapoint pushed twice at once must only be kept once
+        await asyncio.gather(*[store._push(ADDRESS, "totalSupply", ts, Decimal(i)) for i, ts in enumerate(timestamps)], store._push(ADDRESS, "totalSupply", START, Decimal(9)))
+        await store._push(ADDRESS, "totalSupply", START + HOUR, Decimal(9))
+        return store
+
+    store = asyncio.run(export())
+    assert len(store) == 3
+    epochs, block_numbers, values = store.series(ADDRESS, "totalSupply")
+    assert list(epochs) == [int((START + i * HOUR).timestamp()) for i in range(3)]
+    assert list(block_numbers) == [epoch // 12 for epoch in epochs]
+    assert list(values) == [1.0, 2.0, 0.0]
+    assert list(store.series(ADDRESS, "decimals")[0]) == []
+
+    path = tmp_path / "dump.csv"
+    store.dump(str(path))
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["chainid", "address", "metric", "timestamp", "block", "value"]
+    assert [row[3] for row in rows[1:]] == [str(epoch) for epoch in epochs]
+    assert [float(row[5]) for row in rows[1:]] == [1.0, 2.0, 0.0]
+
+
+def test_missing_timestamps_many_addresses(blocks):
+    other = "0x0000000000000000000000000000000000000002"
+
+    async def missing():
+        store = memory.InMemoryTimeSeriesDataStore(1)
+        # NOTE: the first address is complete, the second one is missing hour 1
+        for hour in range(3):
+            await store._push(ADDRESS, "ypm_price", START + hour * HOUR, Decimal(1))
+        for hour in (0, 2):
+            await store._push(other, "ypm_price", START + hour * HOUR, Decimal(1))
+        exporter = _exporter(store, [_Metric(address, "ypm_price") for address in (ADDRESS, other)])
+        return await _ContractMetricExporterBase.__dict__["missing_timestamps"].__wrapped__(exporter, START + 2 * HOUR), await exporter._missing_spans(exporter.query.metrics, START, START + 3 * HOUR)
+
+    timestamps, spans = asyncio.run(missing())
+    assert timestamps == [START + HOUR]
+    # NOTE: hour 3 is missing for both addresses, the spans are merged so `run` can check each timestamp against them
+    assert spans == [(START + HOUR, START + HOUR), (START + 3 * HOUR, START + 3 * HOUR)]
+    assert [_base._within(spans, START + hour * HOUR) for hour in range(5)] == [False, True, False, True, False]
+
+
+def test_wanted_spans_start_per_metric(blocks):
+    late, other = _Metric(ADDRESS, "late"), _Metric(ADDRESS, "other")
+
+    async def wanted(gaps_only):
+        store = memory.InMemoryTimeSeriesDataStore(1)
+        # NOTE: `late` starts working at hour 2 and has nothing stored before it, `other` works from the start and is missing hour 3
+        for hour in (2, 3):
+            await store._push(ADDRESS, "late", START + hour * HOUR, Decimal(1))
+        for hour in (0, 1, 2):
+            await store._push(ADDRESS, "other", START + hour * HOUR, Decimal(1))
+        exporter = _exporter(store, [late, other], gaps_only=gaps_only, _starts={late: START + 2 * HOUR})
+        return await exporter._wanted_spans(START + 3 * HOUR)
+
+    # the history before `late` starts is only skipped for `late`
+    assert asyncio.run(wanted(True)) == [(START + 3 * HOUR, START + 3 * HOUR)]
+    assert asyncio.run(wanted(False)) == [(START, START + 3 * HOUR)]
+
+
+def _exporter(store, metrics, **attrs):
+    class Query:
+        interval = HOUR
+        @property
+        def __start_timestamp__(self):
+            return asyncio.sleep(0, START)
+    query = Query()
+    query.metrics = metrics
+    exporter = SimpleNamespace(query=query, datastore=store, **{"gaps_only": False, "_starts": {}, **attrs})
+    exporter._missing_spans = MethodType(_ContractMetricExporterBase._missing_spans, exporter)
+    exporter._wanted_spans = MethodType(_ContractMetricExporterBase._wanted_spans, exporter)
+    return exporter
@@ -0,0 +1,100 @@
+import asyncio
+
+import eth_abi
+from brownie.network.contract import ContractCall
+
+from evm_contract_exporter import _exceptions, _multicall, types
+from evm_contract_exporter.datastore import _entities
+from evm_contract_exporter.metric import ContractCallMetric, _call_results
+from tests.fixtures import sqlite_db
+
+TOKEN = "0x0000000000000000000000000000000000000041"
+_TOTAL_SUPPLY = {"name": "totalSupply", "type": "function", "stateMutability": "view", "inputs": [], "outputs": [{"name": "", "type": "uint256"}]}
+
+
+def _total_supply() -> ContractCallMetric:
+    return ContractCallMetric(ContractCall(TOKEN, _TOTAL_SUPPLY, "totalSupply", None))
+
+
+def test_encode_decode():
+    calls = [(TOKEN, bytes.fromhex("18160ddd")), (_multicall.MULTICALL3, b"")]
+    calldata = _multicall.encode_aggregate3(calls)
+    assert calldata[:4] == bytes.fromhex("82ad56cb")
+    (decoded,) = eth_abi.decode(["(address,bool,bytes)[]"], calldata[4:])
+    assert [(target.lower(), allow_failure, data) for target, allow_failure, data in decoded] == [(target.lower(), True, data) for target, data in calls]
+
+    results = [(True, eth_abi.encode(["uint256"], [10 ** 18])), (False, b"")]
+    assert _multicall.decode_aggregate3(eth_abi.encode(["(bool,bytes)[]"], [results])) == results
+
+
+def test_prime_failure_is_a_revert():
+    async def read():
+        metric = _total_supply()
+        metric._prime(1, False, b"")
+        try:
+            await _call_results.get(metric._result_key(1), _never)
+        except Exception as e:
+            return e
+
+    assert _exceptions._is_revert(asyncio.run(read()))
+
+
+def test_prefetch_dedupes_identical_calls(monkeypatch):
+    made = []
+    returndata = eth_abi.encode(["uint256"], [7])
+    async def aggregate3(calls, block):
+        made.extend(calls)
+        return [(True, returndata)] * len(calls)
+    async def get_deploy_block(address):
+        return 0
+    monkeypatch.setattr(_multicall, "aggregate3", aggregate3)
+    monkeypatch.setattr(_multicall.utils, "get_deploy_block", get_deploy_block)
+
+    async def prefetch():
+        # NOTE: 2 objects that make the same call, the result must be cached for both of their readers
+        metrics = _total_supply(), _total_supply()
+        await _multicall.prefetch(metrics, 2)
+        return await asyncio.gather(*[_call_results.get(metric._result_key(2), _never) for metric in metrics])
+
+    # NOTE: calls with a known output layout cache the returndata and decode it themselves
+    assert asyncio.run(prefetch()) == [returndata, returndata]
+    assert len(made) == 1
+    # NOTE: the result was pinned for exactly the readers we passed, so nothing is left pinned
+    assert not _call_results._pinned
+    # the unscaled output is wrapped like brownie's would be
+    assert isinstance(_total_supply()._value(returndata), types.uint256)
+
+
+def test_entity_outputs():
+    selector, output_types = _entities._parse_signature("getReserves()(uint112,uint112,uint32)")
+    assert selector == bytes.fromhex("0902f1ac")
+    assert output_types == ["uint112", "uint112", "uint32"]
+    token = "0xcA11bde05977b3631167028862bE2a173976CA11"
+    assert _entities._decode(["address"], True, eth_abi.encode(["address"], [token])) == token
+    assert _entities._decode(output_types, True, eth_abi.encode(output_types, [1, 2, 3])) == (1, 2, 3)
+    assert _entities._decode(["uint8"], False, b"") is None
+    # a bytes32 symbol doesn't decode as a string, nor does an address without code
+    assert _entities._decode(["string"], True, b"TKN".ljust(32, b"\0")) is None
+    assert _entities._decode(["string"], True, b"") is None
+
+
+def test_unresolvable_entity_is_inserted_bare(sqlite_db, monkeypatch):
+    address = "0x0000000000000000000000000000000000000042"
+    attempts = []
+    class ERC20:
+        def __init__(self, address, asynchronous):
+            attempts.append(address)
+            raise ConnectionError("node is down")
+    monkeypatch.setattr(_entities, "ERC20", ERC20)
+    monkeypatch.setattr(_entities, "_RETRY_DELAY", 0)
+
+    enricher = _entities.EntityEnricher(1)
+    asyncio.run(enricher._resolve_one(address))
+    assert len(attempts) == _entities._MAX_ATTEMPTS
+    # NOTE: the datastores need this row for their foreign keys
+    assert address in enricher._known
+    assert sqlite_db.Address.existing(1, [address]) == [address]
+
+
+async def _never():
+    raise AssertionError("the result should have been cached")
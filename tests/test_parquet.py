@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from evm_contract_exporter.datastore import parquet
+
+START = datetime(2024, 1, 31, 22, tzinfo=timezone.utc)
+HOUR = timedelta(hours=1)
+ADDRESS = "0x0000000000000000000000000000000000000001"
+
+
+@pytest.fixture
+def blocks(monkeypatch):
+    async def get_block_at_timestamp(ts):
+        return int(ts.timestamp()) // 12
+    monkeypatch.setattr(parquet, "get_block_at_timestamp", get_block_at_timestamp)
+    monkeypatch.setattr(parquet.ENVS, "BULK_INSERT_MAX_LATENCY", 0.01)
+
+
+def test_round_trip(tmp_path, blocks):
+    timestamps = [START + i * HOUR for i in range(4)]
+
+    async def export():
+        store = parquet.ParquetTimeSeriesDataStore(1, root=str(tmp_path))
+        # NOTE: the same datapoint pushed twice at once must only be written once
+        await asyncio.gather(*[store._push(ADDRESS, "totalSupply", ts, Decimal(i) / 4) for i, ts in enumerate(timestamps)], store._push(ADDRESS, "totalSupply", START, Decimal(0)))
+        return store
+
+    store = asyncio.run(export())
+    # 2 hours in january and 2 in february
+    assert len(list(tmp_path.glob("chainid=1/address=*/month=*/*.parquet"))) == 2
+    table = store.read_table(ADDRESS).sort_by("timestamp")
+    assert table.column("timestamp").to_pylist() == timestamps
+    assert table.column("value").to_pylist() == [Decimal(i) / 4 for i in range(4)]
+    assert table.column("block").to_pylist() == [int(ts.timestamp()) // 12 for ts in timestamps]
+    assert store.read_table(ADDRESS, start=START + 2 * HOUR).num_rows == 2
+
+    restarted = parquet.ParquetTimeSeriesDataStore(1, root=str(tmp_path))
+    indexes = asyncio.run(restarted._get_indexes(ADDRESS))
+    assert all(ts in indexes["totalSupply"] for ts in timestamps)
+    assert START + 4 * HOUR not in indexes["totalSupply"]
+
+
+def test_compact(tmp_path, blocks):
+    timestamps = [START + i * HOUR for i in range(2)]
+
+    async def export():
+        store = parquet.ParquetTimeSeriesDataStore(1, root=str(tmp_path))
+        # NOTE: one push at a time so each row lands in its own part file
+        for i, ts in enumerate(timestamps):
+            await store._push(ADDRESS, "totalSupply", ts, Decimal(i))
+        return store
+
+    store = asyncio.run(export())
+    parts = list(tmp_path.glob("chainid=1/address=*/month=*/*.parquet"))
+    assert len(parts) == 2
+    store.compact(ADDRESS)
+    assert len(list(tmp_path.glob("chainid=1/address=*/month=*/*.parquet"))) == 1
+    assert store.read_table(ADDRESS).sort_by("timestamp").column("value").to_pylist() == [Decimal(0), Decimal(1)]
+
+    # a compaction that was interrupted before it deleted the parts it merged is finished on the next load
+    merged, = tmp_path.glob("chainid=1/address=*/month=*/*.parquet")
+    table = parquet.pq.read_table(merged)
+    for i, part in enumerate(parts):
+        parquet.pq.write_table(table.slice(i, 1).replace_schema_metadata(None), part)
+    assert len(list(tmp_path.glob("chainid=1/address=*/month=*/*.parquet"))) == 3
+    restarted = parquet.ParquetTimeSeriesDataStore(1, root=str(tmp_path))
+    indexes = asyncio.run(restarted._get_indexes(ADDRESS))
+    assert list(tmp_path.glob("chainid=1/address=*/month=*/*.parquet")) == [merged]
+    assert all(ts in indexes["totalSupply"] for ts in timestamps)
+    assert restarted.read_table(ADDRESS).num_rows == 2
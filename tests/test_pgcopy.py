@@ -0,0 +1,46 @@
+import importlib.util
+import struct
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from pathlib import Path
+
+_PGCOPY_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "db" / "_pgcopy.py"
+_PGCOPY_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter.db._pgcopy", _PGCOPY_PATH)
+)
+assert _PGCOPY_MODULE.__spec__ and _PGCOPY_MODULE.__spec__.loader
+_PGCOPY_MODULE.__spec__.loader.exec_module(_PGCOPY_MODULE)
+
+encode_numeric = _PGCOPY_MODULE.encode_numeric
+encode_timestamp = _PGCOPY_MODULE.encode_timestamp
+encode_rows = _PGCOPY_MODULE.encode_rows
+
+
+def _numeric(ndigits, weight, sign, dscale, *digits):
+    return struct.pack(f">hhHh{len(digits)}h", ndigits, weight, sign, dscale, *digits)
+
+
+def test_numeric():
+    assert encode_numeric(Decimal("1.5")) == _numeric(2, 0, 0, 1, 1, 5000)
+    assert encode_numeric(Decimal("-12345.678")) == _numeric(3, 1, 0x4000, 3, 1, 2345, 6780)
+    assert encode_numeric(Decimal("0.00000001")) == _numeric(1, -2, 0, 8, 1)
+    assert encode_numeric(10_000) == _numeric(1, 1, 0, 0, 1)
+    assert encode_numeric(Decimal("0.000")) == _numeric(0, 0, 0, 3)
+    assert encode_numeric(Decimal("NaN")) == _numeric(0, 0, 0xC000, 0)
+
+
+def test_timestamp():
+    epoch = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    assert encode_timestamp(epoch) == struct.pack(">q", 0)
+    assert encode_timestamp(epoch.replace(tzinfo=None) - timedelta(microseconds=1)) == struct.pack(">q", -1)
+
+
+def test_rows():
+    payload = encode_rows(["int4", "text"], [(1, "a"), (2, None)])
+    assert payload.startswith(b"PGCOPY\n\xff\r\n\x00")
+    assert payload.endswith(struct.pack(">h", -1))
+    body = payload[19:-2]
+    assert body == (
+        struct.pack(">hi", 2, 4) + struct.pack(">i", 1) + struct.pack(">i", 1) + b"a"
+        + struct.pack(">hi", 2, 4) + struct.pack(">i", 2) + struct.pack(">i", -1)
+    )
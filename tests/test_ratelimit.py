@@ -0,0 +1,65 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+_RATELIMIT_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_ratelimit.py"
+_RATELIMIT_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._ratelimit", _RATELIMIT_PATH)
+)
+assert _RATELIMIT_MODULE.__spec__ and _RATELIMIT_MODULE.__spec__.loader
+_RATELIMIT_MODULE.__spec__.loader.exec_module(_RATELIMIT_MODULE)
+
+RateLimiter = _RATELIMIT_MODULE.RateLimiter
+
+
+def test_concurrency_limit():
+    limiter = RateLimiter(rate=10_000, concurrency=8, max_concurrency=8)
+    active, peak = 0, 0
+    async def request():
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.001)
+        active -= 1
+        return 1
+    async def main():
+        return await asyncio.gather(*[limiter.call(request) for _ in range(200)])
+    assert asyncio.run(main()) == [1] * 200
+    assert peak == 8
+
+
+def test_backs_off_once_per_overload():
+    limiter = RateLimiter(rate=10_000, concurrency=64)
+    overloaded = 20
+    async def request():
+        nonlocal overloaded
+        await asyncio.sleep(0.001)
+        if overloaded:
+            overloaded -= 1
+            raise ValueError("429 Client Error: Too Many Requests")
+        return 1
+    async def main():
+        return await asyncio.gather(*[limiter.call(request) for _ in range(50)])
+    # every rate limited request is retried until it succeeds
+    assert asyncio.run(main()) == [1] * 50
+    assert limiter.throttled == 20
+    assert limiter.rate < 10_000 / 2 + 100
+    assert limiter.rate > 10_000 / 4
+
+
+def test_untimed_requests_dont_hold_the_limits():
+    clock = [0.0]
+    limiter = RateLimiter(rate=100, concurrency=8, clock=lambda: clock[0])
+    async def request(delay):
+        clock[0] += delay
+        return 1
+    async def main():
+        await limiter.call(lambda: request(0.01))
+        concurrency = limiter.concurrency
+        # NOTE: a request held back for a batch looks like the node slowing down, it mustn't stop the limits growing
+        for _ in range(5):
+            await limiter.call(lambda: request(1.0), timed=False)
+        assert limiter.concurrency == concurrency + 5
+        await limiter.call(lambda: request(1.0))
+        assert limiter.concurrency == concurrency + 5
+    asyncio.run(main())
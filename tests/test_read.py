@@ -0,0 +1,101 @@
+import asyncio
+import math
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from web3.exceptions import ContractLogicError
+
+pytest.importorskip("pandas")
+
+from evm_contract_exporter.datastore import kv
+from tests.fixtures import sqlite_db
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+HOUR = timedelta(hours=1)
+KEYS = "totalSupply", "getReserves"
+# NOTE: getReserves reverts at hour 1 and is missing at hour 2
+POINTS = [
+    ("totalSupply", 0, Decimal("1.5")),
+    ("totalSupply", 1, Decimal("2.5")),
+    ("totalSupply", 2, Decimal("3.5")),
+    ("totalSupply", 3, Decimal("4.5")),
+    ("getReserves", 0, Decimal("10")),
+    ("getReserves", 1, ContractLogicError("execution reverted")),
+    ("getReserves", 3, Decimal("30")),
+]
+
+
+@pytest.mark.parametrize("store_type, address", [
+    (kv.GenericContractTimeSeriesKeyValueStore, "0x0000000000000000000000000000000000000011"),
+    (kv.GenericContractTimeSeriesKeyValueStoreV2, "0x0000000000000000000000000000000000000012"),
+    (kv.GenericContractTimeSeriesRawStore, "0x0000000000000000000000000000000000000013"),
+])
+def test_read(sqlite_db, store_type, address):
+    async def read():
+        store = store_type(1)
+        sqlite_db.Address.insert_entity(chainid=1, address=address)
+        for key in KEYS:
+            if store.raw:
+                # NOTE: values that aren't contract call outputs are stored in fixed point
+                await store._record_scale(address, key, None)
+            elif isinstance(store, kv.GenericContractTimeSeriesKeyValueStoreV2):
+                await store._metric_id(key)
+        items = [
+            store.BulkInsertItem(address, key, START + hour * HOUR, hour, store._prepare_value(address, key, START + hour * HOUR, value))
+            for key, hour, value in POINTS
+        ]
+        sqlite_db.ingest(store._entity, store._columns, items)
+        return (
+            await store.read(address, KEYS, START, START + 2 * HOUR),
+            await store.read(address, KEYS, drop_reverts=True),
+            await store.read_asof(address, [*KEYS, "decimals"], START + 2 * HOUR),
+            await store.read(address, KEYS, drop_reverts=True, exact=True),
+        )
+
+    window, full, asof, exact = asyncio.run(read())
+    revert = -1
+
+    assert list(window.columns) == list(KEYS)
+    assert list(window.index) == [START, START + HOUR, START + 2 * HOUR]
+    assert (window.dtypes == "float64").all()
+    assert list(window["totalSupply"]) == [1.5, 2.5, 3.5]
+    assert window["getReserves"][START + HOUR] == revert
+    assert math.isnan(window["getReserves"][START + 2 * HOUR])
+
+    assert len(full) == 4
+    assert math.isnan(full["getReserves"][START + HOUR])
+    assert full["getReserves"][START + 3 * HOUR] == 30
+    # the exact frame holds the stored Decimals
+    assert list(exact["totalSupply"]) == [Decimal("1.5"), Decimal("2.5"), Decimal("3.5"), Decimal("4.5")]
+    assert all(type(value) is Decimal for value in exact["totalSupply"])
+    assert exact["getReserves"][START + 3 * HOUR] == Decimal(30)
+
+    assert list(asof.index) == [*KEYS, "decimals"]
+    assert asof["value"]["totalSupply"] == 3.5
+    assert asof["timestamp"]["totalSupply"] == START + 2 * HOUR
+    # NOTE: the last value at or before the timestamp, not the last stored one
+    assert asof["value"]["getReserves"] == revert
+    assert math.isnan(asof["value"]["decimals"])
+
+
+def test_raw_minus_one_is_not_a_revert(sqlite_db):
+    address = "0x0000000000000000000000000000000000000014"
+
+    async def read():
+        store = kv.GenericContractTimeSeriesRawStore(1)
+        sqlite_db.Address.insert_entity(chainid=1, address=address)
+        await store._record_scale(address, "totalSupply", None)
+        values = [Decimal(-1) / 10 ** 18, ContractLogicError("execution reverted")]
+        items = [
+            store.BulkInsertItem(address, "totalSupply", START + hour * HOUR, hour, store._prepare_value(address, "totalSupply", START + hour * HOUR, value))
+            for hour, value in enumerate(values)
+        ]
+        # NOTE: the fixed point raw value of the first one is -1, the same as the revert marker
+        assert items[0].value == -1
+        sqlite_db.ingest(store._entity, store._columns, items)
+        return await store.read(address, ["totalSupply"]), await store.read(address, ["totalSupply"], drop_reverts=True)
+
+    frame, dropped = asyncio.run(read())
+    assert list(frame["totalSupply"]) == [-1 / 10 ** 18, -1]
+    assert list(dropped["totalSupply"]) == [-1 / 10 ** 18]
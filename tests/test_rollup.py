@@ -0,0 +1,37 @@
+import importlib.util
+from decimal import Decimal
+from pathlib import Path
+
+_ROLLUP_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_rollup.py"
+_ROLLUP_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._rollup", _ROLLUP_PATH)
+)
+assert _ROLLUP_MODULE.__spec__ and _ROLLUP_MODULE.__spec__.loader
+_ROLLUP_MODULE.__spec__.loader.exec_module(_ROLLUP_MODULE)
+
+Aggregate = _ROLLUP_MODULE.Aggregate
+aggregate = _ROLLUP_MODULE.aggregate
+HOUR = _ROLLUP_MODULE.HOUR
+DAY = _ROLLUP_MODULE.DAY
+
+START = 1704067200  # 2024-01-01
+
+
+def test_aggregate():
+    points = [(START + 15 * 60 * i, Decimal(i)) for i in range(8)]
+    hourly = aggregate(points, HOUR)
+    assert sorted(hourly) == [START, START + HOUR]
+    assert hourly[START] == Aggregate(START + 45 * 60, 3, 0, 3, 6, 4)
+    assert hourly[START + HOUR].avg == Decimal("5.5")
+    assert aggregate(points, DAY)[START] == Aggregate(START + 7 * 15 * 60, 7, 0, 7, 28, 8)
+
+
+def test_merge_is_order_independent():
+    early, late = Aggregate.of(START, Decimal(5)), Aggregate.of(START + 60, Decimal(-1))
+    late.merge(early)
+    assert late == Aggregate(START + 60, -1, -1, 5, 4, 2)
+
+
+def test_sum_keeps_precision():
+    big = Decimal("99999999999999999999.999999999999999999")
+    assert aggregate([(START, big), (START + 1, big)], HOUR)[START].sum == 2 * big
@@ -0,0 +1,67 @@
+import importlib.util
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+_SCHEDULE_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_schedule.py"
+_SCHEDULE_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._schedule", _SCHEDULE_PATH)
+)
+assert _SCHEDULE_MODULE.__spec__ and _SCHEDULE_MODULE.__spec__.loader
+_SCHEDULE_MODULE.__spec__.loader.exec_module(_SCHEDULE_MODULE)
+
+Schedule = _SCHEDULE_MODULE.Schedule
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DAY = timedelta(days=1)
+GRID = [START + i * DAY for i in range(130)]
+
+
+def _slots(timestamps):
+    return [(ts - START) // DAY for ts in timestamps]
+
+
+def test_newest_and_oldest_first():
+    assert _slots(Schedule("newest_first", START, DAY).order(GRID))[:3] == [129, 128, 127]
+    assert _slots(Schedule("oldest_first", START, DAY).order(GRID))[:3] == [0, 1, 2]
+
+
+def test_progressive():
+    order = _slots(Schedule("progressive", START, DAY).order(GRID))
+    assert order[:3] == [128, 64, 0]
+    assert order[3:5] == [96, 32]
+    assert order[-1] == 1
+    assert sorted(order) == list(range(130))
+    # every slot comes after the coarser slots around it
+    assert order.index(16) < order.index(8) < order.index(4) < order.index(2) < order.index(1)
+
+
+def test_chunks():
+    chunks = list(Schedule("newest_first", START, DAY).chunks(GRID[-1], 50))
+    assert [len(chunk) for chunk in chunks] == [50, 50, 30]
+    assert _slots(chunks[0])[:2] == [129, 128]
+    # a progressive chunk never spans 2 levels, the first level is every 64th slot
+    chunks = list(Schedule("progressive", START, DAY).chunks(GRID[-1], 50))
+    assert _slots(chunks[0]) == [128, 64, 0]
+    assert _slots(chunks[1]) == [96, 32]
+    assert [ts for chunk in chunks for ts in chunk] == Schedule("progressive", START, DAY).order(GRID)
+    # only the timestamps `where` accepts, in the same order
+    odd = list(Schedule("oldest_first", START, DAY).chunks(GRID[-1], 50, where=lambda ts: (ts - START) // DAY % 2))
+    assert [len(chunk) for chunk in odd] == [50, 15]
+    assert _slots(odd[0])[:2] == [1, 3]
+    assert list(Schedule("newest_first", START, DAY).chunks(START - DAY, 50)) == []
+
+
+def test_priority_follows_current_schedule():
+    assert _SCHEDULE_MODULE.priority(START + DAY) < _SCHEDULE_MODULE.priority(START)
+    token = _SCHEDULE_MODULE.current.set(Schedule("oldest_first", START, DAY))
+    try:
+        assert _SCHEDULE_MODULE.priority(START) < _SCHEDULE_MODULE.priority(START + DAY)
+    finally:
+        _SCHEDULE_MODULE.current.reset(token)
+
+
+def test_unknown_schedule():
+    with pytest.raises(ValueError):
+        Schedule("random", START, DAY)
@@ -0,0 +1,37 @@
+import importlib.util
+from pathlib import Path
+
+_SPOOL_PATH = Path(__file__).resolve().parents[1] / "evm_contract_exporter" / "_spool.py"
+_SPOOL_MODULE = importlib.util.module_from_spec(
+    importlib.util.spec_from_file_location("evm_contract_exporter._spool", _SPOOL_PATH)
+)
+assert _SPOOL_MODULE.__spec__ and _SPOOL_MODULE.__spec__.loader
+_SPOOL_MODULE.__spec__.loader.exec_module(_SPOOL_MODULE)
+
+Spool = _SPOOL_MODULE.Spool
+
+
+def test_replay_after_crash(tmp_path):
+    spool = Spool(tmp_path)
+    offsets = [spool.append(["0xabc", "metric", i, "1.5"]) for i in range(3)]
+    spool.ack(offsets[:1])
+    # simulate a crash halfway through writing the next record
+    spool._file.write(b"\x00\x00\x00\xff\x00")
+    spool._file.flush()
+
+    restarted = Spool(tmp_path)
+    replayed = restarted.replay()
+    # NOTE: acks only truncate once the whole segment is done, so the acked record is replayed too. Consumers must be idempotent.
+    assert [record[2] for _, record in replayed] == [0, 1, 2]
+    restarted.ack(offset for offset, _ in replayed)
+    assert len(restarted) == 0
+    assert Spool(tmp_path).replay() == []
+
+
+def test_truncates_when_drained(tmp_path):
+    spool = Spool(tmp_path, segment_bytes=64)
+    offsets = [spool.append(list(range(10))) for _ in range(5)]
+    assert len(list(tmp_path.glob("*.spool"))) > 1
+    spool.ack(offsets)
+    assert len(spool) == 0
+    assert [path.stat().st_size for path in tmp_path.glob("*.spool")] == [0]